@@ -0,0 +1,176 @@
+"""
+A local stand-in for the Azure OpenAI chat-completions endpoint.
+
+It speaks just enough HTTP/1.1 (keep-alive, Content-Length bodies) for the
+openai SDK, and answers every POST .../chat/completions with one of the
+configured payloads after a configurable delay. A share of requests can be
+failed with 429/500 to exercise error handling.
+
+    python benchmarks/mock_azure_server.py --port 8765 --latency 0.5 --jitter 0.1 --error-rate 0.02
+"""
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+DEFAULT_LISTING = {
+    "car": {
+        "body_type": "sedan",
+        "color": "Blue",
+        "brand": "Ford",
+        "model": "Fusion",
+        "manufactured_year": 2015,
+        "motor_size_cc": 2000,
+        "tires": {"type": "brand-new", "manufactured_year": 2022},
+        "windows": "tinted",
+        "notices": [{"type": "collision", "description": "The rear bumper has been replaced after a minor collision."}],
+        "price": {"amount": 1000000, "currency": "L.E"},
+    }
+}
+
+
+@dataclass
+class MockConfig:
+    latency: float = 0.5            # seconds before each response
+    jitter: float = 0.0             # +/- uniform seconds added to latency
+    error_rate: float = 0.0         # share of requests answered with an error
+    error_status: int = 429         # status used for injected errors (429 includes Retry-After)
+    payloads: List[str] = field(default_factory=lambda: [json.dumps(DEFAULT_LISTING)])
+    seed: Optional[int] = None
+
+
+class MockAzureServer:
+    """Runs the mock endpoint on its own event loop in a background thread."""
+
+    def __init__(self, config: Optional[MockConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.config = config or MockConfig()
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(self.config.seed)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.base_events.Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+
+    @property
+    def endpoint(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self) -> "MockAzureServer":
+        self._thread = threading.Thread(target=self._run, name="mock-azure", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+            self._thread.join()
+
+    async def _shutdown(self) -> None:
+        self._server.close()
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop.call_soon(self._loop.stop)
+
+    def __enter__(self) -> "MockAzureServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                headers: Dict[str, str] = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                status, extra, payload = await self._respond(request_line.decode("latin-1"), body)
+                data = json.dumps(payload).encode()
+                head = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                        "Content-Type: application/json", f"Content-Length: {len(data)}"]
+                head += [f"{k}: {v}" for k, v in extra.items()]
+                writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + data)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, request_line: str, body: bytes):
+        method, path = request_line.split(" ")[:2]
+        if method != "POST" or "/chat/completions" not in path:
+            return 404, {}, {"error": {"code": "404", "message": "not found"}}
+
+        self.requests += 1
+        cfg = self.config
+        await asyncio.sleep(max(0.0, cfg.latency + self._random.uniform(-cfg.jitter, cfg.jitter)))
+        if self._random.random() < cfg.error_rate:
+            self.errors += 1
+            extra = {"Retry-After": "1"} if cfg.error_status == 429 else {}
+            return cfg.error_status, extra, {"error": {"code": str(cfg.error_status), "message": "injected error"}}
+
+        request = json.loads(body or b"{}")
+        content = self._random.choice(cfg.payloads)
+        prompt_tokens = sum(len(m.get("content", "")) for m in request.get("messages", [])) // 4
+        completion_tokens = len(content) // 4
+        return 200, {}, {
+            "id": f"chatcmpl-mock-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--payloads", help="JSONL file, one response content per line")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency, args.jitter, args.error_rate, args.error_status)
+    if args.payloads:
+        with open(args.payloads) as f:
+            config.payloads = [line.strip() for line in f if line.strip()]
+    server = MockAzureServer(config, args.host, args.port).start()
+    print(f"mock Azure OpenAI listening on {server.endpoint}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
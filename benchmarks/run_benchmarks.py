@@ -0,0 +1,168 @@
+"""
+Offline performance benchmarks for the extraction path.
+
+Starts the mock Azure endpoint, points text_extractor's client at it and
+measures extract_listing throughput and latency percentiles at several
+concurrency levels, plus micro-benchmarks of sanitize_text, JSON repair and
+Pydantic validation. Results are printed (or written) as JSON so runs can be
+compared between releases; no network access or API spend is involved.
+
+    python benchmarks/run_benchmarks.py --concurrency 1,8,32 --requests 200 --latency 0.2 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import timeit
+from typing import Any, Callable, Dict, List
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(HERE), "src"))
+sys.path.insert(0, HERE)
+
+# the client is pointed at the mock server, so the real settings are never needed
+for name, value in (("AZURE_OPENAI_API_KEY", "mock"), ("AZURE_OPENAI_ENDPOINT", "http://127.0.0.1"),
+                    ("AZURE_OPENAI_DEPLOYMENT", "mock"), ("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")):
+    os.environ.setdefault(name, value)
+
+from openai import AsyncAzureOpenAI  # noqa: E402
+
+import text_extractor  # noqa: E402
+from mock_azure_server import DEFAULT_LISTING, MockAzureServer, MockConfig  # noqa: E402
+from response_decoder import decode_model  # noqa: E402
+from schema import CarListing  # noqa: E402
+
+SAMPLE_TEXT = ("Blue Ford Fusion produced in 2015 featuring a 2.0-liter engine. The vehicle has low mileage with "
+               "only 40,000 miles on the odometer. Equipped with brand-new all-season tires manufactured in 2022. "
+               "The car's windows are tinted for added privacy. Notably, the rear bumper has been replaced after a "
+               "minor collision. Priced at 1 million L.E.")
+CLEAN_RESPONSE = json.dumps(DEFAULT_LISTING)
+MESSY_RESPONSE = "Here is the JSON:\n```json\n" + json.dumps(DEFAULT_LISTING, indent=2).replace("}\n", "},\n", 1) + "\n```"
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * p / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def micro(fn: Callable[[], Any], repeat: int = 5) -> Dict[str, float]:
+    """Best-of-`repeat` timing of `fn`, auto-ranged to ~0.2 s per repeat."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {"mean_us": round(best * 1e6, 3), "ops_per_s": round(1 / best, 1)}
+
+
+def micro_benchmarks() -> Dict[str, Dict[str, float]]:
+    long_text = " ".join([SAMPLE_TEXT] * 20)
+    parsed = json.loads(CLEAN_RESPONSE)
+    return {
+        "sanitize_text_short": micro(lambda: text_extractor.sanitize_text(SAMPLE_TEXT)),
+        "sanitize_text_long": micro(lambda: text_extractor.sanitize_text(long_text)),
+        "parse_json_clean": micro(lambda: text_extractor.parse_json_response(CLEAN_RESPONSE)),
+        "parse_json_repair": micro(lambda: text_extractor.parse_json_response(MESSY_RESPONSE)),
+        "validate_listing": micro(lambda: text_extractor._validate_listing(parsed)),
+        "decode_listing_fast": micro(lambda: decode_model(CLEAN_RESPONSE, CarListing)),
+        "decode_listing_repair": micro(lambda: decode_model(MESSY_RESPONSE, CarListing)),
+    }
+
+
+async def extraction_benchmark(concurrency: int, requests: int) -> Dict[str, Any]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors: Dict[str, int] = {}
+
+    async def one(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                # distinct text per request so nothing is served from a cache
+                await text_extractor.extract_listing(f"{SAMPLE_TEXT} Listing {i}.")
+                latencies.append(time.perf_counter() - start)
+            except Exception as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    wall = time.perf_counter() - start
+    ms = [v * 1000 for v in latencies]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": errors,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2),
+        "mean_ms": round(statistics.mean(ms), 2) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p90_ms": round(percentile(ms, 90), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(max(ms), 2) if ms else 0.0,
+    }
+
+
+def run(concurrency_levels: List[int], requests: int, config: MockConfig, skip_micro: bool = False) -> Dict[str, Any]:
+    results: Dict[str, Any] = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mock": {"latency": config.latency, "jitter": config.jitter, "error_rate": config.error_rate},
+        }
+    }
+    if not skip_micro:
+        results["micro"] = micro_benchmarks()
+
+    previous_cache, previous_client = text_extractor.cache, text_extractor.client
+    text_extractor.set_cache(None)
+    try:
+        with MockAzureServer(config) as server:
+            text_extractor.client = AsyncAzureOpenAI(api_key="mock", api_version="2024-08-01-preview",
+                                                     azure_endpoint=server.endpoint, max_retries=0)
+
+            async def all_levels():
+                return [await extraction_benchmark(c, requests) for c in concurrency_levels]
+
+            results["extraction"] = asyncio.run(all_levels())
+            results["meta"]["mock"]["requests_served"] = server.requests
+    finally:
+        text_extractor.set_cache(previous_cache)
+        text_extractor.client = previous_client
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline extraction benchmarks against a mock Azure endpoint")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="requests per concurrency level")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock response latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--skip-micro", action="store_true")
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    args = parser.parse_args(argv)
+
+    config = MockConfig(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate, seed=0)
+    levels = [int(c) for c in args.concurrency.split(",")]
+    results = run(levels, args.requests, config, args.skip_micro)
+
+    report = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+HTTP extraction service (ASGI, Starlette + uvicorn).
+
+Exposes the pipeline to other systems:
+
+    POST /extract   {"text": "...", "local_first": false}        -> CarListing JSON
+    POST /classify  raw image bytes                                -> {"label", "confidence", "latency_ms"}
+    POST /send      {"listing": {...}, "image": "<base64>", "image_name": "car.jpg"}  (X-API-Key header)
+    GET  /healthz, GET /metrics (Prometheus text)
+
+Each worker process builds one LLM client and loads the classifier once, at
+startup. Concurrent identical requests (same sanitized text, same image bytes)
+are coalesced into one upstream call, and requests beyond API_MAX_PENDING are
+turned away with 429 instead of queueing without bound. /send always mails
+RECIPIENT_EMAIL and is only served when the caller presents API_KEY. Bodies
+over API_MAX_BODY_MB are refused with 413.
+
+    python src/api_service.py --port 8000 --workers 4
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import contextlib
+import functools
+import hashlib
+import hmac
+import io
+import json
+import math
+import os
+import sys
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, TypeVar
+
+from PIL import Image, UnidentifiedImageError
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+from config import settings
+import metrics
+import text_extractor
+from text_extractor import extract_listing, sanitize_text
+from resilience import PermanentExtractionError, RetryableExtractionError
+from car_type_classifier import classify_car_type, get_classifier
+from gmail_sender import send_email_with_json_and_image
+
+T = TypeVar("T")
+
+
+class Coalescer:
+    """Runs one call per key at a time; callers arriving while it runs share its result (or error)."""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, "asyncio.Future[Any]"] = {}
+
+    def __len__(self) -> int:
+        return len(self._in_flight)
+
+    async def run(self, key: Hashable, fn: Callable[[], Awaitable[T]], endpoint: str = "") -> T:
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            metrics.inc("api_coalesced_requests_total", endpoint=endpoint)
+        # a caller that disconnects must not cancel the call the others are waiting on
+        return await asyncio.shield(future)
+
+
+class AdmissionLimiter:
+    """Counts requests being served; past `max_pending` new ones are rejected (429)."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = 0
+
+    def try_acquire(self) -> bool:
+        if self.pending >= self.max_pending:
+            return False
+        self.pending += 1
+        metrics.set_gauge("api_requests_pending", self.pending)
+        return True
+
+    def release(self) -> None:
+        self.pending -= 1
+        metrics.set_gauge("api_requests_pending", self.pending)
+
+
+class PayloadTooLarge(Exception):
+    """The request body, or the image in it, is over the size limit (413)."""
+
+
+def _error(status: int, detail: str, retry_after: Optional[float] = None) -> JSONResponse:
+    headers = {"Retry-After": str(max(1, math.ceil(retry_after or 1)))} if retry_after is not None else None
+    return JSONResponse({"detail": detail}, status_code=status, headers=headers)
+
+
+def _endpoint(name: str):
+    """Admission control, error mapping and request metrics around a handler."""
+    def decorator(handler: Callable[[Request], Awaitable[Response]]):
+        @functools.wraps(handler)
+        async def wrapper(request: Request) -> Response:
+            admission: AdmissionLimiter = request.app.state.admission
+            if not admission.try_acquire():
+                response = _error(429, "Too many requests in flight, retry later", retry_after=1)
+            else:
+                try:
+                    response = await handler(request)
+                except RetryableExtractionError as e:
+                    response = _error(503, str(e), retry_after=e.retry_after)
+                except PermanentExtractionError as e:
+                    response = _error(502, str(e))
+                except PayloadTooLarge as e:
+                    response = _error(413, str(e))
+                except ValueError as e:  # bad input: too short after sanitization, bad JSON/base64
+                    response = _error(422, str(e))
+                finally:
+                    admission.release()
+            metrics.inc("api_requests_total", endpoint=name, status=str(response.status_code))
+            return response
+        return wrapper
+    return decorator
+
+
+async def _read_body(request: Request) -> bytes:
+    """The request body; refused once it is over API_MAX_BODY_MB, declared or received."""
+    limit = int(settings.API_MAX_BODY_MB * 1024 * 1024)
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > limit:
+        raise PayloadTooLarge(f"Request body is over {settings.API_MAX_BODY_MB:g} MB")
+    chunks: List[bytes] = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise PayloadTooLarge(f"Request body is over {settings.API_MAX_BODY_MB:g} MB")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+async def _json_body(request: Request) -> Dict[str, Any]:
+    raw = await _read_body(request)
+    try:
+        body = json.loads(raw)
+    except ValueError:
+        raise ValueError("Request body must be JSON")
+    if not isinstance(body, dict):
+        raise ValueError("Request body must be a JSON object")
+    return body
+
+
+@_endpoint("extract")
+async def extract(request: Request) -> Response:
+    body = await _json_body(request)
+    text = body.get("text")
+    if not isinstance(text, str):
+        raise ValueError("`text` is required")
+    local_first = bool(body.get("local_first", False))
+    # identical once sanitized means the same upstream request
+    key = ("extract", sanitize_text(text), local_first)
+    listing = await request.app.state.coalescer.run(
+        key, lambda: extract_listing(text, local_first=local_first, output="json"), "extract")
+    return Response(listing, media_type="application/json")
+
+
+@_endpoint("classify")
+async def classify(request: Request) -> Response:
+    image = await _read_body(request)
+    if not image:
+        raise ValueError("Send the image as the request body")
+    try:
+        Image.open(io.BytesIO(image))  # reads the header only
+    except Image.DecompressionBombError as e:
+        raise PayloadTooLarge(str(e))
+    except (UnidentifiedImageError, OSError, SyntaxError):  # SyntaxError: some Pillow plugins, on bad headers
+        raise ValueError("Request body is not a supported image")
+    loop = asyncio.get_running_loop()
+    key = ("classify", hashlib.sha256(image).digest())
+    try:
+        prediction = await request.app.state.coalescer.run(
+            key, lambda: loop.run_in_executor(None, classify_car_type, image), "classify")
+    except Image.DecompressionBombError as e:
+        raise PayloadTooLarge(str(e))
+    except OSError as e:
+        raise ValueError(f"Image could not be decoded: {e}")
+    if prediction.error:  # a valid header over truncated or corrupt pixel data
+        raise ValueError(prediction.error)
+    return JSONResponse({"label": prediction.label, "confidence": prediction.confidence,
+                         "latency_ms": prediction.latency_ms})
+
+
+def _authorized(request: Request) -> bool:
+    key = request.headers.get("x-api-key", "")
+    return bool(settings.API_KEY) and hmac.compare_digest(key.encode(), settings.API_KEY.encode())
+
+
+@_endpoint("send")
+async def send(request: Request) -> Response:
+    if not _authorized(request):
+        return _error(401, "Missing or invalid X-API-Key (set API_KEY to enable /send)")
+    body = await _json_body(request)
+    listing = body.get("listing")
+    if not isinstance(listing, (dict, str)):
+        raise ValueError("`listing` is required")
+    image = None
+    if body.get("image"):
+        try:
+            image = base64.b64decode(body["image"], validate=True)
+        except (binascii.Error, TypeError):
+            raise ValueError("`image` must be base64")
+    # the recipient is fixed by configuration, never taken from the request
+    recipient = settings.RECIPIENT_EMAIL
+    if not (settings.SENDER_EMAIL and recipient):
+        return _error(503, "Email is not configured (SENDER_EMAIL/RECIPIENT_EMAIL)")
+    # smtplib blocks; the pooled MailSender behind it is shared by every request
+    result = await asyncio.get_running_loop().run_in_executor(None, functools.partial(
+        send_email_with_json_and_image, settings.SENDER_EMAIL, settings.SENDER_PASSWORD or "", recipient,
+        listing, image, body.get("image_name") or "image.jpg"))
+    status = 200 if result.success else 502
+    return JSONResponse({"success": result.success, "attempts": result.attempts, "error": result.error},
+                        status_code=status)
+
+
+async def healthz(request: Request) -> Response:
+    return JSONResponse({"status": "ok", "pending": request.app.state.admission.pending,
+                         "classifier": get_classifier() is not None})
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    return PlainTextResponse(metrics.export_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: Starlette):
+    # one client and one classifier per worker process, ready before the first request
+    text_extractor.get_client()
+    await asyncio.get_running_loop().run_in_executor(None, get_classifier)
+    yield
+
+
+def create_app(max_pending: Optional[int] = None) -> Starlette:
+    app = Starlette(routes=[
+        Route("/extract", extract, methods=["POST"]),
+        Route("/classify", classify, methods=["POST"]),
+        Route("/send", send, methods=["POST"]),
+        Route("/healthz", healthz, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+    ], lifespan=lifespan)
+    app.state.coalescer = Coalescer()
+    app.state.admission = AdmissionLimiter(max_pending or settings.API_MAX_PENDING)
+    return app
+
+
+app = create_app()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Serve car listing extraction over HTTP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes; each has its own client, classifier, coalescing and queue limit")
+    parser.add_argument("--metrics", action="store_true", help="collect metrics for GET /metrics (or METRICS_ENABLED=1)")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        os.environ["METRICS_ENABLED"] = "1"  # read again by each worker process
+        metrics.enable()
+    # an import string, so uvicorn can start the app in each worker process
+    uvicorn.run("api_service:app", host=args.host, port=args.port, workers=args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
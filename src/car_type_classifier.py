@@ -1,7 +1,224 @@
+import io
+import time
+import threading
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Sequence
 
-def classify_car_type(image_url) -> str:
+from PIL import Image, ImageOps
+from config import settings
+import metrics
 
-    # here is the functionality of the car classifier
-    # for now it's going to return a simple string
+# default label order of the body-type model's output
+DEFAULT_LABELS = ["convertible", "coupe", "hatchback", "minivan", "pickup", "sedan", "suv", "van", "wagon"]
 
-    return "To_be_determined"
\ No newline at end of file
+UNKNOWN_LABEL = "To_be_determined"
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+# ImageNet normalization, what torchvision-exported backbones expect
+_MEAN = (0.485, 0.456, 0.406)
+_STD = (0.229, 0.224, 0.225)
+
+
+@dataclass
+class CarTypePrediction:
+    """Body type predicted for one image; `error` is set (with UNKNOWN_LABEL) when it could not be decoded."""
+    label: str
+    confidence: float
+    latency_ms: float = 0.0
+    error: Optional[str] = None
+
+
+class CarTypeClassifier:
+    """
+    CPU body-type classifier backed by an ONNX model.
+
+    Args:
+        model_path (str): Path of the .onnx model (NCHW float32 input, one score per label)
+        labels (list): Label for each output index
+        intra_op_threads (int): ONNX Runtime intra-op threads, 0 lets the runtime decide
+        max_batch_size (int): Images per inference call
+        session: An already created inference session, mostly for tests
+    """
+
+    def __init__(self, model_path: Optional[str] = None, labels: Optional[Sequence[str]] = None,
+                 intra_op_threads: int = 0, max_batch_size: int = 16, session: Any = None):
+        if session is None:
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.intra_op_num_threads = intra_op_threads
+            options.inter_op_num_threads = 1
+            options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+
+        self.session = session
+        self.labels = list(labels or DEFAULT_LABELS)
+        self.max_batch_size = max_batch_size
+        model_input = session.get_inputs()[0]
+        self.input_name = model_input.name
+        height, width = model_input.shape[2:4]
+        self.input_size = (width if isinstance(width, int) else 224, height if isinstance(height, int) else 224)
+
+    def _load(self, image: Any):
+        import numpy as np
+
+        if isinstance(image, Image.Image):
+            img = image
+        elif isinstance(image, (bytes, bytearray, memoryview)):
+            img = Image.open(io.BytesIO(image))
+        else:
+            # path or file-like object (e.g. a Streamlit upload)
+            img = Image.open(image)
+        if img.size != self.input_size:
+            img.draft("RGB", self.input_size)
+            img = ImageOps.fit(img, self.input_size, Image.BILINEAR)
+        arr = np.asarray(img.convert("RGB"), dtype=np.float32) / 255.0
+        arr = (arr - np.array(_MEAN, dtype=np.float32)) / np.array(_STD, dtype=np.float32)
+        return arr.transpose(2, 0, 1)
+
+    def predict(self, images: Sequence[Any]) -> List[CarTypePrediction]:
+        """Classifies images in batches of `max_batch_size`; an image that can't be decoded
+        gets an UNKNOWN_LABEL prediction with its error, the others are still classified."""
+        import numpy as np
+
+        predictions: List[CarTypePrediction] = []
+        for start in range(0, len(images), self.max_batch_size):
+            chunk = images[start:start + self.max_batch_size]
+            began = time.perf_counter()
+            chunk_predictions: List[Optional[CarTypePrediction]] = [None] * len(chunk)
+            loaded = []
+            with metrics.span("classify_preprocess"):
+                for i, image in enumerate(chunk):
+                    try:
+                        loaded.append((i, self._load(image)))
+                    except (OSError, ValueError) as e:  # PIL.UnidentifiedImageError is an OSError
+                        chunk_predictions[i] = CarTypePrediction(UNKNOWN_LABEL, 0.0, error=f"Unreadable image: {e}")
+            if loaded:
+                with metrics.span("classify_inference"):
+                    scores = self.session.run(None, {self.input_name: np.stack([arr for _, arr in loaded])})[0]
+                metrics.observe("classifier_batch_size", len(loaded), buckets=BATCH_BUCKETS)
+                if not (np.all(scores >= 0) and np.allclose(scores.sum(axis=1), 1.0, atol=1e-3)):
+                    # logits: turn them into probabilities
+                    scores = np.exp(scores - scores.max(axis=1, keepdims=True))
+                    scores /= scores.sum(axis=1, keepdims=True)
+                per_image_ms = (time.perf_counter() - began) * 1000 / len(loaded)
+                for (i, _), row in zip(loaded, scores):
+                    best = int(row.argmax())
+                    chunk_predictions[i] = CarTypePrediction(self.labels[best], float(row[best]), per_image_ms)
+            predictions.extend(chunk_predictions)
+        return predictions
+
+
+_classifier: Optional[CarTypeClassifier] = None
+_classifier_lock = threading.Lock()
+_classifier_error: Optional[str] = None
+
+
+def get_classifier() -> Optional[CarTypeClassifier]:
+    """Loads the classifier once per process; None when no model is configured or it can't be loaded."""
+    global _classifier, _classifier_error
+    if _classifier is not None or _classifier_error is not None:
+        return _classifier
+    with _classifier_lock:
+        if _classifier is None and _classifier_error is None:
+            if not settings.CAR_CLASSIFIER_MODEL:
+                _classifier_error = "CAR_CLASSIFIER_MODEL is not set"
+            else:
+                try:
+                    _classifier = CarTypeClassifier(
+                        settings.CAR_CLASSIFIER_MODEL,
+                        labels=settings.CAR_CLASSIFIER_LABELS,
+                        intra_op_threads=settings.CAR_CLASSIFIER_THREADS,
+                        max_batch_size=settings.CAR_CLASSIFIER_BATCH_SIZE,
+                    )
+                except Exception as e:
+                    _classifier_error = str(e)
+                    print("❌ Failed to load car type classifier:", _classifier_error)
+    return _classifier
+
+
+# perceptual-hash index of classified images (image_hash.ImageHashIndex), built on first use
+# unless IMAGE_DEDUP_MAX_DISTANCE is negative; image_hash pulls in numpy, like the classifier
+_image_index = None
+_image_index_lock = threading.Lock()
+
+
+def get_image_index():
+    """The index near-duplicate images reuse predictions from; None when dedup is disabled."""
+    global _image_index
+    if _image_index is None and settings.IMAGE_DEDUP_MAX_DISTANCE >= 0:
+        with _image_index_lock:
+            if _image_index is None:
+                from image_hash import ImageHashIndex
+                _image_index = ImageHashIndex(settings.IMAGE_DEDUP_MAX_DISTANCE)
+    return _image_index
+
+
+def set_image_index(index) -> None:
+    """Replace the image index (an image_hash.ImageHashIndex); None rebuilds it from settings on next use."""
+    global _image_index
+    _image_index = index
+
+
+def _image_hash(image: Any) -> Optional[int]:
+    """pHash of an image, or None if it can't be decoded (the classifier will report the error)."""
+    from image_hash import phash
+    position = image.tell() if hasattr(image, "read") else None
+    try:
+        return phash(image)
+    except Exception:
+        return None
+    finally:
+        if position is not None:
+            image.seek(position)
+
+
+def classify_car_types_batch(images: Sequence[Any]) -> List[CarTypePrediction]:
+    """Classifies several images (paths, bytes, file-like objects or PIL images) in one go.
+
+    Images whose perceptual hash is within IMAGE_DEDUP_MAX_DISTANCE of an already
+    classified one reuse its prediction instead of running the model again."""
+    classifier = get_classifier()
+    if classifier is None:
+        return [CarTypePrediction(UNKNOWN_LABEL, 0.0) for _ in images]
+    images = list(images)
+    index = get_image_index()
+    if index is None:
+        return classifier.predict(images)
+
+    with metrics.span("image_hash"):
+        hashes = [_image_hash(image) for image in images]
+    predictions: List[Optional[CarTypePrediction]] = [None] * len(images)
+    misses: List[int] = []
+    for i, hash_ in enumerate(hashes):
+        match = index.query(hash_) if hash_ is not None else None
+        metrics.inc("image_dedup_requests_total", result="miss" if match is None else "hit")
+        if match is None:
+            misses.append(i)
+        else:
+            predictions[i] = replace(match.value, latency_ms=0.0)
+    if misses:
+        for i, prediction in zip(misses, classifier.predict([images[i] for i in misses])):
+            predictions[i] = prediction
+            if hashes[i] is not None and prediction.error is None:
+                index.add(hashes[i], prediction)
+    return predictions
+
+
+def classify_car_type(image_url) -> CarTypePrediction:
+    """Classifies the body type of a single car image."""
+    return classify_car_types_batch([image_url])[0]
+
+
+def merge_body_type(listing: Dict[str, Any], prediction: CarTypePrediction,
+                    min_confidence: Optional[float] = None) -> Dict[str, Any]:
+    """Puts the predicted body type into the listing unless it is less confident than `min_confidence`,
+    in which case the body type inferred by the LLM is kept."""
+    if min_confidence is None:
+        min_confidence = settings.CAR_CLASSIFIER_MIN_CONFIDENCE
+    car = listing.get("car")
+    if isinstance(car, dict) and prediction.confidence >= min_confidence:
+        car["body_type"] = prediction.label
+    return listing
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -8,6 +9,74 @@ class Settings:
     AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
     AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT")
     AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION")
+    # resilience of the Azure OpenAI call (see resilience.py)
+    LLM_ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("LLM_ATTEMPT_TIMEOUT_SECONDS", "20"))
+    LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "45"))
+    LLM_MAX_ATTEMPTS = int(os.getenv("LLM_MAX_ATTEMPTS", "4"))
+    LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+    LLM_CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("LLM_CIRCUIT_FAILURE_THRESHOLD", "5"))
+    LLM_CIRCUIT_RECOVERY_SECONDS = float(os.getenv("LLM_CIRCUIT_RECOVERY_SECONDS", "30"))
+    # connection pool of the Azure OpenAI client (sized by LLM_MAX_CONCURRENCY)
+    LLM_HTTP2 = os.getenv("LLM_HTTP2", "1").lower() in ("1", "true", "yes")
+    LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "30"))
+    LLM_FALLBACK_LOCAL = os.getenv("LLM_FALLBACK_LOCAL", "").lower() in ("1", "true", "yes")
+    LLM_PACK_TOKEN_BUDGET = int(os.getenv("LLM_PACK_TOKEN_BUDGET", "1500"))
+    LLM_PACK_MAX_ITEMS = int(os.getenv("LLM_PACK_MAX_ITEMS", "8"))
+    LLM_COMPACT_OUTPUT = os.getenv("LLM_COMPACT_OUTPUT", "").lower() in ("1", "true", "yes")
+    # reuse the listing of a near-duplicate description above this MinHash similarity (0 disables)
+    NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0"))
+    NEAR_DUPLICATE_SQLITE_PATH = os.getenv("NEAR_DUPLICATE_SQLITE_PATH") or None
+    # USD per 1K tokens, defaults are GPT-4o-mini list prices
+    LLM_INPUT_COST_PER_1K_TOKENS = float(os.getenv("LLM_INPUT_COST_PER_1K_TOKENS", "0.00015"))
+    LLM_OUTPUT_COST_PER_1K_TOKENS = float(os.getenv("LLM_OUTPUT_COST_PER_1K_TOKENS", "0.0006"))
+    SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+    SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+    SENDER_EMAIL = os.getenv("SENDER_EMAIL")
+    SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
+    RECIPIENT_EMAIL = os.getenv("RECIPIENT_EMAIL")
+    # leave out an image identical to one already emailed to the same recipient
+    EMAIL_SKIP_DUPLICATE_IMAGES = os.getenv("EMAIL_SKIP_DUPLICATE_IMAGES", "").lower() in ("1", "true", "yes")
+    CAR_CLASSIFIER_MODEL = os.getenv("CAR_CLASSIFIER_MODEL")
+    CAR_CLASSIFIER_LABELS = [l.strip() for l in os.getenv("CAR_CLASSIFIER_LABELS", "").split(",") if l.strip()] or None
+    CAR_CLASSIFIER_THREADS = int(os.getenv("CAR_CLASSIFIER_THREADS", "2"))
+    CAR_CLASSIFIER_BATCH_SIZE = int(os.getenv("CAR_CLASSIFIER_BATCH_SIZE", "16"))
+    CAR_CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CAR_CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+    # derivatives written by image_preprocessing.py; the least recently used are deleted past the size cap (0: no cap)
+    IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "car_image_cache")
+    IMAGE_CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", "1024"))
+    # reuse the prediction of an image within this perceptual-hash distance (bits of 64; negative disables)
+    IMAGE_DEDUP_MAX_DISTANCE = int(os.getenv("IMAGE_DEDUP_MAX_DISTANCE", "6"))
+    # SQLite result store (ingest_cli.py --store *.db) the UI searches for the same brand/model while extracting
+    RESULT_STORE_PATH = os.getenv("RESULT_STORE_PATH") or None
+    # durable job queue (job_queue.py); with JOB_QUEUE_PATH set the UI queues emails there instead of sending them
+    JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH") or None
+    JOB_VISIBILITY_TIMEOUT_SECONDS = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "120"))
+    JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+    # requests api_service.py serves at once per worker process; more are rejected with 429
+    API_MAX_PENDING = int(os.getenv("API_MAX_PENDING", "256"))
+    # largest request body (an image for /classify) api_service.py reads, larger ones get 413
+    API_MAX_BODY_MB = float(os.getenv("API_MAX_BODY_MB", "20"))
+    # key callers of POST /send must present in X-API-Key; /send is refused while it is unset
+    API_KEY = os.getenv("API_KEY") or None
+    # processes preprocessing/classifying images (worker_runtime.py), 0 means one per CPU
+    WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+
+    _validated = False
+
+    def validate(self) -> None:
+        """Check the settings the LLM client depends on; runs once, on first use of the client."""
+        if self._validated:
+            return
+        missing = [name for name in ("AZURE_OPENAI_API_KEY", "AZURE_OPENAI_ENDPOINT",
+                                     "AZURE_OPENAI_DEPLOYMENT", "AZURE_OPENAI_API_VERSION")
+                   if not getattr(self, name)]
+        if missing:
+            raise ValueError(f"Missing settings: {', '.join(missing)} (see .env.example)")
+        for name in ("LLM_ATTEMPT_TIMEOUT_SECONDS", "LLM_DEADLINE_SECONDS", "LLM_MAX_ATTEMPTS",
+                     "LLM_MAX_CONCURRENCY", "LLM_KEEPALIVE_SECONDS"):
+            if getattr(self, name) <= 0:
+                raise ValueError(f"{name} must be positive")
+        self._validated = True
 
 # Create an instance of the settings
 settings = Settings()
@@ -0,0 +1,149 @@
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+
+
+def make_cache_key(sanitized_text: str, system_prompt: str, schema: Union[Dict[str, Any], str],
+                   deployment: Optional[str], temperature: float) -> str:
+    """Content-addressed key: anything that changes the model's answer changes the key.
+
+    `schema` may be passed already serialized as canonical JSON."""
+    h = hashlib.sha256()
+    for part in (
+        sanitized_text,
+        system_prompt,
+        schema if isinstance(schema, str) else json.dumps(schema, sort_keys=True, separators=(",", ":")),
+        deployment or "",
+        repr(temperature),
+    ):
+        data = part.encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    return h.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Two-tier cache for extraction results.
+
+    Entries are stored as JSON strings so every hit hands back a fresh dict that
+    callers are free to mutate.
+
+    Args:
+        max_entries (int): Maximum number of entries in the in-memory LRU tier
+        max_bytes (int): Maximum total size of the in-memory tier, in bytes of JSON
+        ttl_seconds (float): Time-to-live for entries in both tiers, None to never expire
+        sqlite_path (str): Optional path of an on-disk SQLite tier that survives restarts
+    """
+
+    def __init__(self, max_entries: int = 10_000, max_bytes: int = 64 * 1024 * 1024,
+                 ttl_seconds: Optional[float] = 24 * 3600, sqlite_path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extraction_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def _expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def _store_memory(self, key: str, created_at: float, value: str) -> None:
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= len(old[1])
+        self._entries[key] = (created_at, value)
+        self._size += len(value)
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached result for `key`, or None on a miss."""
+        data = self.get_json(key)
+        return None if data is None else json.loads(data)
+
+    def get_json(self, key: str) -> Optional[str]:
+        """Return the cached result for `key` as the JSON it is stored as, or None on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self._size -= len(entry[1])
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, created_at FROM extraction_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and not self._expired(row[1]):
+                    self._store_memory(key, row[1], row[0])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        """Store an extraction result in every tier."""
+        self.set_json(key, json.dumps(value, separators=(",", ":")))
+
+    def set_json(self, key: str, data: str) -> None:
+        """Store an already-serialized extraction result in every tier."""
+        created_at = time.time()
+        with self._lock:
+            self._store_memory(key, created_at, data)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extraction_cache (key, value, created_at) VALUES (?, ?, ?)",
+                    (key, data, created_at),
+                )
+                self._db.commit()
+
+    def clear(self) -> None:
+        """Drop every entry from both tiers (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM extraction_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current in-memory occupancy."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
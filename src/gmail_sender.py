@@ -1,20 +1,428 @@
 import smtplib
 import json
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.application import MIMEApplication
-from email.mime.base import MIMEBase
-from email import encoders
+import time
+import uuid
+import queue
+import base64
+import mimetypes
+import threading
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, Tuple, Union
+from email.message import Message
+from email.utils import formatdate, make_msgid, encode_rfc2231
 import os
+from config import settings
+import metrics
+
+if TYPE_CHECKING:
+    from image_hash import ImageHashIndex
+
+
+DEFAULT_BODY = "Please find attached the extracted car listing JSON and the uploaded car image."
+
+# magic numbers of the image formats users upload, checked before trusting the file extension
+_IMAGE_SIGNATURES = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+
+
+def detect_image_subtype(head: bytes, filename: str = "") -> str:
+    """Returns the image MIME subtype from the first bytes of the file, falling back to the filename."""
+    for signature, subtype in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return subtype
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "heic"
+    guessed, _ = mimetypes.guess_type(filename)
+    if guessed and guessed.startswith("image/"):
+        return guessed.split("/", 1)[1]
+    return "jpeg"
+
+
+def _json_bytes(extracted_json: Union[dict, str, bytes]) -> bytes:
+    """The attachment content: pre-serialized JSON is used as is, a dict is serialized here."""
+    if isinstance(extracted_json, bytes):
+        return extracted_json
+    if isinstance(extracted_json, str):
+        return extracted_json.encode("utf-8")
+    return json.dumps(extracted_json, indent=4).encode("utf-8")
+
+
+# bytes of attachment encoded per chunk; a multiple of 57 so every chunk is whole 76-char base64 lines
+_B64_CHUNK = 57 * 1024
+
+
+def _iter_base64(data: Union[str, bytes, memoryview]) -> Iterator[bytes]:
+    """Base64-encodes a file path or buffer chunk by chunk, as CRLF-terminated 76-char lines."""
+    def encode(block) -> bytes:
+        encoded = base64.b64encode(block)
+        return b"".join(encoded[i:i + 76] + b"\r\n" for i in range(0, len(encoded), 76))
+
+    if isinstance(data, str):
+        with open(data, "rb") as f:
+            while True:
+                block = f.read(_B64_CHUNK)
+                if not block:
+                    return
+                yield encode(block)
+    else:
+        view = memoryview(data)
+        for start in range(0, len(view), _B64_CHUNK):
+            yield encode(view[start:start + _B64_CHUNK])
+
+
+def _filename_param(filename: str) -> str:
+    if filename.isascii() and '"' not in filename and "\\" not in filename:
+        return f'filename="{filename}"'
+    return f"filename*={encode_rfc2231(filename, 'utf-8')}"
+
+
+class StreamingMessage:
+    """
+    The email with the JSON and image attachments, produced as a stream of bytes.
+
+    The image is read and base64-encoded in fixed-size chunks straight from disk
+    (or from a bytes/memoryview buffer), so memory use does not grow with the
+    image size. Iterating the object again regenerates the stream, which is what
+    allows a failed send to be retried. No generated line starts with ".", so the
+    stream can be written to the SMTP DATA command without dot-stuffing.
+
+    Args:
+        sender_email (str): Your Gmail address
+        recipient_email (str): Recipient's Gmail address
+        extracted_json (dict | str | bytes): Extracted car listing, or its already-serialized JSON
+        image (str | bytes | memoryview): Path to the car image, or its content
+        image_name (str): Attachment filename when `image` is a buffer
+        body (str): Plain-text body, DEFAULT_BODY if None
+        message_id (str): Message-ID header; a stable one lets receiving servers drop re-sent copies
+    """
+
+    def __init__(self, sender_email: str, recipient_email: str, extracted_json: Union[dict, str, bytes],
+                 image: Union[str, bytes, memoryview, None] = None, image_name: str = "image",
+                 body: Optional[str] = None, message_id: Optional[str] = None):
+        self.sender_email = sender_email
+        self.recipient_email = recipient_email
+        self.extracted_json = extracted_json
+        self.json_bytes = _json_bytes(extracted_json)
+        if isinstance(image, str) and not os.path.exists(image):
+            image = None
+        self.image = image
+        if isinstance(image, str):
+            self.image_name = os.path.basename(image)
+            with open(image, "rb") as f:
+                self.image_subtype = detect_image_subtype(f.read(16), image)
+        else:
+            self.image_name = image_name
+            self.image_subtype = detect_image_subtype(bytes(memoryview(image)[:16]), image_name) if image is not None else None
+        self.body = body or DEFAULT_BODY
+        self.message_id = message_id or make_msgid()
+
+    def __iter__(self) -> Iterator[bytes]:
+        boundary = f"==============={uuid.uuid4().hex}=="
+        crlf = "\r\n"
+
+        def part(headers) -> bytes:
+            return (f"--{boundary}{crlf}" + "".join(h + crlf for h in headers) + crlf).encode("utf-8")
+
+        yield "".join(h + crlf for h in (
+            'Content-Type: multipart/mixed; boundary="%s"' % boundary,
+            "MIME-Version: 1.0",
+            f"From: {self.sender_email}",
+            f"To: {self.recipient_email}",
+            "Subject: Car Listing Data + Image",
+            f"Date: {formatdate(localtime=True)}",
+            f"Message-ID: {self.message_id}",
+            "",
+        )).encode("utf-8")
+
+        # base64 like the attachments: any text survives, and no line can start with "."
+        yield part(['Content-Type: text/plain; charset="utf-8"', "Content-Transfer-Encoding: base64"])
+        yield from _iter_base64(self.body.encode("utf-8"))
+
+        yield part([
+            'Content-Type: application/octet-stream; Name="car_listing.json"',
+            "Content-Transfer-Encoding: base64",
+            'Content-Disposition: attachment; filename="car_listing.json"',
+        ])
+        yield from _iter_base64(self.json_bytes)
+
+        if self.image is not None:
+            yield part([
+                f"Content-Type: image/{self.image_subtype}",
+                "Content-Transfer-Encoding: base64",
+                f"Content-Disposition: attachment; {_filename_param(self.image_name)}",
+                "X-Attachment-Id: 0",
+                "Content-ID: <0>",
+            ])
+            yield from _iter_base64(self.image)
+
+        yield f"--{boundary}--{crlf}".encode("ascii")
+
+
+def _send_streaming(server: smtplib.SMTP, msg: StreamingMessage) -> None:
+    """Runs the SMTP transaction by hand, writing the message to the socket chunk by chunk."""
+    server.ehlo_or_helo_if_needed()
+    code, resp = server.mail(msg.sender_email)
+    if code != 250:
+        server.rset()
+        raise smtplib.SMTPSenderRefused(code, resp, msg.sender_email)
+    code, resp = server.rcpt(msg.recipient_email)
+    if code not in (250, 251):
+        server.rset()
+        raise smtplib.SMTPRecipientsRefused({msg.recipient_email: (code, resp)})
+    server.putcmd("data")
+    code, resp = server.getreply()
+    if code != 354:
+        server.rset()
+        raise smtplib.SMTPDataError(code, resp)
+    for chunk in msg:
+        server.send(chunk)
+    server.send(b".\r\n")
+    code, resp = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+
+@dataclass
+class SendResult:
+    """Outcome of sending one message."""
+    success: bool
+    attempts: int
+    error: Optional[str] = None
+
+
+# errors that will not go away by retrying the same message
+_PERMANENT_ERRORS = (smtplib.SMTPAuthenticationError,)
+
+
+def _is_permanent(error: Exception) -> bool:
+    if isinstance(error, _PERMANENT_ERRORS):
+        return True
+    # 5xx replies are permanent failures, 4xx (greylisting, rate limits) are transient
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    return isinstance(error, smtplib.SMTPResponseException) and 500 <= error.smtp_code < 600
+
+
+class MailSender:
+    """
+    Sends many messages over a small pool of persistent, authenticated SMTP connections.
+
+    Connections are opened lazily, checked with NOOP when they have been idle,
+    and replaced when the server drops them. Messages can be sent synchronously
+    with `send` or queued with `submit` for the background workers.
+
+    Args:
+        sender_email (str): Your Gmail address
+        sender_password (str): Your Gmail app password
+        host (str): SMTP server host, defaults to settings.SMTP_HOST
+        port (int): SMTP server port, defaults to settings.SMTP_PORT
+        pool_size (int): Maximum number of open connections (and background workers)
+        max_retries (int): Retries per message after the first attempt, for transient errors
+        backoff (float): Base delay in seconds, doubled after every failed attempt
+        use_tls (bool): Whether to upgrade the connection with STARTTLS
+        noop_interval (float): Idle time in seconds after which a connection is checked with NOOP
+        timeout (float): Socket timeout in seconds
+        smtp_factory: Callable creating the SMTP client, smtplib.SMTP by default
+    """
+
+    def __init__(self, sender_email: str, sender_password: str, host: Optional[str] = None,
+                 port: Optional[int] = None, pool_size: int = 2, max_retries: int = 3,
+                 backoff: float = 1.0, use_tls: bool = True, noop_interval: float = 30.0,
+                 timeout: float = 30.0, smtp_factory: Callable[..., smtplib.SMTP] = smtplib.SMTP):
+        self.sender_email = sender_email
+        self.sender_password = sender_password
+        self.host = host or settings.SMTP_HOST
+        self.port = port or settings.SMTP_PORT
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.use_tls = use_tls
+        self.noop_interval = noop_interval
+        self.timeout = timeout
+        self.smtp_factory = smtp_factory
+
+        self._idle: "queue.LifoQueue[Tuple[smtplib.SMTP, float]]" = queue.LifoQueue()
+        self._slots = threading.Semaphore(pool_size)
+        self._jobs: "queue.Queue[Optional[Tuple[Union[Message, StreamingMessage], Future]]]" = queue.Queue()
+        self._workers = []
+        self._closed = False
+        self._lock = threading.Lock()
+
+    # ---- connections
+
+    def _connect(self) -> smtplib.SMTP:
+        server = self.smtp_factory(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.use_tls:
+                server.starttls()
+            if self.sender_password:
+                server.login(self.sender_email, self.sender_password)  # Use App Password here
+        except Exception:
+            self._quit(server)
+            raise
+        return server
+
+    @staticmethod
+    def _quit(server: smtplib.SMTP) -> None:
+        try:
+            server.quit()
+        except Exception:
+            try:
+                server.close()
+            except Exception:
+                pass
+
+    def _acquire(self) -> smtplib.SMTP:
+        """Take an idle connection (NOOP-checked if it sat too long) or open a new one."""
+        self._slots.acquire()
+        try:
+            while True:
+                try:
+                    server, last_used = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if time.monotonic() - last_used < self.noop_interval:
+                    return server
+                try:
+                    if server.noop()[0] == 250:
+                        return server
+                except Exception:
+                    pass
+                self._quit(server)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, server: Optional[smtplib.SMTP]) -> None:
+        if server is not None:
+            if self._closed:
+                self._quit(server)
+            else:
+                self._idle.put((server, time.monotonic()))
+        self._slots.release()
+
+    # ---- sending
+
+    def send(self, msg: Union[Message, StreamingMessage]) -> SendResult:
+        """Send one message, retrying transient failures with exponential backoff."""
+        attempts = 0
+        while True:
+            attempts += 1
+            server = None
+            try:
+                server = self._acquire()
+                with metrics.span("email_send"):
+                    if isinstance(msg, StreamingMessage):
+                        _send_streaming(server, msg)
+                    else:
+                        server.send_message(msg)
+                self._release(server)
+                metrics.inc("email_sent_total", result="success")
+                return SendResult(success=True, attempts=attempts)
+            except Exception as e:
+                if server is not None:
+                    # the connection may be in an unknown state, don't reuse it
+                    self._quit(server)
+                    self._release(None)
+                if _is_permanent(e) or attempts > self.max_retries:
+                    metrics.inc("email_sent_total", result="failure")
+                    return SendResult(success=False, attempts=attempts, error=str(e))
+                metrics.inc("email_retries_total")
+                time.sleep(self.backoff * 2 ** (attempts - 1))
+
+    def submit(self, msg: Union[Message, StreamingMessage]) -> "Future[SendResult]":
+        """Queue a message for the background workers; the future resolves to its SendResult."""
+        future: "Future[SendResult]" = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MailSender is closed")
+            if not self._workers:
+                for i in range(self.pool_size):
+                    worker = threading.Thread(target=self._work, name=f"mail-sender-{i}", daemon=True)
+                    worker.start()
+                    self._workers.append(worker)
+            self._jobs.put((msg, future))
+        return future
+
+    def _work(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            msg, future = job
+            if future.set_running_or_notify_cancel():
+                future.set_result(self.send(msg))
+
+    def close(self) -> None:
+        """Finish queued messages, stop the workers and close every connection."""
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._jobs.put(None)
+        for worker in workers:
+            worker.join()
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._quit(server)
+
+    def __enter__(self) -> "MailSender":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# one pooled sender per account, so repeated calls reuse the authenticated connection
+_senders: Dict[Tuple[str, str], MailSender] = {}
+_senders_lock = threading.Lock()
+
+
+def get_sender(sender_email: str, sender_password: str) -> MailSender:
+    """Returns the shared MailSender for this account."""
+    with _senders_lock:
+        key = (sender_email, sender_password)
+        if key not in _senders:
+            _senders[key] = MailSender(sender_email, sender_password)
+        return _senders[key]
+
+
+# perceptual hashes of the images already delivered, per recipient, mapped to the message that carried them
+_sent_images: Dict[str, "ImageHashIndex"] = {}
+_sent_images_lock = threading.Lock()
+
+
+def _sent_image_index(recipient_email: str) -> "ImageHashIndex":
+    from image_hash import ImageHashIndex
+    with _sent_images_lock:
+        if recipient_email not in _sent_images:
+            # distance 0: only skip images that hash the same, i.e. look identical
+            _sent_images[recipient_email] = ImageHashIndex(max_distance=0)
+        return _sent_images[recipient_email]
 
 
 def send_email_with_json_and_image(
     sender_email: str,
     sender_password: str,
     recipient_email: str,
-    extracted_json: dict,
-    image_path: str
-):
+    extracted_json: Union[dict, str, bytes],
+    image_path: Union[str, bytes],
+    image_name: str = "image.jpg",
+    skip_duplicate_image: Optional[bool] = None,
+) -> SendResult:
     """
     Sends an email with a JSON attachment and an image attachment.
 
@@ -22,48 +430,43 @@ def send_email_with_json_and_image(
         sender_email (str): Your Gmail address
         sender_password (str): Your Gmail app password
         recipient_email (str): Recipient's Gmail address
-        extracted_json (dict): Extracted car listing JSON
-        image_path (str): Path to the car image
+        extracted_json (dict | str | bytes): Extracted car listing, or its already-serialized JSON
+        image_path (str | bytes): Path to the car image, or its content
+        image_name (str): Attachment filename when `image_path` is content
+        skip_duplicate_image (bool): Leave the image out when an identical one was already sent to
+            this recipient, referring to that message instead; settings.EMAIL_SKIP_DUPLICATE_IMAGES if None
+
+    Returns:
+        SendResult: whether the message was delivered, and the error if not
     """
+    if skip_duplicate_image is None:
+        skip_duplicate_image = settings.EMAIL_SKIP_DUPLICATE_IMAGES
+    image_hash = None
+    if skip_duplicate_image and image_path is not None:
+        from image_hash import phash
+        try:
+            image_hash = phash(image_path)
+        except Exception:
+            pass  # not decodable: attach it as is
+    sent = _sent_image_index(recipient_email) if image_hash is not None else None
+    match = sent.query(image_hash) if sent is not None else None
 
-    # Create message container
-    msg = MIMEMultipart()
-    msg["From"] = sender_email
-    msg["To"] = recipient_email
-    msg["Subject"] = "Car Listing Data + Image"
-
-    # Add body text
-    body = "Please find attached the extracted car listing JSON and the uploaded car image."
-    msg.attach(MIMEText(body, "plain"))
-
-    # Attach JSON file
-    json_str = json.dumps(extracted_json, indent=4)
-    json_attachment = MIMEApplication(json_str, Name="car_listing.json")
-    json_attachment["Content-Disposition"] = 'attachment; filename="car_listing.json"'
-    msg.attach(json_attachment)
-
-    # Attach Image (if provided)
-    if image_path and os.path.exists(image_path):
-        with open(image_path, "rb") as f:
-            mime = MIMEBase("image", "jpeg", filename=os.path.basename(image_path))
-            mime.add_header("Content-Disposition", "attachment", filename=os.path.basename(image_path))
-            mime.add_header("X-Attachment-Id", "0")
-            mime.add_header("Content-ID", "<0>")
-            mime.set_payload(f.read())
-            encoders.encode_base64(mime)
-            msg.attach(mime)
-
-    # Send Email
-    try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(sender_email, sender_password)  # Use App Password here
-            server.send_message(msg)
+    if match is not None:
+        metrics.inc("email_duplicate_images_total")
+        body = ("Please find attached the extracted car listing JSON. The car image is the same as "
+                f"in the earlier message {match.value}, so it is not attached again.")
+        msg = StreamingMessage(sender_email, recipient_email, extracted_json, None, body=body)
+    else:
+        msg = StreamingMessage(sender_email, recipient_email, extracted_json, image_path, image_name)
+    result = get_sender(sender_email, sender_password).send(msg)
+    if result.success and sent is not None and match is None and msg.image is not None:
+        sent.add(image_hash, msg.message_id)
 
+    if result.success:
         print("✅ Email sent successfully!")
-
-    except Exception as e:
-        print("❌ Failed to send email:", str(e))
+    else:
+        print("❌ Failed to send email:", result.error)
+    return result
 
 # tested the module and it worked successfully
 # sender_email = 
@@ -75,4 +478,4 @@ def send_email_with_json_and_image(
 #                                sender_password, 
 #                                recipient_email, 
 #                                extracted_json,
-#                                image_path)
\ No newline at end of file
+#                                image_path)
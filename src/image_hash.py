@@ -0,0 +1,155 @@
+"""
+Perceptual hashes of car photos and a Hamming-distance index over them.
+
+Dealers reuse the same photo across listings, often resized or recompressed.
+A perceptual hash (64 bits computed from a tiny grayscale version of the image)
+stays the same or flips only a few bits for such copies, so near-duplicates are
+found by Hamming distance. The index is a BK-tree: a lookup only descends into
+the subtrees the triangle inequality allows, instead of comparing every hash.
+
+    index = ImageHashIndex(max_distance=6)
+    index.add(phash(path), prediction)
+    match = index.query(phash(other_path))   # ImageMatch(hash, distance, value) or None
+"""
+import io
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+HASH_SIZE = 8               # 8x8 bits = 64-bit hashes
+PHASH_SIZE = 32             # pHash takes the DCT of a 32x32 image and keeps its 8x8 low frequencies
+DEFAULT_MAX_DISTANCE = 6    # recompressed/resized copies differ by a few bits, different photos by ~32
+
+ImageSource = Union[str, bytes, bytearray, memoryview, Image.Image]
+
+
+def _gray(image: ImageSource, size: Tuple[int, int]) -> np.ndarray:
+    """Decode `image` at reduced resolution (JPEG draft mode) and resize it to a grayscale `size` array."""
+    if isinstance(image, Image.Image):
+        img = image
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        img = Image.open(io.BytesIO(image))
+    else:
+        img = Image.open(image)
+    # the decoder can skip most of the pixels: the hash only needs a few dozen of them
+    img.draft("L", (size[0] * 4, size[1] * 4))
+    img = ImageOps.exif_transpose(img).convert("L").resize(size, Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(image: ImageSource, hash_size: int = HASH_SIZE) -> int:
+    """Difference hash: one bit per pixel, set when it is brighter than its right neighbour."""
+    pixels = _gray(image, (hash_size + 1, hash_size))
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+@lru_cache(maxsize=None)
+def _dct_matrix(n: int) -> np.ndarray:
+    """Orthonormal DCT-II matrix, so the 2-D transform of X is D @ X @ D.T."""
+    k = np.arange(n)[:, None]
+    matrix = np.cos(np.pi * (2 * np.arange(n)[None, :] + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+
+def phash(image: ImageSource, hash_size: int = HASH_SIZE) -> int:
+    """DCT hash: one bit per low-frequency coefficient, set when it is above their median."""
+    size = PHASH_SIZE if hash_size == HASH_SIZE else hash_size * 4
+    dct = _dct_matrix(size)
+    low = (dct @ _gray(image, (size, size)) @ dct.T)[:hash_size, :hash_size]
+    # the DC term is the mean brightness, which would skew the median
+    return _bits_to_int(low > np.median(low.ravel()[1:]))
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+@dataclass
+class ImageMatch:
+    """The indexed hash closest to a query."""
+    hash: int
+    distance: int
+    value: Any
+
+
+class BKTree:
+    """Burkhard-Keller tree of integer hashes under the Hamming distance; one value per distinct hash."""
+
+    def __init__(self):
+        # node = [hash, value, {distance to parent: child node}]
+        self._root: Optional[list] = None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, hash_: int, value: Any) -> bool:
+        """Insert `hash_`; returns False (and keeps the first value) when it is already present."""
+        if self._root is None:
+            self._root = [hash_, value, {}]
+            self._size = 1
+            return True
+        node = self._root
+        while True:
+            distance = hamming(hash_, node[0])
+            if distance == 0:
+                return False
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [hash_, value, {}]
+                self._size += 1
+                return True
+            node = child
+
+    def search(self, hash_: int, max_distance: int) -> List[ImageMatch]:
+        """Every entry within `max_distance` of `hash_`, closest first."""
+        matches: List[ImageMatch] = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(hash_, node[0])
+            if distance <= max_distance:
+                matches.append(ImageMatch(node[0], distance, node[1]))
+            # children at edge distance d can only be within range if |d - distance| <= max_distance
+            for edge, child in node[2].items():
+                if distance - max_distance <= edge <= distance + max_distance:
+                    stack.append(child)
+        matches.sort(key=lambda match: match.distance)
+        return matches
+
+
+class ImageHashIndex:
+    """
+    Thread-safe index from perceptual hashes to values (e.g. classifier predictions).
+
+    Args:
+        max_distance (int): Largest Hamming distance query() still reports as a match
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self._tree = BKTree()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tree)
+
+    def add(self, hash_: int, value: Any) -> bool:
+        with self._lock:
+            return self._tree.add(hash_, value)
+
+    def query(self, hash_: int, max_distance: Optional[int] = None) -> Optional[ImageMatch]:
+        """The closest indexed entry within the distance, or None."""
+        max_distance = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            matches = self._tree.search(hash_, max_distance)
+        return matches[0] if matches else None
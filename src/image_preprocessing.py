@@ -0,0 +1,202 @@
+import io
+import os
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+from PIL import Image, ImageOps
+from config import settings
+
+# email derivative: longest side in pixels, JPEG quality, and the size under which the original is kept as is
+EMAIL_MAX_SIDE = 1600
+EMAIL_QUALITY = 85
+EMAIL_MAX_BYTES = 1024 * 1024
+
+# classifier input size (width, height)
+MODEL_INPUT_SIZE = (224, 224)
+
+CACHE_DIR = settings.IMAGE_CACHE_DIR
+
+# the cache is pruned, down to _PRUNE_TO of IMAGE_CACHE_MAX_MB, each time _PRUNE_EVERY of it was written
+_PRUNE_EVERY = 0.1
+_PRUNE_TO = 0.9
+_written: Dict[str, int] = {}  # cache dir -> bytes written since it was last pruned
+_written_lock = threading.Lock()
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+
+
+@dataclass
+class PreprocessedImage:
+    """Derivatives of one uploaded image, stored in the cache directory."""
+    content_hash: str
+    email_path: str       # bounded-size image to attach to emails
+    thumbnail_path: str   # MODEL_INPUT_SIZE RGB image for the classifier
+    original_size: Tuple[int, int]
+
+
+def _read_source(source: Union[str, bytes, BinaryIO]) -> bytes:
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if isinstance(source, str):
+        with open(source, "rb") as f:
+            return f.read()
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    return source.read()
+
+
+def _write_atomic(path: str, data: bytes) -> int:
+    # a unique temp name: threads and processes may write the same derivative at once
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=os.path.basename(path) + ".",
+                                     suffix=".tmp", delete=False) as f:
+        f.write(data)
+    try:
+        os.replace(f.name, path)
+    except OSError:
+        os.unlink(f.name)
+        raise
+    return len(data)
+
+
+def prune_cache(cache_dir: str, max_bytes: int) -> int:
+    """Delete the least recently used images until `cache_dir` holds at most `max_bytes`; returns bytes freed.
+
+    The derivatives of one image share a name prefix and are deleted together;
+    the newest of their modification times tells when the image was last used."""
+    images: Dict[str, list] = {}  # name prefix -> [last used, bytes, paths]
+    with os.scandir(cache_dir) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith(".tmp"):  # temp files are still being written
+                stat = entry.stat()
+                image = images.setdefault(entry.name.split("_")[0].split(".")[0], [0.0, 0, []])
+                image[0] = max(image[0], stat.st_mtime)
+                image[1] += stat.st_size
+                image[2].append(entry.path)
+    total = sum(size for _, size, _ in images.values())
+    freed = 0
+    for _, size, paths in sorted(images.values()):
+        if total - freed <= max_bytes:
+            break
+        for path in paths:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:  # pruned by another process
+                pass
+        freed += size
+    return freed
+
+
+def _account(cache_dir: str, written: int) -> None:
+    """Prune the cache to its cap, on first use and then every _PRUNE_EVERY of the cap written."""
+    if settings.IMAGE_CACHE_MAX_MB <= 0:
+        return
+    max_bytes = int(settings.IMAGE_CACHE_MAX_MB * 1024 * 1024)
+    with _written_lock:
+        total = _written.get(cache_dir, max_bytes) + written
+        _written[cache_dir] = 0 if total >= max_bytes * _PRUNE_EVERY else total
+    if total >= max_bytes * _PRUNE_EVERY:
+        prune_cache(cache_dir, int(max_bytes * _PRUNE_TO))
+
+
+def preprocess_image(
+    source: Union[str, bytes, BinaryIO],
+    cache_dir: Optional[str] = None,
+    email_max_side: int = EMAIL_MAX_SIDE,
+    model_size: Tuple[int, int] = MODEL_INPUT_SIZE,
+) -> PreprocessedImage:
+    """
+    Decodes an image once and produces its email and classifier derivatives.
+
+    JPEGs are decoded in draft mode at the smallest DCT scale that still covers
+    `email_max_side`, EXIF orientation is applied, and both derivatives are cached
+    under the content hash so the same upload is never processed twice. The cache
+    is kept under IMAGE_CACHE_MAX_MB by deleting the least recently used files.
+
+    Args:
+        source: Path, raw bytes or file-like object (e.g. a Streamlit upload)
+        cache_dir (str): Where derivatives are stored, defaults to CACHE_DIR
+        email_max_side (int): Longest side of the email derivative, in pixels
+        model_size (tuple): (width, height) of the classifier thumbnail
+    """
+    data = _read_source(source)
+    content_hash = hashlib.sha256(data).hexdigest()
+    cache_dir = cache_dir or CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    stem = os.path.join(cache_dir, content_hash[:32])
+    email_path = f"{stem}_{email_max_side}q{EMAIL_QUALITY}.jpg"
+    thumbnail_path = f"{stem}_{model_size[0]}x{model_size[1]}.png"
+    size_path = f"{stem}.size"
+    if os.path.exists(email_path) and os.path.exists(thumbnail_path):
+        try:
+            with open(size_path) as f:
+                width, height = (int(v) for v in f.read().split())
+            # marks the image as recently used, so pruning deletes others first
+            os.utime(size_path)
+            return PreprocessedImage(content_hash, email_path, thumbnail_path, (width, height))
+        except FileNotFoundError:
+            pass  # not complete yet, or pruned meanwhile
+
+    with Image.open(io.BytesIO(data)) as img:
+        original_size = img.size
+        fmt = img.format
+        img.draft("RGB", (email_max_side, email_max_side))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+
+    if fmt == "JPEG" and max(original_size) <= email_max_side and len(data) <= EMAIL_MAX_BYTES:
+        # already small enough, re-encoding would only lose quality
+        written = _write_atomic(email_path, data)
+    else:
+        email_img = img.copy()
+        email_img.thumbnail((email_max_side, email_max_side), Image.LANCZOS)
+        buf = io.BytesIO()
+        email_img.save(buf, "JPEG", quality=EMAIL_QUALITY, optimize=True, progressive=True)
+        written = _write_atomic(email_path, buf.getvalue())
+
+    thumbnail = ImageOps.fit(img, model_size, Image.BILINEAR)
+    buf = io.BytesIO()
+    thumbnail.save(buf, "PNG")
+    written += _write_atomic(thumbnail_path, buf.getvalue())
+    written += _write_atomic(size_path, f"{original_size[0]} {original_size[1]}".encode())
+    _account(cache_dir, written)
+
+    return PreprocessedImage(content_hash, email_path, thumbnail_path, original_size)
+
+
+def preprocess_directory(directory: str, cache_dir: Optional[str] = None,
+                         max_workers: Optional[int] = None) -> List[Tuple[str, Union[PreprocessedImage, Exception]]]:
+    """Preprocesses every image in `directory` in parallel, returning (path, result or error) pairs."""
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+    )
+
+    def run(path: str):
+        try:
+            return path, preprocess_image(path, cache_dir)
+        except Exception as e:
+            return path, e
+
+    # Pillow releases the GIL while decoding and resizing, so threads scale here
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(run, paths))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Preprocess every image in a directory")
+    parser.add_argument("directory")
+    parser.add_argument("--cache-dir", default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    for path, result in preprocess_directory(args.directory, args.cache_dir, args.workers):
+        if isinstance(result, Exception):
+            print(f"❌ {path}: {result}")
+        else:
+            print(f"✅ {path} -> {result.email_path}, {result.thumbnail_path}")
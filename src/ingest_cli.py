@@ -0,0 +1,287 @@
+"""
+Headless bulk ingest: streams a JSONL/CSV feed of listings through
+sanitize → extract → classify → email and writes one JSON result per line.
+
+Each input record needs a `text` (or `description`) field and may have an
+`image` (or `image_path`) and an `id`.
+
+    python src/ingest_cli.py feed.jsonl --out results.jsonl --checkpoint feed.ckpt
+    cat feed.csv | python src/ingest_cli.py - --format csv --out results.jsonl --email
+"""
+import argparse
+import asyncio
+import csv
+import json
+import math
+import os
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from config import settings
+from text_extractor import extract_listing
+from pipeline import process_listing
+from worker_runtime import ImageWorkerPool
+from result_store import open_store
+from gmail_sender import MailSender, StreamingMessage
+import metrics
+
+
+def read_records(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yields (index, record) pairs one at a time; unparseable lines are yielded as the exception."""
+    if fmt == "csv":
+        for index, row in enumerate(csv.DictReader(stream)):
+            yield index, row
+        return
+    index = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield index, e
+        index += 1
+
+
+class Checkpoint:
+    """
+    Remembers which records are done, in constant space.
+
+    Everything below `next_index` is done; `done_after` holds the few records
+    above it that finished early (at most the number in flight).
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.next_index = 0
+        self.done_after: set = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.next_index = state["next_index"]
+            self.done_after = set(state["done_after"])
+
+    def is_done(self, index: int) -> bool:
+        return index < self.next_index or index in self.done_after
+
+    def mark_done(self, index: int, save: bool = True) -> None:
+        self.done_after.add(index)
+        while self.next_index in self.done_after:
+            self.done_after.remove(self.next_index)
+            self.next_index += 1
+        if save:
+            self.save()
+
+    def save(self) -> None:
+        """Write the state to `path`, replacing the previous file atomically."""
+        if self.path:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump({"next_index": self.next_index, "done_after": sorted(self.done_after)}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+
+
+class LatencyStats:
+    """Latency percentiles from log-spaced buckets (~2% resolution), so memory doesn't grow with the feed."""
+
+    _GROWTH = 1.02
+
+    def __init__(self):
+        self.buckets: Counter = Counter()
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self.buckets[max(0, int(math.log(max(seconds, 1e-4) / 1e-4, self._GROWTH)))] += 1
+        self.count += 1
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 1e-4 * self._GROWTH ** (bucket + 1)
+        return 0.0
+
+
+async def process_record(record: Dict[str, Any], sender: Optional[MailSender], recipient: Optional[str],
+                         local_first: bool, workers: Optional[ImageWorkerPool] = None) -> Dict[str, Any]:
+    text = record.get("text") or record.get("description")
+    if not text:
+        raise ValueError("record has no text/description")
+    image = record.get("image") or record.get("image_path")
+
+    output: Dict[str, Any] = {}
+    if image:
+        result = await process_listing(image, text, local_first=local_first, workers=workers)
+        output.update(listing=result.listing, body_type_confidence=result.prediction.confidence,
+                      timings=result.timings)
+        image_path = result.image.email_path
+    else:
+        output["listing"] = await extract_listing(text, local_first=local_first)
+        image_path = None
+
+    if sender is not None:
+        msg = StreamingMessage(sender.sender_email, recipient, output["listing"], image_path)
+        sent = await asyncio.get_running_loop().run_in_executor(None, sender.send, msg)
+        output["emailed"] = sent.success
+        if not sent.success:
+            raise RuntimeError(f"email failed: {sent.error}")
+    return output
+
+
+async def run(records: Iterator[Tuple[int, Any]], out: TextIO, checkpoint: Checkpoint, concurrency: int,
+              sender: Optional[MailSender] = None, recipient: Optional[str] = None,
+              local_first: bool = False, workers: Optional[ImageWorkerPool] = None,
+              store: Optional[Any] = None, commit_every: int = 100,
+              commit_interval: float = 10.0) -> Dict[str, Any]:
+    """Processes records with at most `concurrency` in flight, writing each result as soon as it is done.
+
+    Successful listings are also appended to `store` (a result_store store) when given.
+    Finished records are committed every `commit_every` records or `commit_interval`
+    seconds, whichever comes first: the store is flushed, then the checkpoint saved
+    once. A crash replays at most that many records, and never loses a stored row."""
+    latencies = LatencyStats()
+    errors: Counter = Counter()
+    processed = skipped = 0
+    started = time.perf_counter()
+
+    async def handle(index: int, record: Any) -> Dict[str, Any]:
+        began = time.perf_counter()
+        line: Dict[str, Any] = {"index": index}
+        try:
+            if isinstance(record, Exception):
+                raise record
+            line["id"] = record.get("id", index)
+            line.update(await process_record(record, sender, recipient, local_first, workers))
+            if store is not None:
+                # a full buffer is written out by this call: keep that I/O off the event loop
+                await asyncio.to_thread(store.append, line["listing"], listing_id=str(line["id"]))
+            line["ok"] = True
+        except Exception as e:
+            line.update(ok=False, error=f"{type(e).__name__}: {e}")
+        line["latency_ms"] = round((time.perf_counter() - began) * 1000, 1)
+        return line
+
+    uncommitted: List[int] = []  # finished records not yet in the checkpoint file
+    last_commit = time.monotonic()
+
+    async def commit() -> None:
+        nonlocal last_commit
+        if store is not None:
+            await asyncio.to_thread(store.flush)
+        for index in uncommitted:
+            checkpoint.mark_done(index, save=False)
+        uncommitted.clear()
+        await asyncio.to_thread(checkpoint.save)
+        last_commit = time.monotonic()
+
+    async def finish(tasks) -> None:
+        nonlocal processed
+        for task in tasks:
+            line = task.result()
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            out.flush()
+            uncommitted.append(line["index"])
+            latencies.add(line["latency_ms"] / 1000)
+            processed += 1
+            if not line["ok"]:
+                errors[line["error"].split(":", 1)[0]] += 1
+        if len(uncommitted) >= commit_every or time.monotonic() - last_commit >= commit_interval:
+            await commit()
+
+    pending: set = set()
+    for index, record in records:
+        if checkpoint.is_done(index):
+            skipped += 1
+            continue
+        pending.add(asyncio.ensure_future(handle(index, record)))
+        if len(pending) >= concurrency:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            await finish(done)
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        await finish(done)
+    if uncommitted:
+        await commit()
+
+    elapsed = time.perf_counter() - started
+    return {
+        "processed": processed,
+        "skipped": skipped,
+        "errors": sum(errors.values()),
+        "errors_by_type": dict(errors),
+        "elapsed_s": round(elapsed, 3),
+        "items_per_s": round(processed / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(latencies.percentile(50) * 1000, 1),
+        "p95_ms": round(latencies.percentile(95) * 1000, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk-ingest car listings from a JSONL/CSV feed")
+    parser.add_argument("feed", help="JSONL or CSV file, or - for stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="defaults to the file extension (jsonl for stdin)")
+    parser.add_argument("--out", default="-", help="JSONL results file (appended to), - for stdout")
+    parser.add_argument("--checkpoint", help="resume file; records already done are skipped")
+    parser.add_argument("--concurrency", type=int, default=8, help="listings in flight at once")
+    parser.add_argument("--local-first", action="store_true", help="skip the LLM when rules resolve the listing")
+    parser.add_argument("--email", action="store_true", help="email each result (SENDER_EMAIL/SENDER_PASSWORD/RECIPIENT_EMAIL)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for the image stages (default WORKER_PROCESSES, 0 = one per CPU); "
+                             "-1 runs them in threads")
+    parser.add_argument("--store", help="also append listings to a result store: *.db (SQLite) or a Parquet directory")
+    parser.add_argument("--commit-every", type=int, default=100,
+                        help="flush the store and save the checkpoint after this many records (at most this many "
+                             "are redone after a crash)")
+    parser.add_argument("--commit-seconds", type=float, default=10.0, help="... or after this many seconds")
+    parser.add_argument("--metrics", help="write per-stage metrics here in Prometheus text format")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+
+    fmt = args.format or ("csv" if args.feed.lower().endswith(".csv") else "jsonl")
+    sender = None
+    if args.email:
+        if not (settings.SENDER_EMAIL and settings.RECIPIENT_EMAIL):
+            parser.error("--email needs SENDER_EMAIL and RECIPIENT_EMAIL to be set")
+        sender = MailSender(settings.SENDER_EMAIL, settings.SENDER_PASSWORD)
+
+    store = open_store(args.store) if args.store else None
+    workers = None
+    if args.workers is None or args.workers >= 0:
+        workers = ImageWorkerPool(args.workers or None)
+
+    feed = sys.stdin if args.feed == "-" else open(args.feed, newline="" if fmt == "csv" else None, encoding="utf-8")
+    out = sys.stdout if args.out == "-" else open(args.out, "a", encoding="utf-8")
+    try:
+        summary = asyncio.run(run(read_records(feed, fmt), out, Checkpoint(args.checkpoint), args.concurrency,
+                                  sender, settings.RECIPIENT_EMAIL, args.local_first, workers, store,
+                                  args.commit_every, args.commit_seconds))
+    finally:
+        if store is not None:
+            store.close()
+        if workers is not None:
+            workers.close()
+        if sender is not None:
+            sender.close()
+        if feed is not sys.stdin:
+            feed.close()
+        if out is not sys.stdout:
+            out.close()
+
+    print(json.dumps(summary), file=sys.stderr)
+    if args.metrics:
+        with open(args.metrics, "w") as f:
+            f.write(metrics.export_prometheus())
+    return 1 if summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,502 @@
+"""
+Durable job queue for the listing pipeline, in one SQLite file (WAL mode).
+
+Each listing is a job that moves through stages, extract (sanitize + LLM) →
+classify (preprocess + body type, when there is an image) → email (when
+requested); each stage is claimed and completed separately, so extraction and
+mailing can run in different worker pools. Delivery is at least once:
+
+* claiming a job leases it for `visibility_timeout` seconds, renewed while the
+  stage runs; a worker that dies loses the lease and the job is claimed again,
+* failures are retried with exponential backoff, and after `max_attempts`
+  (or a permanent error) the job is dead-lettered for an operator to requeue,
+* an idempotency key makes enqueueing the same listing twice a no-op, and is
+  the email's Message-ID, so a mail re-sent after a crash is dropped as a
+  duplicate by the receiving server.
+
+Any number of worker processes can share the file. WAL needs shared memory,
+so they have to run on the same host (not over a network filesystem).
+
+    queue = JobQueue("jobs.db")
+    queue.enqueue({"text": text, "image": "car.jpg", "email": True}, idempotency_key="feed-42")
+    asyncio.run(JobWorker(queue, stages=("extract", "classify")).run(drain=True))
+
+    python src/job_queue.py enqueue jobs.db feed.jsonl --email
+    python src/job_queue.py work jobs.db --stages email --concurrency 2
+    python src/job_queue.py stats jobs.db
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence
+
+from config import settings
+import metrics
+from resilience import PermanentExtractionError, RetryableExtractionError
+
+STAGES = ("extract", "classify", "email")
+RUN_HISTORY_SECONDS = 24 * 3600   # stage_runs rows kept for throughput stats
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT UNIQUE,
+    stage TEXT NOT NULL,
+    state TEXT NOT NULL,              -- ready | leased | done | dead
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    available_at REAL NOT NULL,       -- when a ready job may run, or when a lease expires
+    lease_owner TEXT,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (state, stage, available_at);
+CREATE TABLE IF NOT EXISTS stage_runs (
+    stage TEXT NOT NULL,
+    finished_at REAL NOT NULL,
+    seconds REAL NOT NULL,
+    ok INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS stage_runs_finished ON stage_runs (finished_at);
+"""
+
+
+@dataclass
+class Job:
+    """A claimed job; `attempts` also identifies the lease, so a stale worker can't complete it."""
+    id: int
+    key: Optional[str]
+    stage: str
+    payload: Dict[str, Any]
+    attempts: int
+    owner: str
+
+
+class JobQueue:
+    """
+    Jobs stored in SQLite, safe to share between threads and processes.
+
+    Args:
+        path (str): Database file
+        visibility_timeout (float): Seconds a claimed job stays leased before another worker may take it
+        max_attempts (int): Attempts per stage before the job is dead-lettered
+        backoff (float): Base retry delay in seconds, doubled after every failed attempt
+        backoff_max (float): Longest retry delay
+        spool_dir (str): Where spool() keeps uploaded images, `<path>.files` if None
+    """
+
+    def __init__(self, path: str, visibility_timeout: float = 120.0, max_attempts: int = 5,
+                 backoff: float = 2.0, backoff_max: float = 300.0, spool_dir: Optional[str] = None):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.spool_dir = spool_dir or path + ".files"
+        # autocommit mode: writes take the lock up front with BEGIN IMMEDIATE (see _write)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _write(self):
+        """A write transaction holding the database lock from its start, so claims never race."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    # ---- producers
+
+    def enqueue(self, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+                stage: str = STAGES[0]) -> int:
+        """Add a job at `stage`; returns its id (the existing job's id when the key was seen before)."""
+        now = time.time()
+        with self._write():
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO jobs (idempotency_key, stage, state, payload, available_at, created_at, updated_at) "
+                "VALUES (?, ?, 'ready', ?, ?, ?, ?)",
+                (idempotency_key, stage, json.dumps(payload, ensure_ascii=False), now, now, now))
+            if cursor.rowcount:
+                return cursor.lastrowid
+            return self._db.execute("SELECT id FROM jobs WHERE idempotency_key = ?", (idempotency_key,)).fetchone()[0]
+
+    def spool(self, data: bytes, name: str = "image.jpg") -> str:
+        """Store an upload next to the queue (content-addressed) and return its path, for payloads."""
+        os.makedirs(self.spool_dir, exist_ok=True)
+        path = os.path.join(self.spool_dir, hashlib.sha256(data).hexdigest()[:32] + os.path.splitext(name)[1])
+        if not os.path.exists(path):
+            tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return path
+
+    # ---- workers
+
+    def claim(self, owner: str, stages: Sequence[str] = STAGES, limit: int = 1) -> List[Job]:
+        """Lease up to `limit` runnable jobs at the given stages (including ones whose lease expired)."""
+        now = time.time()
+        marks = ", ".join("?" for _ in stages)
+        with self._write():
+            # a job that keeps killing its worker never reaches fail(); stop handing it out
+            self._db.execute(
+                "UPDATE jobs SET state = 'dead', last_error = 'lease expired too often', updated_at = ? "
+                f"WHERE state = 'leased' AND available_at <= ? AND attempts >= ? AND stage IN ({marks})",
+                (now, now, self.max_attempts, *stages))
+            rows = self._db.execute(
+                "UPDATE jobs SET state = 'leased', lease_owner = ?, attempts = attempts + 1, available_at = ?, updated_at = ? "
+                "WHERE id IN (SELECT id FROM jobs WHERE state IN ('ready', 'leased') AND available_at <= ? "
+                f"AND stage IN ({marks}) ORDER BY available_at LIMIT ?) "
+                "RETURNING id, idempotency_key, stage, payload, attempts",
+                (owner, now + self.visibility_timeout, now, now, *stages, limit)).fetchall()
+        return [Job(id_, key, stage, json.loads(payload), attempts, owner)
+                for id_, key, stage, payload, attempts in rows]
+
+    def _update_leased(self, job: Job, sql: str, params: tuple) -> bool:
+        cursor = self._db.execute(f"{sql} WHERE id = ? AND state = 'leased' AND lease_owner = ? AND attempts = ?",
+                                  (*params, job.id, job.owner, job.attempts))
+        return cursor.rowcount == 1
+
+    def extend(self, job: Job) -> bool:
+        """Renew the lease of a long-running job; False when it was lost."""
+        with self._write():
+            return self._update_leased(job, "UPDATE jobs SET available_at = ?", (time.time() + self.visibility_timeout,))
+
+    def complete(self, job: Job, payload: Dict[str, Any], next_stage: Optional[str] = None,
+                 seconds: float = 0.0) -> bool:
+        """Finish the job's stage and hand it on to `next_stage` (None: the job is done).
+
+        Returns False, changing nothing, when the lease had expired and the job was taken over."""
+        now = time.time()
+        with self._write():
+            if next_stage is None:
+                ok = self._update_leased(job, "UPDATE jobs SET state = 'done', payload = ?, last_error = NULL, updated_at = ?",
+                                         (json.dumps(payload, ensure_ascii=False), now))
+            else:
+                ok = self._update_leased(
+                    job, "UPDATE jobs SET stage = ?, state = 'ready', attempts = 0, available_at = ?, payload = ?, "
+                         "last_error = NULL, updated_at = ?",
+                    (next_stage, now, json.dumps(payload, ensure_ascii=False), now))
+            if ok:
+                self._record_run(job.stage, now, seconds, True)
+        return ok
+
+    def fail(self, job: Job, error: str, retry_after: Optional[float] = None, permanent: bool = False,
+             seconds: float = 0.0) -> str:
+        """Schedule a retry with backoff, or dead-letter the job; returns the new state ('lost' if the lease was)."""
+        now = time.time()
+        dead = permanent or job.attempts >= self.max_attempts
+        delay = min(self.backoff_max, self.backoff * 2 ** (job.attempts - 1))
+        if retry_after:
+            delay = max(delay, retry_after)
+        with self._write():
+            if dead:
+                ok = self._update_leased(job, "UPDATE jobs SET state = 'dead', last_error = ?, updated_at = ?",
+                                         (error, now))
+            else:
+                ok = self._update_leased(job, "UPDATE jobs SET state = 'ready', available_at = ?, last_error = ?, updated_at = ?",
+                                         (now + delay, error, now))
+            if ok:
+                self._record_run(job.stage, now, seconds, False)
+        if not ok:
+            return "lost"
+        return "dead" if dead else "ready"
+
+    def _record_run(self, stage: str, now: float, seconds: float, ok: bool) -> None:
+        self._db.execute("INSERT INTO stage_runs (stage, finished_at, seconds, ok) VALUES (?, ?, ?, ?)",
+                         (stage, now, seconds, int(ok)))
+        self._db.execute("DELETE FROM stage_runs WHERE finished_at < ?", (now - RUN_HISTORY_SECONDS,))
+
+    # ---- operators
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            cursor = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            job = dict(zip([c[0] for c in cursor.description], row))
+        job["payload"] = json.loads(job["payload"])
+        return job
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._db.execute("SELECT id, idempotency_key, stage, attempts, last_error, updated_at FROM jobs "
+                                    "WHERE state = 'dead' ORDER BY updated_at DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(zip(("id", "idempotency_key", "stage", "attempts", "last_error", "updated_at"), row))
+                for row in rows]
+
+    def requeue(self, job_id: Optional[int] = None) -> int:
+        """Give dead jobs (one, or all when `job_id` is None) a fresh set of attempts at their stage."""
+        now = time.time()
+        sql = "UPDATE jobs SET state = 'ready', attempts = 0, available_at = ?, updated_at = ? WHERE state = 'dead'"
+        params: tuple = (now, now)
+        if job_id is not None:
+            sql += " AND id = ?"
+            params += (job_id,)
+        with self._write():
+            return self._db.execute(sql, params).rowcount
+
+    def stats(self, window: float = 300.0) -> Dict[str, Any]:
+        """Jobs per stage and state, and per-stage runs/failures/mean seconds over the last `window` seconds."""
+        now = time.time()
+        with self._lock:
+            counts = self._db.execute("SELECT stage, state, COUNT(*) FROM jobs GROUP BY stage, state").fetchall()
+            runs = self._db.execute(
+                "SELECT stage, COUNT(*), SUM(1 - ok), AVG(seconds) FROM stage_runs WHERE finished_at >= ? GROUP BY stage",
+                (now - window,)).fetchall()
+        depth: Dict[str, Dict[str, int]] = {}
+        for stage, state, count in counts:
+            depth.setdefault(stage, {})[state] = count
+        for stage in STAGES:
+            for state in ("ready", "leased", "dead"):
+                metrics.set_gauge("job_queue_depth", depth.get(stage, {}).get(state, 0), stage=stage, state=state)
+        throughput = {stage: {"runs": count, "failures": failures, "per_minute": round(count * 60 / window, 2),
+                              "mean_seconds": round(mean, 3)}
+                      for stage, count, failures, mean in runs}
+        return {"depth": depth, "throughput": throughput, "window_s": window}
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self) -> "JobQueue":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+# ---- Stage handlers: take the payload, add their results to it and return the next stage
+
+async def run_extract(payload: Dict[str, Any]) -> Optional[str]:
+    from text_extractor import extract_listing
+    payload["listing"] = await extract_listing(payload["text"], local_first=payload.get("local_first", False))
+    if payload.get("image"):
+        return "classify"
+    return "email" if payload.get("email") else None
+
+
+async def run_classify(payload: Dict[str, Any]) -> Optional[str]:
+    from car_type_classifier import classify_car_type, merge_body_type
+    from image_preprocessing import preprocess_image
+
+    def work():
+        preprocessed = preprocess_image(payload["image"])
+        return preprocessed, classify_car_type(preprocessed.thumbnail_path)
+
+    preprocessed, prediction = await asyncio.get_running_loop().run_in_executor(None, work)
+    merge_body_type(payload["listing"], prediction)
+    payload["email_image"] = preprocessed.email_path
+    payload["body_type_confidence"] = prediction.confidence
+    return "email" if payload.get("email") else None
+
+
+def message_id_for(job: Job) -> str:
+    """A Message-ID that is the same every time the job is delivered."""
+    token = hashlib.sha256((job.key or f"job-{job.id}").encode("utf-8")).hexdigest()[:32]
+    return f"<{token}@car-listing.job>"
+
+
+async def run_email(payload: Dict[str, Any], job: Job) -> Optional[str]:
+    from gmail_sender import StreamingMessage, get_sender
+
+    recipient = payload.get("recipient") or settings.RECIPIENT_EMAIL
+    if not (settings.SENDER_EMAIL and recipient):
+        raise PermanentExtractionError("email is not configured (SENDER_EMAIL/RECIPIENT_EMAIL)")
+    sender = get_sender(settings.SENDER_EMAIL, settings.SENDER_PASSWORD or "")
+    msg = StreamingMessage(sender.sender_email, recipient, payload["listing"],
+                           payload.get("email_image") or payload.get("image"), message_id=message_id_for(job))
+    result = await asyncio.get_running_loop().run_in_executor(None, sender.send, msg)
+    if not result.success:
+        raise RuntimeError(f"email failed after {result.attempts} attempt(s): {result.error}")
+    payload["emailed"] = True
+    return None
+
+
+class JobWorker:
+    """
+    Claims and runs jobs at the given stages, `concurrency` at a time.
+
+    Args:
+        queue (JobQueue): The shared queue
+        stages (tuple): Stages this worker takes, e.g. ("email",) for a mail-only worker
+        concurrency (int): Jobs in flight
+        poll_interval (float): Wait between claims when the queue is empty
+        worker_id (str): Lease owner name, host:pid:random if None
+    """
+
+    def __init__(self, queue: JobQueue, stages: Sequence[str] = STAGES, concurrency: int = 4,
+                 poll_interval: float = 0.5, worker_id: Optional[str] = None):
+        unknown = set(stages) - set(STAGES)
+        if unknown:
+            raise ValueError(f"unknown stages: {sorted(unknown)}")
+        self.queue = queue
+        self.stages = tuple(stages)
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+    async def _run_stage(self, job: Job, payload: Dict[str, Any]) -> Optional[str]:
+        if job.stage == "extract":
+            return await run_extract(payload)
+        if job.stage == "classify":
+            return await run_classify(payload)
+        return await run_email(payload, job)
+
+    async def process(self, job: Job) -> str:
+        """Run the job's stage, renewing its lease every visibility_timeout/3; returns the job's resulting state.
+
+        A stage whose lease can't be renewed (another worker took the job over) is cancelled."""
+        started = time.perf_counter()
+        payload = dict(job.payload)
+        stage = asyncio.ensure_future(self._run_stage(job, payload))
+        lost = False
+
+        async def heartbeat() -> None:
+            nonlocal lost
+            while True:
+                await asyncio.sleep(self.queue.visibility_timeout / 3)
+                try:
+                    renewed = await asyncio.to_thread(self.queue.extend, job)
+                except sqlite3.Error:
+                    continue  # e.g. locked for longer than the busy timeout; the lease still has time left
+                if not renewed:
+                    lost = True
+                    stage.cancel()
+                    return
+
+        renewing = asyncio.ensure_future(heartbeat())
+        try:
+            next_stage = await stage
+        except asyncio.CancelledError:
+            if not lost:
+                raise  # the worker itself is being cancelled
+            metrics.inc("job_stage_runs_total", stage=job.stage, result="lost")
+            return "lost"
+        except Exception as e:
+            seconds = time.perf_counter() - started
+            # bad input (too short, missing file) or a refused request won't get better by retrying
+            permanent = isinstance(e, (PermanentExtractionError, FileNotFoundError, KeyError)) or (
+                type(e) is ValueError)
+            retry_after = e.retry_after if isinstance(e, RetryableExtractionError) else None
+            state = await asyncio.to_thread(self.queue.fail, job, f"{type(e).__name__}: {e}", retry_after,
+                                            permanent, seconds)
+            metrics.inc("job_stage_runs_total", stage=job.stage, result=state)
+            return state
+        finally:
+            renewing.cancel()
+        seconds = time.perf_counter() - started
+        metrics.observe("job_stage_seconds", seconds, stage=job.stage)
+        done = await asyncio.to_thread(self.queue.complete, job, payload, next_stage, seconds)
+        state = "lost" if not done else ("done" if next_stage is None else "ready")
+        metrics.inc("job_stage_runs_total", stage=job.stage, result=state)
+        return state
+
+    async def run(self, stop: Optional[asyncio.Event] = None, drain: bool = False) -> int:
+        """Work until `stop` is set (or, with `drain`, until nothing is runnable); returns jobs processed."""
+        processed = 0
+
+        async def loop() -> None:
+            nonlocal processed
+            while stop is None or not stop.is_set():
+                jobs = await asyncio.to_thread(self.queue.claim, self.worker_id, self.stages, 1)
+                if not jobs:
+                    if drain:
+                        return
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                await self.process(jobs[0])
+                processed += 1
+
+        await asyncio.gather(*(loop() for _ in range(self.concurrency)))
+        return processed
+
+
+def _key_for(record: Dict[str, Any], feed: str) -> str:
+    if record.get("id") is not None:
+        return f"{os.path.basename(feed)}:{record['id']}"
+    text = record.get("text") or record.get("description") or ""
+    return hashlib.sha256(f"{text}\0{record.get('image') or record.get('image_path') or ''}".encode()).hexdigest()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Durable job queue for the listing pipeline")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enqueue = commands.add_parser("enqueue", help="add the records of a JSONL/CSV feed as jobs")
+    enqueue.add_argument("queue")
+    enqueue.add_argument("feed", help="JSONL or CSV file, or - for stdin")
+    enqueue.add_argument("--format", choices=["jsonl", "csv"])
+    enqueue.add_argument("--email", action="store_true", help="email each listing once extracted")
+    enqueue.add_argument("--local-first", action="store_true")
+    work = commands.add_parser("work", help="run a worker")
+    work.add_argument("queue")
+    work.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to take")
+    work.add_argument("--concurrency", type=int, default=4)
+    work.add_argument("--drain", action="store_true", help="exit when nothing is runnable")
+    stats = commands.add_parser("stats", help="queue depth and stage throughput")
+    stats.add_argument("queue")
+    stats.add_argument("--window", type=float, default=300.0, help="throughput window in seconds")
+    stats.add_argument("--dead", action="store_true", help="also list dead-lettered jobs")
+    requeue = commands.add_parser("requeue", help="retry dead-lettered jobs")
+    requeue.add_argument("queue")
+    requeue.add_argument("--id", type=int, help="only this job")
+    args = parser.parse_args(argv)
+
+    queue = JobQueue(args.queue, visibility_timeout=settings.JOB_VISIBILITY_TIMEOUT_SECONDS,
+                     max_attempts=settings.JOB_MAX_ATTEMPTS)
+    try:
+        if args.command == "enqueue":
+            from ingest_cli import read_records
+            fmt = args.format or ("csv" if args.feed.lower().endswith(".csv") else "jsonl")
+            added = skipped = 0
+            # stdin is left open, only a file opened here is closed
+            with contextlib.nullcontext(sys.stdin) if args.feed == "-" else open(
+                    args.feed, newline="" if fmt == "csv" else None, encoding="utf-8") as feed:
+                for _, record in read_records(feed, fmt):
+                    if isinstance(record, Exception) or not (record.get("text") or record.get("description")):
+                        skipped += 1
+                        continue
+                    queue.enqueue({"text": record.get("text") or record.get("description"),
+                                   "image": record.get("image") or record.get("image_path"),
+                                   "email": args.email, "local_first": args.local_first},
+                                  idempotency_key=_key_for(record, args.feed))
+                    added += 1
+            print(json.dumps({"enqueued": added, "skipped": skipped}), file=sys.stderr)
+        elif args.command == "work":
+            stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+            processed = asyncio.run(JobWorker(queue, stages, args.concurrency).run(drain=args.drain))
+            print(json.dumps({"processed": processed}), file=sys.stderr)
+        elif args.command == "stats":
+            report = queue.stats(args.window)
+            if args.dead:
+                report["dead"] = queue.dead_letters()
+            print(json.dumps(report, indent=2))
+        else:
+            print(json.dumps({"requeued": queue.requeue(args.id)}), file=sys.stderr)
+    finally:
+        queue.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,254 @@
+"""
+In-process metrics for the extraction pipeline.
+
+Timing spans, counters and histograms are kept in memory and can be exported
+in Prometheus text format, or forwarded to any number of hooks (e.g. an
+OpenTelemetry meter). Metrics are off by default; while disabled every call
+returns immediately, so instrumentation can stay in hot paths.
+
+    import metrics
+    metrics.enable()
+    with metrics.span("llm_request"):
+        ...
+    metrics.inc("email_sent_total", result="success")
+    print(metrics.export_prometheus())
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+PREFIX = "car_extractor_"
+
+# seconds; covers microsecond-level local stages up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+# hook(kind, name, value, labels) with kind "counter", "gauge" or "histogram"
+Hook = Callable[[str, str, float, Dict[str, str]], None]
+
+
+class Histogram:
+    """Cumulative-bucket histogram, as Prometheus expects."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile (inf if it is above the last bucket)."""
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRegistry:
+    """Holds every counter, gauge and histogram; thread-safe."""
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._gauges: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._help: Dict[str, str] = {}
+        self._hooks: List[Hook] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def add_hook(self, hook: Hook) -> None:
+        self._hooks.append(hook)
+
+    def inc(self, name: str, value: float = 1.0, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+        for hook in self._hooks:
+            hook("counter", name, value, labels)
+
+    def set_gauge(self, name: str, value: float, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+        for hook in self._hooks:
+            hook("gauge", name, value, labels)
+
+    def observe(self, name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: str) -> None:
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram(buckets)
+            series[key].observe(value)
+        for hook in self._hooks:
+            hook("histogram", name, value, labels)
+
+    def counter_value(self, name: str, **labels: str) -> float:
+        return self._counters.get(name, {}).get(tuple(sorted(labels.items())), 0.0)
+
+    def gauge_value(self, name: str, **labels: str) -> Optional[float]:
+        return self._gauges.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def histogram(self, name: str, **labels: str) -> Optional[Histogram]:
+        return self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+    def export_prometheus(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        def fmt_labels(labels: Labels, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+            pairs = labels + extra
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+        lines: List[str] = []
+        with self._lock:
+            for name in sorted(self._counters):
+                full = PREFIX + name
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} counter")
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f"{full}{fmt_labels(labels)} {value:g}")
+            for name in sorted(self._gauges):
+                full = PREFIX + name
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} gauge")
+                for labels, value in sorted(self._gauges[name].items()):
+                    lines.append(f"{full}{fmt_labels(labels)} {value:g}")
+            for name in sorted(self._histograms):
+                full = PREFIX + name
+                lines.append(f"# HELP {full} {self._help.get(name, name)}")
+                lines.append(f"# TYPE {full} histogram")
+                for labels, hist in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets, hist.counts):
+                        cumulative += count
+                        lines.append(f"{full}_bucket{fmt_labels(labels, (('le', f'{bound:g}'),))} {cumulative}")
+                    lines.append(f"{full}_bucket{fmt_labels(labels, (('le', '+Inf'),))} {hist.count}")
+                    lines.append(f"{full}_sum{fmt_labels(labels)} {hist.sum:g}")
+                    lines.append(f"{full}_count{fmt_labels(labels)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+
+class _Span:
+    __slots__ = ("registry", "stage", "start")
+
+    def __init__(self, registry: MetricsRegistry, stage: str):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self) -> "_Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.registry.observe("stage_duration_seconds", time.perf_counter() - self.start, stage=self.stage,
+                              outcome="error" if exc_type else "ok")
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+registry = MetricsRegistry(enabled=os.getenv("METRICS_ENABLED", "").lower() in ("1", "true", "yes"))
+registry.describe("stage_duration_seconds", "Wall time spent in each pipeline stage")
+registry.describe("llm_tokens_total", "Tokens used by LLM requests")
+registry.describe("llm_cost_usd_total", "Estimated LLM spend in USD")
+registry.describe("llm_request_cost_usd", "Estimated LLM spend per request in USD")
+registry.describe("llm_request_tokens", "Tokens used per LLM request")
+registry.describe("extraction_cache_requests_total", "Extraction cache lookups")
+registry.describe("near_duplicate_requests_total", "Near-duplicate index lookups")
+registry.describe("llm_time_to_first_field_seconds", "Time from a streamed LLM request to its first complete field")
+registry.describe("classifier_batch_size", "Images per classifier inference call")
+registry.describe("image_dedup_requests_total", "Perceptual-hash lookups of images to classify")
+registry.describe("email_duplicate_images_total", "Email images left out as already sent")
+registry.describe("email_sent_total", "Emails sent")
+registry.describe("email_retries_total", "Email send retries")
+registry.describe("packed_listings_per_request", "Listings sent in one packed LLM request")
+registry.describe("packed_item_retries_total", "Packed items re-run individually")
+registry.describe("worker_queue_depth", "Image jobs waiting for a free worker process")
+registry.describe("worker_jobs_in_flight", "Image jobs submitted to the worker pool, running or queued")
+registry.describe("worker_queue_wait_seconds", "Time image jobs waited for a free worker process")
+registry.describe("worker_jobs_total", "Image jobs run by the worker pool")
+registry.describe("api_requests_total", "HTTP service requests by endpoint and status")
+registry.describe("api_coalesced_requests_total", "HTTP requests served by joining an identical one in flight")
+registry.describe("api_requests_pending", "HTTP requests being served")
+registry.describe("job_queue_depth", "Jobs in the durable queue by stage and state")
+registry.describe("job_stage_runs_total", "Job stage runs by resulting job state")
+registry.describe("job_stage_seconds", "Time to run one job stage")
+
+
+def enable() -> None:
+    registry.enabled = True
+
+
+def disable() -> None:
+    registry.enabled = False
+
+
+def span(stage: str):
+    """Context manager timing a pipeline stage into stage_duration_seconds{stage=...}."""
+    if not registry.enabled:
+        return _NOOP_SPAN
+    return _Span(registry, stage)
+
+
+def inc(name: str, value: float = 1.0, **labels: str) -> None:
+    registry.inc(name, value, **labels)
+
+
+def set_gauge(name: str, value: float, **labels: str) -> None:
+    registry.set_gauge(name, value, **labels)
+
+
+def observe(name: str, value: float, buckets: Sequence[float] = DEFAULT_BUCKETS, **labels: str) -> None:
+    registry.observe(name, value, buckets, **labels)
+
+
+def add_hook(hook: Hook) -> None:
+    """Forward every measurement to `hook(kind, name, value, labels)`, e.g. to record it with OpenTelemetry."""
+    registry.add_hook(hook)
+
+
+def export_prometheus() -> str:
+    return registry.export_prometheus()
@@ -0,0 +1,171 @@
+"""
+Near-duplicate detection of listing descriptions with MinHash + LSH.
+
+Relisted cars often come back with small wording changes ("220K L.E" vs
+"220,000 LE"), which the exact-hash extraction cache misses. Descriptions are
+normalized (case, thousands separators, "k" suffixes, currency spellings),
+cut into character shingles and summarized by a MinHash signature; the
+signature's bands are indexed in hash tables, so a lookup only compares
+against the few entries sharing a band instead of the whole index.
+
+    index = NearDuplicateIndex(threshold=0.9)
+    index.add(sanitized, listing)
+    match = index.query(other_sanitized)   # NearDuplicate(key, similarity, value) or None
+"""
+import json
+import re
+import sqlite3
+import threading
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+NUM_PERM = 128
+BANDS = 16                # 16 bands x 8 rows: pairs above ~0.7 similarity almost always share a band
+SHINGLE_SIZE = 5
+DEFAULT_THRESHOLD = 0.9
+
+_PRIME = (1 << 32) + 15   # smallest prime above 2**32
+_MAX_HASH = (1 << 32) - 1
+
+_THOUSANDS_RE = re.compile(r"(?<=\d)[,.](?=\d{3}\b)")
+_K_SUFFIX_RE = re.compile(r"\b(\d+(?:\.\d+)?)\s*k\b")
+_CURRENCY_RE = re.compile(r"\b(?:l\.?\s?e\.?|egp|pounds?|جنيه)(?=\W|$)")
+_NON_WORD_RE = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    """Lower-case `text` and spell numbers and currencies one way, so trivially reworded copies match."""
+    text = text.lower()
+    text = _THOUSANDS_RE.sub("", text)
+    text = _K_SUFFIX_RE.sub(lambda m: str(int(float(m.group(1)) * 1000)), text)
+    text = _CURRENCY_RE.sub(" egp ", text)
+    return " ".join(_NON_WORD_RE.sub(" ", text).split())
+
+
+@dataclass
+class NearDuplicate:
+    """The stored entry most similar to a query."""
+    key: str
+    similarity: float
+    value: Any
+
+
+class MinHasher:
+    """MinHash signatures of character shingles, computed with numpy."""
+
+    def __init__(self, num_perm: int = NUM_PERM, shingle_size: int = SHINGLE_SIZE, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        # a < 2**31 keeps a * h + b (h < 2**32) inside uint64
+        self._a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+
+    def shingles(self, text: str) -> np.ndarray:
+        text = normalize(text)
+        k = self.shingle_size
+        grams = {text[i:i + k] for i in range(max(1, len(text) - k + 1))}
+        return np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = self.shingles(text)
+        permuted = (np.outer(hashes, self._a) + self._b) % _PRIME
+        return (permuted & _MAX_HASH).min(axis=0).astype(np.uint32)
+
+
+class NearDuplicateIndex:
+    """
+    In-memory LSH index from descriptions to values (e.g. extracted listings).
+
+    Args:
+        threshold (float): Minimum estimated Jaccard similarity for query() to return a match
+        num_perm (int): MinHash signature length
+        bands (int): LSH bands; must divide num_perm
+        sqlite_path (str): Optional SQLite file every insert is appended to and the index is reloaded from
+    """
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD, num_perm: int = NUM_PERM, bands: int = BANDS,
+                 sqlite_path: Optional[str] = None):
+        if num_perm % bands:
+            raise ValueError("bands must divide num_perm")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.hasher = MinHasher(num_perm)
+        self._tables: List[Dict[bytes, List[int]]] = [defaultdict(list) for _ in range(bands)]
+        self._signatures = np.zeros((1024, num_perm), dtype=np.uint32)
+        self._keys: List[str] = []
+        self._values: List[Any] = []
+        self._lock = threading.Lock()
+
+        self._db = None
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS near_duplicates ("
+                "key TEXT NOT NULL, signature BLOB NOT NULL, value TEXT NOT NULL)"
+            )
+            self._db.commit()
+            for key, signature, value in self._db.execute("SELECT key, signature, value FROM near_duplicates"):
+                self._insert(key, np.frombuffer(signature, dtype=np.uint32), json.loads(value))
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def _insert(self, key: str, signature: np.ndarray, value: Any) -> None:
+        position = len(self._keys)
+        if position == len(self._signatures):
+            self._signatures = np.concatenate([self._signatures, np.zeros_like(self._signatures)])
+        self._signatures[position] = signature
+        self._keys.append(key)
+        self._values.append(value)
+        for table, band in zip(self._tables, self._band_keys(signature)):
+            table[band].append(position)
+
+    def add(self, text: str, value: Any, key: Optional[str] = None) -> None:
+        """Index `text` (a sanitized description) with `value`; `key` defaults to the text itself."""
+        signature = self.hasher.signature(text)
+        key = key if key is not None else text
+        with self._lock:
+            self._insert(key, signature, value)
+            if self._db is not None:
+                self._db.execute("INSERT INTO near_duplicates (key, signature, value) VALUES (?, ?, ?)",
+                                 (key, signature.tobytes(), json.dumps(value, separators=(",", ":"))))
+                self._db.commit()
+
+    def query(self, text: str, threshold: Optional[float] = None) -> Optional[NearDuplicate]:
+        """The most similar indexed entry at or above the threshold, or None."""
+        threshold = self.threshold if threshold is None else threshold
+        signature = self.hasher.signature(text)
+        with self._lock:
+            candidates = set()
+            for table, band in zip(self._tables, self._band_keys(signature)):
+                candidates.update(table.get(band, ()))
+            if not candidates:
+                return None
+            positions = np.fromiter(candidates, dtype=np.int64, count=len(candidates))
+            similarities = (self._signatures[positions] == signature).mean(axis=1)
+            best = int(similarities.argmax())
+            if similarities[best] < threshold:
+                return None
+            position = int(positions[best])
+            return NearDuplicate(self._keys[position], float(similarities[best]), self._values[position])
+
+    def close(self) -> None:
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def similarity(a: str, b: str, shingle_size: int = SHINGLE_SIZE) -> float:
+    """Exact Jaccard similarity of two descriptions' shingle sets (what the signatures estimate)."""
+    hasher = MinHasher(num_perm=1, shingle_size=shingle_size)
+    sa, sb = set(hasher.shingles(a).tolist()), set(hasher.shingles(b).tolist())
+    return len(sa & sb) / len(sa | sb) if sa or sb else 1.0
@@ -0,0 +1,128 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Executor, Future
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Awaitable, BinaryIO, Callable, Dict, Optional, TypeVar, Union
+
+from text_extractor import extract_listing, stream_listing
+from car_type_classifier import CarTypePrediction, classify_car_type, merge_body_type
+from image_preprocessing import PreprocessedImage, preprocess_image
+
+if TYPE_CHECKING:
+    from worker_runtime import ImageWorkerPool
+
+T = TypeVar("T")
+
+
+@dataclass
+class ListingResult:
+    """Everything produced for one listing, plus how long each stage took (seconds)."""
+    listing: Dict[str, Any]
+    prediction: CarTypePrediction
+    image: PreprocessedImage
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+async def _timed(timings: Dict[str, float], stage: str, coro):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        timings[stage] = time.perf_counter() - start
+
+
+async def process_listing(
+    image: Union[str, bytes, BinaryIO],
+    text: str,
+    executor: Optional[Executor] = None,
+    local_first: bool = False,
+    cache_dir: Optional[str] = None,
+    workers: Optional["ImageWorkerPool"] = None,
+    on_field: Optional[Callable[[str, Any], None]] = None,
+) -> ListingResult:
+    """
+    Runs the text and image halves of a listing concurrently and merges them.
+
+    The LLM extraction runs on the event loop while the image is preprocessed
+    (persisted to the image cache) and classified in `executor` (the loop's
+    default thread pool if None), so the latency is roughly the slower of the
+    two halves instead of the sum of every stage.
+
+    Args:
+        image: Path, raw bytes or file-like object (e.g. a Streamlit upload)
+        text: The car description
+        executor: Where the CPU-bound image stages run
+        local_first: Passed to extract_listing
+        cache_dir: Where the image derivatives are written (image_preprocessing.CACHE_DIR if None)
+        workers: A worker_runtime.ImageWorkerPool; when given, the image stages run in its
+            processes instead of `executor`
+        on_field: Called with (name, raw JSON value) for each `car` field as soon as the model
+            has generated it (text_extractor.stream_listing), while the image stages keep running
+    """
+    loop = asyncio.get_running_loop()
+    timings: Dict[str, float] = {}
+    if not isinstance(image, (str, bytes)):
+        # file-like objects are read once here, so the worker threads never share a handle
+        image = image.getvalue() if hasattr(image, "getvalue") else image.read()
+
+    async def image_stages():
+        if workers is not None:
+            preprocessed, prediction, worker_timings = await workers.process(image, cache_dir)
+            timings.update(worker_timings)
+            return preprocessed, prediction
+        preprocessed = await _timed(timings, "preprocess", loop.run_in_executor(executor, functools.partial(preprocess_image, image, cache_dir)))
+        prediction = await _timed(timings, "classify",
+                                  loop.run_in_executor(executor, classify_car_type, preprocessed.thumbnail_path))
+        return preprocessed, prediction
+
+    async def text_stage():
+        if on_field is None or local_first:
+            listing = await extract_listing(text, local_first=local_first)
+            if on_field is not None:
+                for name, value in listing["car"].items():
+                    on_field(name, value)
+            return listing
+        async for event in stream_listing(text):
+            if event.done:
+                return event.value
+            on_field(event.name, event.value)
+
+    start = time.perf_counter()
+    listing, (preprocessed, prediction) = await asyncio.gather(
+        _timed(timings, "extract", text_stage()),
+        image_stages(),
+    )
+    merge_body_type(listing, prediction)
+    timings["total"] = time.perf_counter() - start
+
+    return ListingResult(listing=listing, prediction=prediction, image=preprocessed, timings=timings)
+
+
+class BackgroundLoop:
+    """
+    An event loop running forever in a daemon thread.
+
+    Lets synchronous callers (e.g. Streamlit script threads) share one loop, and
+    with it the pooled LLM client and the resilience state, instead of each
+    creating and tearing down a loop with asyncio.run.
+    """
+
+    def __init__(self, name: str = "pipeline-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, coro: Awaitable[T]) -> "Future[T]":
+        """Schedule `coro` on the loop; returns a concurrent.futures.Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+        """Run `coro` on the loop and wait for its result."""
+        return self.submit(coro).result(timeout)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
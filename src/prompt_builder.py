@@ -0,0 +1,203 @@
+"""
+Builds the `response_format` and `max_tokens` of extraction requests.
+
+Everything is derived from the Pydantic model once per model (i.e. per schema
+version) and reused by every request:
+
+* a strict-mode JSON schema without titles/defaults, with every property
+  required and `additionalProperties: false` on every object;
+* `max_tokens` sized from the schema's worst-case output instead of a flat 800,
+  with `with_more_tokens` to retry an answer that was cut off at that limit;
+* optionally a compact variant whose keys are short aliases (`bt` for
+  `body_type`, ...), shrinking the output, with `expand_aliases` to map the
+  model's answer back to the real field names.
+"""
+import copy
+import json
+import math
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+# worst-case output assumptions used to size max_tokens
+STRING_TOKENS = 24       # tokens allowed for one free-text value
+ARRAY_ITEMS = 4          # items assumed for arrays without maxItems (e.g. notices); longer answers are retried
+NUMBER_TOKENS = 4
+TOKEN_MARGIN = 1.25
+MIN_MAX_TOKENS = 64
+MAX_MAX_TOKENS = 16384
+
+_DROPPED_KEYS = {"title", "description", "default", "examples"}
+
+
+@dataclass(frozen=True)
+class RequestSpec:
+    """The per-schema parts of a chat-completions request."""
+    response_format: Dict[str, Any]
+    max_tokens: int
+    compact: bool
+
+
+@lru_cache(maxsize=None)
+def model_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """`model.model_json_schema()`, generated once. Treat the result as read-only."""
+    return model.model_json_schema()
+
+
+@lru_cache(maxsize=None)
+def schema_fingerprint(model: Type[BaseModel]) -> str:
+    """Canonical JSON of the model's schema, for cache keys."""
+    return json.dumps(model_schema(model), sort_keys=True, separators=(",", ":"))
+
+
+def _strict(node: Any) -> Any:
+    if isinstance(node, list):
+        return [_strict(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    out = {}
+    for key, value in node.items():
+        if key in ("properties", "$defs"):
+            # keys here are field/definition names, not schema keywords
+            out[key] = {name: _strict(body) for name, body in value.items()}
+        elif key not in _DROPPED_KEYS:
+            out[key] = _strict(value)
+    if out.get("type") == "object" and "properties" in out:
+        out["required"] = list(out["properties"])
+        out["additionalProperties"] = False
+    return out
+
+
+def strict_schema_for(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Minimized strict-mode version of a JSON schema."""
+    return _strict(schema)
+
+
+def _aliases(names: Iterable[str]) -> Dict[str, str]:
+    """Short, unique aliases: initials of the words (body_type -> bt), numbered on collision."""
+    aliases: Dict[str, str] = {}
+    for name in names:
+        initials = "".join(word[0] for word in name.split("_") if word)
+        alias, n = initials, 2
+        while alias in aliases.values():
+            alias, n = f"{initials}{n}", n + 1
+        aliases[name] = alias
+    return aliases
+
+
+@lru_cache(maxsize=None)
+def _alias_map(names: Tuple[str, ...]) -> Dict[str, str]:
+    return _aliases(names)
+
+
+def _compact(node: Any) -> Any:
+    if isinstance(node, list):
+        return [_compact(item) for item in node]
+    if not isinstance(node, dict):
+        return node
+    out = {k: _compact(v) for k, v in node.items()}
+    if "properties" in node:
+        aliases = _alias_map(tuple(node["properties"]))
+        out["properties"] = {}
+        for name, body in node["properties"].items():
+            prop = _compact(body)
+            # the full name is the only hint the model gets about what an alias means
+            prop["description"] = name
+            out["properties"][aliases[name]] = prop
+        if "required" in node:
+            out["required"] = [aliases[name] for name in node["required"]]
+    return out
+
+
+def compact_schema_for(strict: Dict[str, Any]) -> Dict[str, Any]:
+    """The strict schema with every property renamed to its short alias."""
+    return _compact(copy.deepcopy(strict))
+
+
+def expand_aliases(data: Any, schema: Dict[str, Any]) -> Any:
+    """Maps an answer in the compact format back to the field names of `schema` (the full, non-compact one)."""
+    defs = schema.get("$defs", {})
+
+    def resolve(node: Dict[str, Any]) -> Dict[str, Any]:
+        while "$ref" in node:
+            node = defs[node["$ref"].rsplit("/", 1)[-1]]
+        return node
+
+    def walk(value: Any, node: Dict[str, Any]) -> Any:
+        node = resolve(node)
+        if isinstance(value, dict):
+            if "anyOf" in node:
+                objects = [resolve(n) for n in node["anyOf"] if "properties" in resolve(n)]
+                node = objects[0] if objects else node
+            if "properties" in node:
+                reverse = {alias: name for name, alias in _alias_map(tuple(node["properties"])).items()}
+                return {reverse.get(k, k): walk(v, node["properties"].get(reverse.get(k, k), {}))
+                        for k, v in value.items()}
+            return value
+        if isinstance(value, list):
+            if "anyOf" in node:
+                arrays = [resolve(n) for n in node["anyOf"] if resolve(n).get("type") == "array"]
+                node = arrays[0] if arrays else node
+            return [walk(item, node.get("items", {})) for item in value]
+        return value
+
+    return walk(data, schema)
+
+
+def estimate_output_tokens(schema: Dict[str, Any], string_tokens: int = STRING_TOKENS,
+                           array_items: int = ARRAY_ITEMS) -> int:
+    """Worst-case number of tokens of a compact JSON document matching `schema`."""
+    defs = schema.get("$defs", {})
+
+    def size(node: Dict[str, Any]) -> int:
+        if "$ref" in node:
+            return size(defs[node["$ref"].rsplit("/", 1)[-1]])
+        if "anyOf" in node:
+            return max(size(option) for option in node["anyOf"])
+        kind = node.get("type")
+        if kind == "object":
+            # braces, plus for each property its quoted key, colon and comma
+            return 2 + sum(math.ceil(len(key) / 4) + 3 + size(body)
+                           for key, body in node.get("properties", {}).items())
+        if kind == "array":
+            items = node.get("maxItems", array_items)
+            return 2 + items * (size(node.get("items", {})) + 1)
+        if kind == "string":
+            if "enum" in node:
+                return 2 + max(math.ceil(len(str(v)) / 3) for v in node["enum"])
+            return 2 + string_tokens
+        if kind in ("integer", "number"):
+            return NUMBER_TOKENS
+        return 2  # null, boolean
+
+    return size(schema)
+
+
+def max_tokens_for(schema: Dict[str, Any]) -> int:
+    estimate = math.ceil(estimate_output_tokens(schema) * TOKEN_MARGIN)
+    return max(MIN_MAX_TOKENS, min(MAX_MAX_TOKENS, estimate))
+
+
+def with_more_tokens(spec: RequestSpec) -> Optional[RequestSpec]:
+    """`spec` with twice the max_tokens, to retry an answer that stopped at the limit
+    (finish_reason "length", e.g. a listing with more notices than ARRAY_ITEMS); None at MAX_MAX_TOKENS."""
+    if spec.max_tokens >= MAX_MAX_TOKENS:
+        return None
+    return replace(spec, max_tokens=min(MAX_MAX_TOKENS, spec.max_tokens * 2))
+
+
+@lru_cache(maxsize=None)
+def build_request(model: Type[BaseModel], name: str = "car_listing", compact: bool = False) -> RequestSpec:
+    """The response_format and max_tokens for extracting `model`, computed once per model."""
+    strict = strict_schema_for(model_schema(model))
+    schema = compact_schema_for(strict) if compact else strict
+    return RequestSpec(
+        response_format={
+            "type": "json_schema",
+            "json_schema": {"name": name, "strict": True, "schema": schema},
+        },
+        max_tokens=max_tokens_for(schema),
+        compact=compact,
+    )
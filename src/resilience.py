@@ -0,0 +1,289 @@
+"""
+Resilience layer for calls to the Azure OpenAI endpoint.
+
+Each call gets an overall deadline and a per-attempt timeout, transient errors
+are retried with exponential backoff and full jitter (honouring Retry-After),
+an AIMD limiter shrinks the number of concurrent calls when the endpoint
+throttles, and a circuit breaker fails fast while the endpoint is unhealthy.
+"""
+import asyncio
+import email.utils
+import random
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Optional, Tuple, TypeVar
+
+import metrics
+
+T = TypeVar("T")
+
+
+class ExtractionError(ValueError):
+    """Base class of extraction failures (a ValueError, as extract_listing has always raised)."""
+
+
+class RetryableExtractionError(ExtractionError):
+    """Transient failure (throttling, timeouts, 5xx, connection errors); trying again later may succeed."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class PermanentExtractionError(ExtractionError):
+    """Failure that will repeat for the same input (bad request, auth, invalid output)."""
+
+
+class CircuitOpenError(RetryableExtractionError):
+    """The endpoint is considered unhealthy and calls are being rejected without trying."""
+
+
+_RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        parsed = email.utils.parsedate_to_datetime(value)
+        return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+def classify_error(error: Exception) -> Tuple[bool, Optional[float]]:
+    """Returns (retryable, retry_after seconds) for an exception raised by the OpenAI client."""
+    if isinstance(error, RetryableExtractionError):
+        return True, error.retry_after
+    if isinstance(error, ExtractionError):
+        return False, None
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True, None
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in _RETRYABLE_STATUS or status >= 500, _retry_after(error)
+    try:
+        import openai
+    except ImportError:
+        return False, None
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True, None
+    return False, None
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Args:
+        max_attempts (int): Attempts per call, including the first one
+        base_delay (float): Backoff before the second attempt, doubled after each one
+        max_delay (float): Cap on a single backoff
+        attempt_timeout (float): Timeout of a single attempt, in seconds
+        deadline (float): Overall time budget of a call, retries included
+    """
+    max_attempts: int = 4
+    base_delay: float = 0.5
+    max_delay: float = 20.0
+    attempt_timeout: float = 20.0
+    deadline: float = 45.0
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff after `attempt` failed, never shorter than Retry-After."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on concurrent calls: grows by one per `limit` successes and halves on throttling.
+
+    Args:
+        initial (int): Starting limit
+        minimum (int): The limit never drops below this
+        maximum (int): The limit never grows above this
+    """
+
+    def __init__(self, initial: int = 16, minimum: int = 1, maximum: int = 64):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        # event loop -> [condition, calls in flight]; the limit is shared, the slots belong to their loop,
+        # so the limiter survives repeated asyncio.run() calls without mixing up their counts
+        self._loops: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, list]" = weakref.WeakKeyDictionary()
+        self._loops_lock = threading.Lock()
+
+    @property
+    def in_flight(self) -> int:
+        with self._loops_lock:
+            return sum(state[1] for state in self._loops.values())
+
+    def _state(self) -> list:
+        loop = asyncio.get_running_loop()
+        with self._loops_lock:
+            state = self._loops.get(loop)
+            if state is None:
+                state = self._loops[loop] = [asyncio.Condition(), 0]
+            return state
+
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        """Wait for a free slot; raises asyncio.TimeoutError after `timeout` seconds."""
+        state = self._state()
+        async with state[0]:
+            await asyncio.wait_for(state[0].wait_for(lambda: state[1] < int(self.limit)), timeout)
+            state[1] += 1
+
+    async def release(self) -> None:
+        state = self._state()
+        async with state[0]:
+            state[1] -= 1
+            state[0].notify_all()
+
+    async def __aenter__(self) -> "AdaptiveConcurrencyLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.release()
+
+    def on_success(self) -> None:
+        self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def on_throttle(self) -> None:
+        self.limit = max(self.minimum, self.limit / 2)
+        metrics.inc("llm_throttled_total")
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive transient failures and rejects calls
+    for `recovery_timeout` seconds; then lets one trial call through (half-open)
+    and closes again if it succeeds.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+
+    def allow(self) -> None:
+        """Raises CircuitOpenError when the call must not be attempted."""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                raise CircuitOpenError("Azure OpenAI endpoint is unavailable (circuit open)",
+                                       retry_after=self.recovery_timeout - (time.monotonic() - self.opened_at))
+            self._set_state(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self._trial_running:
+                raise CircuitOpenError("Azure OpenAI endpoint is unavailable (circuit half-open)")
+            self._trial_running = True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._trial_running = False
+        if self.state != self.CLOSED:
+            self._set_state(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._trial_running = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            if self.state != self.OPEN:
+                self._set_state(self.OPEN)
+
+    def release(self) -> None:
+        """End a trial call that neither proved nor disproved the endpoint's health."""
+        self._trial_running = False
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        metrics.inc("circuit_transitions_total", to=state)
+
+
+class ResilientCaller:
+    """Runs an async call under the retry policy, the adaptive limiter and the circuit breaker."""
+
+    def __init__(self, policy: Optional[RetryPolicy] = None, limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.policy = policy or RetryPolicy()
+        self.limiter = limiter or AdaptiveConcurrencyLimiter()
+        self.breaker = breaker or CircuitBreaker()
+
+    async def call(self, fn: Callable[[float], Awaitable[T]]) -> T:
+        """
+        Calls `fn(timeout)` until it succeeds, fails permanently, or the deadline passes.
+
+        Raises RetryableExtractionError or PermanentExtractionError (CircuitOpenError
+        when the breaker rejects the call) with the last error as the cause.
+        """
+        policy = self.policy
+        deadline = time.monotonic() + policy.deadline
+        attempt = 0
+        while True:
+            attempt += 1
+            self.breaker.allow()
+            try:
+                # waiting for a slot counts against the deadline too
+                await self.limiter.acquire(timeout=deadline - time.monotonic())
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except asyncio.TimeoutError as e:
+                self.breaker.release()
+                raise RetryableExtractionError("Deadline passed waiting for a free LLM call slot") from e
+            timeout = min(policy.attempt_timeout, deadline - time.monotonic())
+            if timeout <= 0:
+                await self.limiter.release()
+                self.breaker.release()
+                raise RetryableExtractionError("Deadline passed before the LLM call could start")
+            try:
+                try:
+                    result = await asyncio.wait_for(fn(timeout), timeout)
+                finally:
+                    # freed before any backoff sleep
+                    await self.limiter.release()
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError) and timeout < policy.attempt_timeout:
+                    # cut short by the deadline, which says nothing about the endpoint's health
+                    self.breaker.release()
+                    raise RetryableExtractionError("Deadline passed during the LLM call") from e
+                retryable, retry_after = classify_error(e)
+                if not retryable:
+                    # the endpoint answered, so it is healthy even if the request was bad
+                    self.breaker.record_success()
+                    raise PermanentExtractionError(str(e) or type(e).__name__) from e
+                self.breaker.record_failure()
+                if getattr(e, "status_code", None) == 429:
+                    self.limiter.on_throttle()
+                delay = policy.backoff(attempt, retry_after)
+                if attempt >= policy.max_attempts or time.monotonic() + delay >= deadline:
+                    raise RetryableExtractionError(str(e) or type(e).__name__, retry_after) from e
+                metrics.inc("llm_retries_total", reason=str(getattr(e, "status_code", None) or type(e).__name__))
+                await asyncio.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.limiter.on_success()
+            return result
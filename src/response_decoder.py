@@ -0,0 +1,153 @@
+"""
+Decoding of LLM answers into validated models, and JSON (de)serialization.
+
+The fast path hands the raw answer straight to pydantic-core's JSON parser
+(`model_validate_json`), with no regex scan and no intermediate dict. The tolerant
+path (extract the outermost {...}, drop trailing commas) only runs when the answer
+is not valid JSON as is. orjson is used for the plain JSON helpers when installed.
+IncrementalJSONParser reads a streamed answer and reports values as they complete.
+"""
+import json
+import re
+from typing import Any, List, Tuple, Type, TypeVar, Union
+
+from pydantic import BaseModel, ValidationError
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+M = TypeVar("M", bound=BaseModel)
+
+_OBJECT_RE = re.compile(r"\{.*\}", re.DOTALL)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_STRING_TAIL_RE = re.compile(r'(?:[^"\\]|\\.)*"', re.DOTALL)   # rest of a string up to its closing quote
+_SCALAR_END_RE = re.compile(r"[\s,}\]]")
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """json.loads, through orjson when available."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """UTF-8 JSON of `obj`; `indent` pretty-prints it with 2 spaces."""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def repair_json(raw: Union[str, bytes]) -> Any:
+    """Tolerant decoding: take the outermost {...} of the text and drop trailing commas if needed.
+
+    Raises json.JSONDecodeError (orjson's error is a subclass) when nothing can be parsed."""
+    if isinstance(raw, bytes):
+        raw = raw.decode("utf-8", errors="replace")
+    match = _OBJECT_RE.search(raw)
+    json_str = match.group(0) if match else raw
+    try:
+        return loads(json_str)
+    except json.JSONDecodeError:
+        return loads(_TRAILING_COMMA_RE.sub(r"\1", json_str))
+
+
+def decode_model(raw: Union[str, bytes], model: Type[M]) -> M:
+    """
+    Parse and validate an LLM answer in one step.
+
+    Raises pydantic.ValidationError when the JSON does not fit `model`, and
+    json.JSONDecodeError when the answer is not JSON even after repair.
+    """
+    try:
+        return model.model_validate_json(raw)
+    except ValidationError as e:
+        if any(error["type"] != "json_invalid" for error in e.errors()):
+            raise
+    return model.model_validate(repair_json(raw))
+
+
+class _Frame:
+    __slots__ = ("start", "is_array", "key", "expect_key")
+
+    def __init__(self, start: int, is_array: bool):
+        self.start = start
+        self.is_array = is_array
+        self.key: Any = 0 if is_array else None
+        self.expect_key = not is_array
+
+
+class IncrementalJSONParser:
+    """
+    Parses one JSON document fed in pieces (e.g. streamed tokens), reporting every
+    value as soon as it is complete, with the path of keys/indexes leading to it.
+
+        parser = IncrementalJSONParser()
+        parser.feed('{"car": {"brand": "Fo')   # []
+        parser.feed('rd", "model": ')          # [(("car", "brand"), "Ford")]
+
+    Text before the opening brace (e.g. a ``` fence) and after the closing one is
+    ignored. Raises json.JSONDecodeError on malformed input.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._stack: List[_Frame] = []
+        self.done = False
+
+    def _path(self) -> Tuple[Any, ...]:
+        return tuple(frame.key for frame in self._stack)
+
+    def feed(self, chunk: str) -> List[Tuple[Tuple[Any, ...], Any]]:
+        """Add `chunk` and return the (path, value) of every value it completed, innermost first."""
+        self._buf += chunk
+        buf, i, stack = self._buf, self._pos, self._stack
+        events = []
+        while i < len(buf) and not self.done:
+            c = buf[i]
+            if not stack:
+                if c == "{":  # the answer is an object; anything before it is chatter
+                    stack.append(_Frame(i, False))
+                i += 1
+            elif c in "{[":
+                stack.append(_Frame(i, c == "["))
+                i += 1
+            elif c in " \t\r\n:":
+                i += 1
+            elif c == ",":
+                top = stack[-1]
+                if top.is_array:
+                    top.key += 1
+                else:
+                    top.expect_key = True
+                i += 1
+            elif c in "}]":
+                frame = stack.pop()
+                events.append((self._path(), loads(buf[frame.start:i + 1])))
+                self.done = not stack
+                i += 1
+            elif c == '"':
+                match = _STRING_TAIL_RE.match(buf, i + 1)
+                if match is None:
+                    break  # the string goes on in the next chunk
+                value = json.loads(buf[i:match.end()])
+                top = stack[-1]
+                if top.expect_key:
+                    top.key, top.expect_key = value, False
+                else:
+                    events.append((self._path(), value))
+                i = match.end()
+            else:
+                # number, true, false or null: complete once a delimiter follows it
+                match = _SCALAR_END_RE.search(buf, i)
+                if match is None:
+                    break
+                events.append((self._path(), json.loads(buf[i:match.start()])))
+                i = match.start()
+        self._pos = i
+        return events
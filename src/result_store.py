@@ -0,0 +1,270 @@
+"""
+Append-only stores of extracted listings, for analytics and dedup checks.
+
+Listings are validated as CarListing, flattened to one row per car (brand,
+model, year, price, ... as columns, `notices` kept as a nested list) and
+written in batches:
+
+* SQLiteResultStore: one table with indexes on brand, model, year and price;
+  stdlib only, good for point queries.
+* ParquetResultStore: a directory of Parquet part files, one per flushed batch;
+  needs pyarrow, good for scans over millions of rows.
+
+    with open_store("listings.db") as store:
+        store.append(listing, listing_id="feed-42")
+    rows = list(SQLiteResultStore("listings.db").query(brand="Toyota", year_from=2018))
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+from schema import CarListing
+
+# (column, SQLite type) of a flattened listing, in storage order
+COLUMNS = (
+    ("listing_id", "TEXT"),
+    ("extracted_at", "REAL"),
+    ("brand", "TEXT"),
+    ("model", "TEXT"),
+    ("manufactured_year", "INTEGER"),
+    ("body_type", "TEXT"),
+    ("color", "TEXT"),
+    ("motor_size_cc", "INTEGER"),
+    ("windows", "TEXT"),
+    ("tire_type", "TEXT"),
+    ("tire_year", "INTEGER"),
+    ("price_amount", "INTEGER"),
+    ("price_currency", "TEXT"),
+    ("notices", "TEXT"),  # JSON list in SQLite, list<struct> in Parquet
+)
+COLUMN_NAMES = tuple(name for name, _ in COLUMNS)
+INDEXED_COLUMNS = ("brand", "model", "manufactured_year", "price_amount")
+
+Listing = Union[CarListing, Dict[str, Any]]
+
+
+def flatten(listing: Listing, listing_id: Optional[str] = None,
+            extracted_at: Optional[float] = None) -> Dict[str, Any]:
+    """Validate a listing and turn it into one row of COLUMNS (notices stay a list of dicts)."""
+    if not isinstance(listing, CarListing):
+        listing = CarListing.model_validate(listing)
+    car = listing.car
+    return {
+        "listing_id": listing_id,
+        "extracted_at": extracted_at if extracted_at is not None else time.time(),
+        "brand": car.brand,
+        "model": car.model,
+        "manufactured_year": car.manufactured_year,
+        "body_type": car.body_type,
+        "color": car.color,
+        "motor_size_cc": car.motor_size_cc,
+        "windows": car.windows,
+        "tire_type": car.tires.type if car.tires else None,
+        "tire_year": car.tires.manufactured_year if car.tires else None,
+        "price_amount": car.price.amount if car.price else None,
+        "price_currency": car.price.currency if car.price else None,
+        "notices": [notice.model_dump() for notice in car.notices],
+    }
+
+
+def unflatten(row: Dict[str, Any]) -> Dict[str, Any]:
+    """The CarListing dict of a stored row."""
+    notices = row["notices"]
+    if isinstance(notices, str):
+        notices = json.loads(notices)
+    return {"car": {
+        "body_type": row["body_type"],
+        "color": row["color"],
+        "brand": row["brand"],
+        "model": row["model"],
+        "manufactured_year": row["manufactured_year"],
+        "motor_size_cc": row["motor_size_cc"],
+        "tires": ({"type": row["tire_type"], "manufactured_year": row["tire_year"]}
+                  if row["tire_type"] is not None else None),
+        "windows": row["windows"],
+        "notices": notices or [],
+        "price": ({"amount": row["price_amount"], "currency": row["price_currency"]}
+                  if row["price_amount"] is not None else None),
+    }}
+
+
+class _BufferedStore:
+    """Buffers appended rows and hands them to `_write` in batches of `batch_size`."""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self._buffer: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def append(self, listing: Listing, listing_id: Optional[str] = None) -> None:
+        """Validate and buffer one listing; a full buffer is written out."""
+        row = flatten(listing, listing_id)
+        with self._lock:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def extend(self, listings: Iterable[Listing]) -> None:
+        for listing in listings:
+            self.append(listing)
+
+    def flush(self) -> None:
+        """Write out whatever is buffered."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._buffer:
+            rows, self._buffer = self._buffer, []
+            self._write(rows)
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class SQLiteResultStore(_BufferedStore):
+    """
+    Listings in one SQLite table, indexed on brand, model, manufactured_year and price_amount.
+
+    Args:
+        path (str): Database file
+        batch_size (int): Rows buffered before they are inserted in one transaction
+    """
+
+    def __init__(self, path: str, batch_size: int = 500):
+        super().__init__(batch_size)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS listings ({', '.join(f'{n} {t}' for n, t in COLUMNS)})")
+        for column in INDEXED_COLUMNS:
+            # text filters compare case-insensitively, so their indexes use the same collation
+            collate = " COLLATE NOCASE" if dict(COLUMNS)[column] == "TEXT" else ""
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS listings_{column} ON listings ({column}{collate})")
+        self._db.commit()
+        self._insert = (f"INSERT INTO listings ({', '.join(COLUMN_NAMES)}) "
+                        f"VALUES ({', '.join('?' for _ in COLUMN_NAMES)})")
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        with self._db:
+            self._db.executemany(self._insert, (
+                tuple(json.dumps(row[n], separators=(",", ":")) if n == "notices" else row[n] for n in COLUMN_NAMES)
+                for row in rows
+            ))
+
+    def query(self, brand: Optional[str] = None, model: Optional[str] = None,
+              year_from: Optional[int] = None, year_to: Optional[int] = None,
+              price_min: Optional[int] = None, price_max: Optional[int] = None,
+              limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Rows matching every given filter; brand and model compare case-insensitively."""
+        clauses, params = [], []
+        for column, op, value in (("brand", "=", brand), ("model", "=", model),
+                                  ("manufactured_year", ">=", year_from), ("manufactured_year", "<=", year_to),
+                                  ("price_amount", ">=", price_min), ("price_amount", "<=", price_max)):
+            if value is not None:
+                clauses.append(f"{column} {op} ? COLLATE NOCASE" if isinstance(value, str) else f"{column} {op} ?")
+                params.append(value)
+        sql = "SELECT * FROM listings"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        self.flush()
+        for row in self._db.execute(sql, params):
+            yield dict(row)
+
+    def read_batches(self, batch_size: int = 10_000) -> Iterator[List[Dict[str, Any]]]:
+        """Every stored row, in insertion order, `batch_size` rows at a time."""
+        self.flush()
+        cursor = self._db.execute("SELECT * FROM listings ORDER BY rowid")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [dict(row) for row in rows]
+
+    def count(self) -> int:
+        self.flush()
+        return self._db.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def close(self) -> None:
+        if self._db is not None:
+            super().close()
+            self._db.close()
+            self._db = None
+
+
+class ParquetResultStore(_BufferedStore):
+    """
+    Listings in a directory of Parquet files, one `part-<n>.parquet` per flushed batch.
+
+    Part files are written under a temporary name and renamed, so readers never see
+    a partial file. Requires pyarrow.
+
+    Args:
+        directory (str): Where the part files go (created if missing)
+        batch_size (int): Rows per part file
+    """
+
+    def __init__(self, directory: str, batch_size: int = 50_000):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("ParquetResultStore needs pyarrow (pip install pyarrow)") from e
+        super().__init__(batch_size)
+        self._pa, self._pq = pa, pq
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        notice = pa.struct([("type", pa.string()), ("description", pa.string())])
+        types = {"TEXT": pa.string(), "INTEGER": pa.int64(), "REAL": pa.float64()}
+        self.schema = pa.schema([(name, pa.list_(notice) if name == "notices" else types[kind])
+                                 for name, kind in COLUMNS])
+        parts = [name for name in os.listdir(directory) if name.startswith("part-") and name.endswith(".parquet")]
+        self._next_part = max((int(name[5:-8]) for name in parts), default=-1) + 1
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        table = self._pa.Table.from_pylist(rows, schema=self.schema)
+        name = f"part-{self._next_part:06d}.parquet"
+        tmp = os.path.join(self.directory, f".{name}.tmp")  # dot files are skipped by readers
+        self._pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, os.path.join(self.directory, name))
+        self._next_part += 1
+
+    def read(self, columns: Optional[List[str]] = None, where: Any = None):
+        """Stored rows as one pyarrow Table, e.g.
+        `store.read(["brand", "price_amount"], pyarrow.compute.field("manufactured_year") >= 2018)`."""
+        import pyarrow.dataset as ds
+        self.flush()
+        dataset = ds.dataset(self.directory, format="parquet", schema=self.schema)
+        return dataset.to_table(columns=columns, filter=where)
+
+    def read_batches(self, batch_size: int = 10_000) -> Iterator[List[Dict[str, Any]]]:
+        """Every stored row, `batch_size` rows at a time."""
+        import pyarrow.dataset as ds
+        self.flush()
+        dataset = ds.dataset(self.directory, format="parquet", schema=self.schema)
+        for batch in dataset.to_batches(batch_size=batch_size):
+            yield batch.to_pylist()
+
+
+def open_store(path: str, batch_size: Optional[int] = None) -> Union[SQLiteResultStore, ParquetResultStore]:
+    """A SQLite store for *.db / *.sqlite paths, a Parquet directory otherwise."""
+    kwargs = {"batch_size": batch_size} if batch_size else {}
+    if path.endswith((".db", ".sqlite", ".sqlite3")):
+        return SQLiteResultStore(path, **kwargs)
+    return ParquetResultStore(path, **kwargs)
@@ -0,0 +1,219 @@
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Deterministic, regex/gazetteer based extraction of the "easy" Car fields.
+# Every value comes with a confidence in [0, 1] so callers can decide whether
+# the LLM is still needed.
+
+KNOWN_MAKES = [
+    "Alfa Romeo", "Aston Martin", "Audi", "BMW", "BYD", "Cadillac", "Chery", "Chevrolet",
+    "Chrysler", "Citroen", "Daewoo", "Daihatsu", "Dodge", "Fiat", "Ford", "Geely", "GMC",
+    "Honda", "Hyundai", "Infiniti", "Isuzu", "Jaguar", "Jeep", "Kia", "Lada", "Land Rover",
+    "Lexus", "Mazda", "Mercedes-Benz", "Mercedes", "MG", "Mini", "Mitsubishi", "Nissan",
+    "Opel", "Peugeot", "Porsche", "Proton", "Renault", "Seat", "Skoda", "Subaru", "Suzuki",
+    "Tesla", "Toyota", "Volkswagen", "Volvo",
+]
+
+# makes that are also everyday words ("a torn seat", "mini scratches"): only taken when
+# capitalized as a name, and only trusted when one of their models follows
+DICTIONARY_WORD_MAKES = {"Dodge", "Jeep", "Mini", "Seat"}
+
+# popular models per make; a listed model is trusted, any other word after the make is a guess
+KNOWN_MODELS = {
+    "Chevrolet": ["Aveo", "Cruze", "Lanos", "Optra", "Captiva", "Spark"],
+    "Daewoo": ["Juliet", "Lanos", "Nubira", "Matiz", "Leganza", "Cielo"],
+    "Dodge": ["Charger", "Challenger", "Durango", "Ram", "Neon"],
+    "Fiat": ["128", "Tipo", "Punto", "Shahin", "Uno", "500"],
+    "Ford": ["Fusion", "Focus", "Fiesta", "Mustang", "Escort", "Explorer"],
+    "Honda": ["Civic", "Accord", "City", "CR-V", "Jazz"],
+    "Hyundai": ["Elantra", "Accent", "Verna", "Tucson", "i10", "Santa Fe"],
+    "Jeep": ["Wrangler", "Grand Cherokee", "Cherokee", "Compass", "Renegade"],
+    "Kia": ["Cerato", "Rio", "Picanto", "Sportage", "Sorento"],
+    "Mini": ["Cooper", "Countryman", "Clubman", "Paceman"],
+    "Mitsubishi": ["Lancer", "Pajero", "Attrage", "Eclipse"],
+    "Nissan": ["Sunny", "Sentra", "Qashqai", "Juke", "Tiida"],
+    "Peugeot": ["301", "308", "508", "2008", "3008", "405"],
+    "Renault": ["Logan", "Megane", "Duster", "Clio", "Fluence"],
+    "Seat": ["Ibiza", "Leon", "Toledo", "Arona", "Ateca"],
+    "Skoda": ["Octavia", "Fabia", "Superb", "Kodiaq"],
+    "Toyota": ["Corolla", "Camry", "Yaris", "Land Cruiser", "Fortuner", "Hilux", "RAV4"],
+    "Volkswagen": ["Golf", "Passat", "Jetta", "Polo", "Tiguan"],
+}
+
+COLORS = [
+    "black", "white", "silver", "gray", "grey", "red", "blue", "green", "yellow", "orange",
+    "brown", "beige", "gold", "maroon", "navy", "purple", "bronze", "champagne",
+]
+
+# fields the LLM must not be skipped for, and the confidence below which a local value is not trusted
+REQUIRED_FIELDS = ("brand", "model", "manufactured_year", "price")
+MIN_CONFIDENCE = 0.7
+
+_MAKE_RE = re.compile(
+    r"\b(" + "|".join(re.escape(m) for m in sorted(KNOWN_MAKES, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE,
+)
+_MAKES_BY_LOWER = {m.lower(): m for m in KNOWN_MAKES}
+_MODEL_WORD_RE = re.compile(r"\s+([A-Za-z0-9][\w-]*(?:\s+[A-Z][\w-]*)?)")
+_COLOR_RE = re.compile(r"\b(" + "|".join(COLORS) + r")\b", re.IGNORECASE)
+
+_YEAR_RE = re.compile(r"\b(19[5-9]\d|20[0-4]\d)\b")
+_YEAR_ANCHOR_RE = re.compile(
+    r"\b(?:produced|manufactured|made|built|model|year|registered)\b(?:\s+\w+){0,2}\s*$", re.IGNORECASE
+)
+_TIRE_CONTEXT_RE = re.compile(r"\btires?\b|\btyres?\b", re.IGNORECASE)
+
+_LITERS_RE = re.compile(r"\b(\d(?:\.\d)?)\s*-?\s*(?:l|liters?|litres?)\b", re.IGNORECASE)
+_CC_RE = re.compile(r"\b(\d{3,4})\s*-?\s*cc\b", re.IGNORECASE)
+
+_PRICE_RE = re.compile(
+    r"(?P<prefix>\$|usd|egp)?\s*"
+    r"(?P<amount>\d{1,3}(?:,\d{3})+|\d+(?:\.\d+)?)\s*"
+    r"(?P<scale>k\b|thousand\b|m\b|million\b|mil\b)?\s*"
+    r"(?P<currency>l\.e\.?|le\b|egp\b|usd\b|\$|dollars?\b|eur\b|euros?\b)?",
+    re.IGNORECASE,
+)
+# only words that name the asking price; "for"/"sold" also precede fines, deposits and rents
+_PRICE_ANCHOR_RE = re.compile(r"\b(?:price[ds]?|priced|asking)\b[^.\d]*$", re.IGNORECASE)
+_RATE_RE = re.compile(r"\s*(?:per|a|an|/)\s*(?:hour|day|week|month|year|km|mile)\b", re.IGNORECASE)
+_SCALES = {"k": 1_000, "thousand": 1_000, "m": 1_000_000, "million": 1_000_000, "mil": 1_000_000}
+_CURRENCIES = {"l.e": "L.E", "le": "L.E", "egp": "EGP", "usd": "USD", "$": "USD",
+               "dollar": "USD", "dollars": "USD", "eur": "EUR", "euro": "EUR", "euros": "EUR"}
+# smallest amount that is plausibly the price of a car; smaller ones are left to the LLM
+_MIN_CAR_PRICE = {"L.E": 10_000, "EGP": 10_000, "USD": 500, "EUR": 500}
+
+
+@dataclass
+class PreExtraction:
+    """Locally extracted Car fields with a confidence per field."""
+    fields: Dict[str, Any] = field(default_factory=dict)
+    confidence: Dict[str, float] = field(default_factory=dict)
+
+    def set(self, name: str, value: Any, confidence: float) -> None:
+        if value is not None and confidence > self.confidence.get(name, 0.0):
+            self.fields[name] = value
+            self.confidence[name] = confidence
+
+    def resolved(self, min_confidence: float = MIN_CONFIDENCE) -> Dict[str, Any]:
+        """Fields whose confidence reaches `min_confidence`."""
+        return {k: v for k, v in self.fields.items() if self.confidence[k] >= min_confidence}
+
+    def missing(self, required: Iterable[str] = REQUIRED_FIELDS,
+                min_confidence: float = MIN_CONFIDENCE) -> List[str]:
+        """Required fields that are absent or below `min_confidence`."""
+        resolved = self.resolved(min_confidence)
+        return [name for name in required if name not in resolved]
+
+
+def _sentence_before(text: str, index: int) -> str:
+    start = max(text.rfind(".", 0, index - 1), text.rfind("\n", 0, index)) + 1
+    return text[start:index]
+
+
+def _known_model(text: str, end: int, brand: str) -> Tuple[Optional[str], Optional[str]]:
+    """(known model of `brand`, words) right after position `end`; either is None when absent."""
+    following = _MODEL_WORD_RE.match(text, end)
+    if not following:
+        return None, None
+    candidate = following.group(1)
+    for known in KNOWN_MODELS.get(brand, []):
+        if candidate.lower() == known.lower() or candidate.lower().startswith(known.lower() + " "):
+            return known, candidate
+    return None, candidate
+
+
+def _extract_brand_and_model(text: str, result: PreExtraction) -> None:
+    makes, weak = {}, {}
+    for m in _MAKE_RE.finditer(text):
+        brand = _MAKES_BY_LOWER[m.group(1).lower()]
+        if brand not in DICTIONARY_WORD_MAKES or _known_model(text, m.end(), brand)[0]:
+            makes.setdefault(brand, m)
+        elif m.group(1) in (brand, brand.upper()):
+            weak.setdefault(brand, m)
+    if makes:
+        brand, match = next(iter(makes.items()))
+        result.set("brand", brand, 0.95 if len(makes) == 1 else 0.5)
+    elif weak:
+        # a capitalized "Seat"/"Mini" alone may still be a sentence start: left for the LLM to confirm
+        brand, match = next(iter(weak.items()))
+        result.set("brand", brand, 0.5)
+        return
+    else:
+        return
+
+    known, candidate = _known_model(text, match.end(), brand)
+    if known:
+        result.set("model", known, 0.9)
+    elif candidate:
+        first_word = candidate.split()[0]
+        if first_word[0].isupper() or first_word[0].isdigit():
+            result.set("model", first_word, 0.6)
+
+
+def _extract_year(text: str, result: PreExtraction) -> None:
+    candidates = []
+    for m in _YEAR_RE.finditer(text):
+        context = _sentence_before(text, m.start())
+        if _TIRE_CONTEXT_RE.search(context):
+            continue
+        anchored = bool(_YEAR_ANCHOR_RE.search(context)) or bool(_MAKE_RE.match(text, m.end() + 1))
+        candidates.append((anchored, int(m.group(1))))
+    anchored = [year for is_anchored, year in candidates if is_anchored]
+    if anchored:
+        result.set("manufactured_year", anchored[0], 0.9 if len(set(anchored)) == 1 else 0.6)
+    elif candidates:
+        result.set("manufactured_year", candidates[0][1], 0.75 if len(candidates) == 1 else 0.4)
+
+
+def _extract_motor_size(text: str, result: PreExtraction) -> None:
+    m = _CC_RE.search(text)
+    if m:
+        result.set("motor_size_cc", int(m.group(1)), 0.9)
+        return
+    m = _LITERS_RE.search(text)
+    if m:
+        result.set("motor_size_cc", int(round(float(m.group(1)) * 1000)), 0.85)
+
+
+def _extract_price(text: str, result: PreExtraction) -> None:
+    candidates = []
+    for m in _PRICE_RE.finditer(text):
+        currency = m.group("currency") or m.group("prefix")
+        if not currency or _RATE_RE.match(text, m.end()):
+            continue
+        amount = float(m.group("amount").replace(",", ""))
+        if m.group("scale"):
+            amount *= _SCALES[m.group("scale").lower()]
+        code = _CURRENCIES[currency.lower().rstrip(".")]
+        anchored = bool(_PRICE_ANCHOR_RE.search(_sentence_before(text, m.start())))
+        candidates.append((anchored, amount >= _MIN_CAR_PRICE[code], {"amount": int(amount), "currency": code}))
+    anchored = [price for is_anchored, plausible, price in candidates if is_anchored and plausible]
+    plausible = [price for _, is_plausible, price in candidates if is_plausible]
+    if anchored:
+        result.set("price", anchored[0], 0.9 if all(p == anchored[0] for p in anchored) else 0.6)
+    elif plausible:
+        result.set("price", plausible[0], 0.75 if all(p == plausible[0] for p in plausible) else 0.5)
+    elif candidates:  # "3 le of damages": a currency amount, but too small to be the car's price
+        result.set("price", candidates[0][2], 0.4)
+
+
+def _extract_color(text: str, result: PreExtraction) -> None:
+    colors = []
+    for m in _COLOR_RE.finditer(text):
+        color = m.group(1).capitalize()
+        if color not in colors:
+            colors.append(color)
+    if colors:
+        result.set("color", colors[0], 0.85 if len(colors) == 1 else 0.5)
+
+
+def pre_extract(text: str) -> PreExtraction:
+    """Extract brand, model, year, motor size, price and color from a (sanitized) description."""
+    result = PreExtraction()
+    _extract_brand_and_model(text, result)
+    _extract_year(text, result)
+    _extract_motor_size(text, result)
+    _extract_price(text, result)
+    _extract_color(text, result)
+    return result
@@ -0,0 +1,132 @@
+import re
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+
+# All patterns are compiled once at import. The passes run in the same order as
+# the original regex chain, so the output is identical to it: a pass can rebuild
+# a phrase a later pass removes (e.g. "ignjavascript:ore previous"), never one an
+# earlier pass already went over.
+#   1. strip ```code blocks```, then <tags>
+#   2. strip script schemes
+#   3. strip each prompt-injection phrase, one rule after another
+# The greedy `start .* end` rules are resolved by looking up the last `end` word
+# on the same line instead of letting the regex engine backtrack, so every pass
+# stays linear.
+
+_SCHEME_RE = re.compile(r"javascript:|data:|vbscript:", re.IGNORECASE)
+
+# (start word, last end word on the line) rules and plain phrases, in the original order
+_INJECTION_RULES: List[Tuple[re.Pattern, Optional[re.Pattern]]] = [
+    (re.compile(r"\bignore\b", re.I), re.compile(r"\b(?:instruction|previous)\b", re.I)),
+    (re.compile(r"\b(?:system|assistant|user|prompt)\s*:", re.I), None),
+    (re.compile(r"\bforget\b", re.I), re.compile(r"\b(?:everything|instructions)\b", re.I)),
+    (re.compile(r"\bnew\b", re.I), re.compile(r"\binstructions\b", re.I)),
+    (re.compile(r"\byou\s+are\s+now\b", re.I), None),
+    (re.compile(r"\boverride\b", re.I), re.compile(r"\brules?\b", re.I)),
+    (re.compile(r"\bdisregard\b", re.I), re.compile(r"\binstructions?\b", re.I)),
+    (re.compile(r"\bpretend\b", re.I), re.compile(r"\b(?:system|assistant)\b", re.I)),
+]
+
+_ENCODED_RE = re.compile(r"[A-Za-z0-9+/=]{100,}")
+
+
+def _strip_delimited(text: str, opener: str, closer: str) -> str:
+    """Remove every `opener ... closer` (non-greedy, possibly multi-line) in one left-to-right pass."""
+    if opener not in text:
+        return text
+    out: List[str] = []
+    pos = 0
+    while True:
+        start = text.find(opener, pos)
+        if start == -1:
+            break
+        close = text.find(closer, start + len(opener))
+        if close == -1:
+            break  # no closer left, so no later opener can match either
+        out.append(text[pos:start])
+        pos = close + len(closer)
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def _strip_tags(text: str) -> str:
+    """Remove <tags> (`<[^>]+>`): a `<` directly followed by `>` is not a tag."""
+    if "<" not in text:
+        return text
+    out: List[str] = []
+    pos = search = 0
+    while True:
+        start = text.find("<", search)
+        if start == -1:
+            break
+        if text.startswith(">", start + 1):
+            search = start + 1
+            continue
+        close = text.find(">", start + 1)
+        if close == -1:
+            break
+        out.append(text[pos:start])
+        pos = search = close + 1
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def _strip_markup(text: str) -> str:
+    """Remove ```code blocks```, then <tags>."""
+    return _strip_tags(_strip_delimited(text, "```", "```"))
+
+
+def _strip_span(text: str, start_re: re.Pattern, end_re: re.Pattern) -> str:
+    """Same as re.sub(start + r".*" + end, "", text): from each start word to the last end word on its line."""
+    out: List[str] = []
+    pos = search = 0
+    # line end -> last end-word match on that line after the first start word, computed once per line
+    last_end: Dict[int, Optional[Tuple[int, int]]] = {}
+    while True:
+        m = start_re.search(text, search)
+        if m is None:
+            break
+        line_end = text.find("\n", m.end())
+        if line_end == -1:
+            line_end = len(text)
+        if line_end not in last_end:
+            found = None
+            for found in end_re.finditer(text, m.end(), line_end):
+                pass
+            last_end[line_end] = found.span() if found else None
+
+        span = last_end[line_end]
+        if span is None or span[0] < m.end():
+            search = m.end()
+            continue
+        out.append(text[pos:m.start()])
+        pos = search = span[1]
+
+    out.append(text[pos:])
+    return "".join(out)
+
+
+def _strip_injections(text: str) -> str:
+    """Remove script schemes, then each prompt-injection phrase."""
+    text = _SCHEME_RE.sub("", text)
+    for start_re, end_re in _INJECTION_RULES:
+        text = start_re.sub("", text) if end_re is None else _strip_span(text, start_re, end_re)
+    return text
+
+
+def sanitize_text(text: str) -> str:
+    """Sanitization to prevent prompt injection attempts."""
+
+    # this normalizes Unicode (prevents homoglyph / spacing attacks); ASCII is already normalized
+    if not text.isascii():
+        text = unicodedata.normalize("NFKC", text)
+
+    text = _strip_markup(text)
+    text = _strip_injections(text)
+
+    # Block suspicious encodings (base64 or long gibberish strings)
+    if _ENCODED_RE.search(text):
+        raise ValueError("Potential encoded or malicious payload detected")
+
+    # Collapse whitespace and trim
+    return " ".join(text.split())
@@ -1,120 +1,765 @@
-import re
 import json
-from typing import Any, Dict
-import unicodedata
-from openai import AsyncAzureOpenAI
-from schema import CarListing
+import time
+import asyncio
+import importlib.util
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional, Tuple, Type, Union
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, create_model
+from schema import Car, CarListing
 from config import settings
+from extraction_cache import ExtractionCache, make_cache_key
+from sanitizer import sanitize_text  # re-exported: callers import it from here
+from rule_extractor import REQUIRED_FIELDS, pre_extract
+from prompt_builder import (RequestSpec, build_request, expand_aliases, model_schema, schema_fingerprint,
+                            with_more_tokens)
+from response_decoder import IncrementalJSONParser, decode_model, loads, repair_json
+import metrics
+from resilience import (AdaptiveConcurrencyLimiter, CircuitBreaker, PermanentExtractionError,
+                        ResilientCaller, RetryableExtractionError, RetryPolicy, classify_error)
 
-client = AsyncAzureOpenAI(
-    api_key=settings.AZURE_OPENAI_API_KEY,
-    api_version=settings.AZURE_OPENAI_API_VERSION,
-    azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
-)
-
-# simple implementation to Prevent Prompt Injection
-def sanitize_text(text: str) -> str:
-    """Sanitization to prevent prompt injection attempts."""
+# Azure OpenAI client, built on first use by get_client(); tests and benchmarks may assign their own.
+# The openai SDK is imported there too: it accounts for most of this module's import time.
+client = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+_client_lock = threading.Lock()
 
-    # this normalizes Unicode (prevents homoglyph / spacing attacks)
-    text = unicodedata.normalize("NFKC", text)
 
-    # Removes code blocks, HTML tags, and script-like content
-    text = re.sub(r"```.*?```", "", text, flags=re.S)   # Code blocks
-    text = re.sub(r"<[^>]+>", "", text)                 # HTML/XML tags
-    text = re.sub(r"(?:javascript:|data:|vbscript:)", "", text, flags=re.I)
+def _build_client():
+    import httpx
+    from openai import AsyncAzureOpenAI, DefaultAsyncHttpxClient
 
-    # Remove common prompt injection patterns (expanded & stricter)
-    injection_patterns = [
-        r"\bignore\b.*\b(instruction|previous)\b",
-        r"\b(system|assistant|user|prompt)\s*:",
-        r"\bforget\b.*\b(everything|instructions)\b",
-        r"\bnew\b.*\binstructions\b",
-        r"\byou\s+are\s+now\b",
-        r"\boverride\b.*\brules?\b",
-        r"\bdisregard\b.*\binstructions?\b",
-        r"\bpretend\b.*\b(system|assistant)\b",
-    ]
-    for pattern in injection_patterns:
-        text = re.sub(pattern, "", text, flags=re.IGNORECASE)
+    settings.validate()
+    http_client = DefaultAsyncHttpxClient(
+        # HTTP/2 multiplexes concurrent requests over one connection; needs the h2 package
+        http2=settings.LLM_HTTP2 and importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONCURRENCY,
+            max_keepalive_connections=settings.LLM_MAX_CONCURRENCY,
+            keepalive_expiry=settings.LLM_KEEPALIVE_SECONDS,
+        ),
+    )
+    return AsyncAzureOpenAI(
+        api_key=settings.AZURE_OPENAI_API_KEY,
+        api_version=settings.AZURE_OPENAI_API_VERSION,
+        azure_endpoint=settings.AZURE_OPENAI_ENDPOINT,
+        max_retries=0,  # retries are handled by llm_caller
+        http_client=http_client,
+    )
 
-    # Block suspicious encodings (base64 or long gibberish strings)
-    if re.search(r"[A-Za-z0-9+/=]{100,}", text):
-        raise ValueError("Potential encoded or malicious payload detected")
 
-    # Collapse whitespace and trim length
-    text = re.sub(r"\s+", " ", text).strip()
+def get_client():
+    """The process-wide Azure OpenAI client, created (and the settings validated) on first use.
 
-    # Enforce max length (to prevent long injection attempts), we could use when needed
-    # MAX_LEN = 2000
-    # if len(text) > MAX_LEN:
-    #     text = text[:MAX_LEN]
+    Pooled connections belong to the event loop that opened them, so the client is
+    rebuilt when the loop it was first used on has been closed (e.g. after asyncio.run)."""
+    global client, _client_loop
+    if client is not None and (_client_loop is None or not _client_loop.is_closed()):
+        return client
+    with _client_lock:
+        if client is None or (_client_loop is not None and _client_loop.is_closed()):
+            client = _build_client()
+            try:
+                _client_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                _client_loop = None
+    return client
 
-    return text
 
+# deadlines, retries, throttling-aware concurrency and circuit breaking for every LLM call
+llm_caller = ResilientCaller(
+    RetryPolicy(
+        max_attempts=settings.LLM_MAX_ATTEMPTS,
+        attempt_timeout=settings.LLM_ATTEMPT_TIMEOUT_SECONDS,
+        deadline=settings.LLM_DEADLINE_SECONDS,
+    ),
+    AdaptiveConcurrencyLimiter(initial=min(16, settings.LLM_MAX_CONCURRENCY), maximum=settings.LLM_MAX_CONCURRENCY),
+    CircuitBreaker(settings.LLM_CIRCUIT_FAILURE_THRESHOLD, settings.LLM_CIRCUIT_RECOVERY_SECONDS),
+)
 
 SYSTEM_PROMPT = """
 You are a car‑listing information extractor. Extract ONLY the information needed to fill the JSON schema. 
 Do not add explanations. Use `null` for unknown fields.
 """
 
-async def extract_listing(user_text: str) -> Dict[str, Any]:
-    """Extract car listing information from user text"""
+TEMPERATURE = 0.3
+
+OUTPUT_FORMATS = ("dict", "model", "json")
+
+PACKED_SYSTEM_PROMPT = SYSTEM_PROMPT + """Each line of the input is a separate listing prefixed with its id in brackets, e.g. `[0]`.
+Return one item per listing with that id, extracting each listing only from its own line.
+"""
+
+TOKEN_BUCKETS = (100, 200, 400, 800, 1600, 3200, 6400)
+PACK_BUCKETS = (1, 2, 4, 8, 16, 32)
+COST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01)
+
+# results cache shared by every call; swap it (or disable it with None) via set_cache()
+cache: Optional[ExtractionCache] = ExtractionCache()
+
+
+def set_cache(new_cache: Optional[ExtractionCache]) -> None:
+    """Replace the extraction cache, e.g. with one backed by SQLite, or pass None to disable caching."""
+    global cache
+    cache = new_cache
+
+
+# near-duplicate descriptions reuse an earlier listing instead of calling the LLM; off unless
+# NEAR_DUPLICATE_THRESHOLD is set (near_duplicate pulls in numpy, so it is only imported then)
+near_duplicates = None
+if settings.NEAR_DUPLICATE_THRESHOLD > 0:
+    from near_duplicate import NearDuplicateIndex
+    near_duplicates = NearDuplicateIndex(settings.NEAR_DUPLICATE_THRESHOLD,
+                                         sqlite_path=settings.NEAR_DUPLICATE_SQLITE_PATH)
+
+
+def set_near_duplicate_index(index) -> None:
+    """Replace the near-duplicate index (a near_duplicate.NearDuplicateIndex), or pass None to disable it."""
+    global near_duplicates
+    near_duplicates = index
+
+
+def _reuse_near_duplicate(sanitized: str, stored: Dict[str, Any]) -> CarListing:
+    """The stored listing of a near-duplicate description, with the fields the rules can read
+    from this description (price, year, motor size, ...) taken from it instead."""
+    car = dict(stored["car"])
+    car.update(pre_extract(sanitized).resolved())
+    return _validate_model({"car": car})
+
+
+def cache_key_for(sanitized: str) -> str:
+    """Cache key for an already-sanitized description under the current prompt, schema and model."""
+    return make_cache_key(
+        sanitized,
+        SYSTEM_PROMPT,
+        schema_fingerprint(CarListing),
+        settings.AZURE_OPENAI_DEPLOYMENT,
+        TEMPERATURE,
+    )
+
+
+def record_usage(usage: Any) -> None:
+    """Record token counts and estimated cost of one completion (`response.usage`)."""
+    if usage is None or not metrics.registry.enabled:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    cost = (prompt_tokens * settings.LLM_INPUT_COST_PER_1K_TOKENS
+            + completion_tokens * settings.LLM_OUTPUT_COST_PER_1K_TOKENS) / 1000
+    metrics.inc("llm_tokens_total", prompt_tokens, kind="prompt")
+    metrics.inc("llm_tokens_total", completion_tokens, kind="completion")
+    metrics.observe("llm_request_tokens", prompt_tokens + completion_tokens, buckets=TOKEN_BUCKETS)
+    metrics.inc("llm_cost_usd_total", cost)
+    metrics.observe("llm_request_cost_usd", cost, buckets=COST_BUCKETS)
+
+
+def parse_json_response(raw_response: Union[str, bytes]) -> Dict[str, Any]:
+    """Pull the JSON object out of the model's reply, repairing trailing commas if needed."""
+    return repair_json(raw_response)
+
+
+async def _request_text(sanitized: str, spec: RequestSpec, system_prompt: str) -> str:
+    """Send one extraction request and return the raw content of the answer.
+
+    An answer cut off at max_tokens is requested again with a larger budget."""
+
+    llm_client = get_client()
+
+    async def attempt(timeout: float):
+        with metrics.span("llm_request"):
+            return await llm_client.chat.completions.create(
+                model=settings.AZURE_OPENAI_DEPLOYMENT,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": sanitized},
+                ],
+                temperature=TEMPERATURE,
+                max_tokens=spec.max_tokens,
+                response_format=spec.response_format,
+                timeout=timeout,
+            )
+
+    try:
+        while True:
+            response = await llm_caller.call(attempt)
+            record_usage(getattr(response, "usage", None))
+            choice = response.choices[0]
+            larger = with_more_tokens(spec) if getattr(choice, "finish_reason", None) == "length" else None
+            if larger is None:
+                break
+            metrics.inc("llm_length_retries_total")
+            spec = larger  # read by attempt() on the next call
+        raw_response = choice.message.content
+
+        if not raw_response:
+            raise ValueError("Empty response from OpenAI")
+        return raw_response
+        
+    except RetryableExtractionError as e:
+        raise type(e)(f"Failed to extract car information: {str(e)}", e.retry_after) from e
+    except Exception as e:
+        raise PermanentExtractionError(f"Failed to extract car information: {str(e)}") from e
+
+
+async def _request_json(sanitized: str, model: Type[BaseModel], name: str = "car_listing",
+                        system_prompt: str = SYSTEM_PROMPT) -> Dict[str, Any]:
+    """Ask the LLM to fill `model`'s schema from the sanitized text and return the parsed JSON.
+
+    With LLM_COMPACT_OUTPUT the model answers with short key aliases, which are
+    expanded back to the field names here."""
+    spec = build_request(model, name, compact=settings.LLM_COMPACT_OUTPUT)
+    raw_response = await _request_text(sanitized, spec, system_prompt)
+    try:
+        with metrics.span("parse_json"):
+            parsed = parse_json_response(raw_response)
+    except json.JSONDecodeError as e:
+        raise PermanentExtractionError(f"Invalid JSON returned: {e}\nRaw: {raw_response}")
+    if spec.compact:
+        parsed = expand_aliases(parsed, model_schema(model))
+    return parsed
+
+
+async def _request_listing(sanitized: str) -> CarListing:
+    """Ask the LLM for a full CarListing, decoding its answer straight into the model."""
+    if settings.LLM_COMPACT_OUTPUT:
+        # aliased keys have to be expanded on a dict first
+        return _validate_model(await _request_json(sanitized, CarListing))
+    raw_response = await _request_text(sanitized, build_request(CarListing), SYSTEM_PROMPT)
+    try:
+        with metrics.span("decode"):
+            return decode_model(raw_response, CarListing)
+    except json.JSONDecodeError as e:
+        raise PermanentExtractionError(f"Invalid JSON returned: {e}\nRaw: {raw_response}")
+    except ValidationError as e:
+        raise PermanentExtractionError(f"Failed to extract car information: {str(e)}")
+
+
+def _validate_model(parsed_json: Dict[str, Any]) -> CarListing:
+    try:
+        with metrics.span("validate"):
+            return CarListing.model_validate(parsed_json)
+    except Exception as e:
+        raise PermanentExtractionError(f"Failed to extract car information: {str(e)}")
+
+
+def _validate_listing(parsed_json: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate using Pydantic and return a plain dict."""
+    return _validate_model(parsed_json).model_dump()
+
+
+def _render(listing: CarListing, output: str, data: Optional[str] = None) -> Any:
+    """`listing` in the requested output form; `data` is its JSON when already serialized."""
+    if output == "model":
+        return listing
+    if output == "json":
+        return data.encode("utf-8") if data is not None else listing.model_dump_json().encode("utf-8")
+    return listing.model_dump()
+
+
+@lru_cache(maxsize=64)
+def _partial_listing_model(fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """A CarListing variant whose `car` only has the given fields, used to shrink the prompt."""
+    car_fields = {name: (Car.model_fields[name].annotation, Car.model_fields[name]) for name in fields}
+    partial_car = create_model("Car", __config__=ConfigDict(extra="forbid"), **car_fields)
+    return create_model("CarListing", car=(partial_car, ...))
+
+
+async def _extract_local_first(sanitized: str, use_llm: bool = True) -> CarListing:
+    """Fill the easy fields locally and only ask the LLM for the rest when required fields are unresolved.
+
+    Without `use_llm` (or when the LLM is unavailable and LLM_FALLBACK_LOCAL is set) the
+    listing is built from the rule-based values alone."""
+    resolved = pre_extract(sanitized).resolved()
+    car: Dict[str, Any] = {name: None for name in Car.model_fields}
+    car["notices"] = []
+
+    if use_llm and any(name not in resolved for name in REQUIRED_FIELDS):
+        wanted = tuple(name for name in Car.model_fields if name not in resolved)
+        model = _partial_listing_model(wanted)
+        try:
+            parsed_json = await _request_json(sanitized, model)
+        except RetryableExtractionError:
+            if not settings.LLM_FALLBACK_LOCAL:
+                raise
+            metrics.inc("llm_fallback_total")
+        else:
+            try:
+                car.update(model.model_validate(parsed_json).car.model_dump())
+            except Exception as e:
+                raise PermanentExtractionError(f"Failed to extract car information: {str(e)}")
+
+    car.update(resolved)
+    return _validate_model({"car": car})
+
+
+async def extract_listing(user_text: str, local_first: bool = False, output: str = "dict") -> Any:
+    """
+    Extract car listing information from user text
+
+    With `local_first`, brand, model, year, motor size, price and color are pulled
+    out with rules first; the LLM is then only asked for the remaining fields, and
+    skipped entirely when all of rule_extractor.REQUIRED_FIELDS were resolved.
+
+    `output` selects the result type: "dict" (default), "model" for a CarListing, or
+    "json" for compact UTF-8 JSON bytes that can be written or mailed without
+    serializing again.
+
+    Raises RetryableExtractionError when the LLM call failed transiently (throttling,
+    timeouts, 5xx, open circuit) and PermanentExtractionError otherwise; both are
+    ValueErrors.
+    """
+    if output not in OUTPUT_FORMATS:
+        raise ValueError(f"output must be one of {OUTPUT_FORMATS}")
+
     # Sanitize input to prevent prompt injection
-    sanitized = sanitize_text(user_text)
+    with metrics.span("sanitize"):
+        sanitized = sanitize_text(user_text)
     
     # Validate that we have meaningful content after sanitization
     if len(sanitized.strip()) < 10:
         raise ValueError("Text too short or contains no meaningful content after sanitization")
-    
+
+    key = None
+    if cache is not None:
+        key = cache_key_for(sanitized)
+        cached = cache.get_json(key)
+        metrics.inc("extraction_cache_requests_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            if output == "json":
+                return cached.encode("utf-8")
+            if output == "model":
+                return CarListing.model_validate_json(cached)
+            return loads(cached)
+
+    if near_duplicates is not None:
+        match = near_duplicates.query(sanitized)
+        metrics.inc("near_duplicate_requests_total", result="miss" if match is None else "hit")
+        if match is not None:
+            return _render(_reuse_near_duplicate(sanitized, match.value), output)
+
+    if local_first:
+        # mixes rule-based values in, so it is not stored under the full-extraction key
+        return _render(await _extract_local_first(sanitized), output)
+
     try:
-        response = await client.chat.completions.create(
-            model=settings.AZURE_OPENAI_DEPLOYMENT,
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": sanitized},
-            ],
-            temperature=0.3,
-            max_tokens=800,
-            response_format={
-                "type": "json_schema",
-                "json_schema": {
-                    "name": "car_listing",
-                    "schema": CarListing.model_json_schema()
-                }
-            }
-        )
-        
-        raw_response = response.choices[0].message.content
-        
-        if not raw_response:
-            raise ValueError("Empty response from OpenAI")
-        
-        # Clean and extract JSON
-        raw_response = raw_response.strip()
-        
-        # Try to extract JSON from the response
-        json_match = re.search(r'\{.*\}', raw_response, re.DOTALL)
-        if json_match:
-            json_str = json_match.group()
-        else:
-            json_str = raw_response
-        
-        # Parse JSON
-        try:
-            parsed_json = json.loads(json_str)
-        except json.JSONDecodeError:
-            # Clean common JSON issues and retry
-            json_str = re.sub(r',\s*}', '}', json_str)  # Remove trailing commas
-            json_str = re.sub(r',\s*]', ']', json_str)  # Remove trailing commas in arrays
-            parsed_json = json.loads(json_str)
-        
-        # Validate using Pydantic
-        validated = CarListing(**parsed_json)
-        return validated.dict()
-        
+        listing = await _request_listing(sanitized)
+    except RetryableExtractionError:
+        if not settings.LLM_FALLBACK_LOCAL:
+            raise
+        # the endpoint is throttled or down: serve what the rules can extract
+        metrics.inc("llm_fallback_total")
+        return _render(await _extract_local_first(sanitized, use_llm=False), output)
+    data = None
+    if key is not None:
+        data = listing.model_dump_json()
+        cache.set_json(key, data)
+    if near_duplicates is not None:
+        near_duplicates.add(sanitized, listing.model_dump())
+    return _render(listing, output, data)
+
+
+# ---- Streaming extraction
+
+@dataclass
+class ListingEvent:
+    """One step of stream_listing: a completed `car` field (`name`, raw JSON `value`),
+    or, last, the validated listing in the requested output form (`done`)."""
+    name: Optional[str]
+    value: Any
+    done: bool = False
+
+
+async def _stream_text(sanitized: str, spec: RequestSpec, system_prompt: str = SYSTEM_PROMPT,
+                       finish_reasons: Optional[List[str]] = None) -> AsyncIterator[str]:
+    """Send one extraction request with stream=True and yield the answer's text deltas.
+    The choices' finish_reason values are appended to `finish_reasons`.
+
+    Opening the stream and reading its first chunk go through llm_caller (retries,
+    limiter, circuit breaker), so a throttled or failed request is retried before
+    anything reached the caller; the rest of the answer must arrive within
+    LLM_DEADLINE_SECONDS."""
+    llm_client = get_client()
+
+    async def attempt(timeout: float):
+        with metrics.span("llm_request"):
+            stream = await llm_client.chat.completions.create(
+                model=settings.AZURE_OPENAI_DEPLOYMENT,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": sanitized},
+                ],
+                temperature=TEMPERATURE,
+                max_tokens=spec.max_tokens,
+                response_format=spec.response_format,
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout,
+            )
+            chunks = stream.__aiter__()
+            try:
+                first = await chunks.__anext__()
+            except StopAsyncIteration:
+                raise ValueError("Empty response from OpenAI")
+            return stream, chunks, first
+
+    try:
+        stream, chunks, chunk = await llm_caller.call(attempt)
+    except RetryableExtractionError as e:
+        raise type(e)(f"Failed to extract car information: {str(e)}", e.retry_after) from e
+    except Exception as e:
+        raise PermanentExtractionError(f"Failed to extract car information: {str(e)}") from e
+
+    deadline = time.monotonic() + settings.LLM_DEADLINE_SECONDS
+    try:
+        while True:
+            record_usage(getattr(chunk, "usage", None))
+            for choice in chunk.choices or ():
+                if getattr(choice, "finish_reason", None) and finish_reasons is not None:
+                    finish_reasons.append(choice.finish_reason)
+                if choice.delta.content:
+                    yield choice.delta.content
+            try:
+                chunk = await asyncio.wait_for(chunks.__anext__(), deadline - time.monotonic())
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError as e:
+                raise RetryableExtractionError("Failed to extract car information: the answer timed out") from e
+            except Exception as e:
+                retryable, retry_after = classify_error(e)
+                if retryable:
+                    raise RetryableExtractionError(f"Failed to extract car information: {str(e)}", retry_after) from e
+                raise PermanentExtractionError(f"Failed to extract car information: {str(e)}") from e
+    finally:
+        # also runs when the consumer stops early, so the connection goes back to the pool
+        if hasattr(stream, "close"):
+            await stream.close()
+
+
+def _listing_events(listing: CarListing, output: str) -> List[ListingEvent]:
+    car = listing.car.model_dump()
+    return [ListingEvent(name, value) for name, value in car.items()] + [ListingEvent(None, _render(listing, output), True)]
+
+
+async def stream_listing(user_text: str, output: str = "dict") -> AsyncIterator[ListingEvent]:
+    """
+    Extract a listing like extract_listing, yielding each `car` field as soon as
+    the model has generated it, e.g. to show brand and model (or start a lookup
+    on them) before the answer is complete.
+
+    Field values are unvalidated JSON; the last event (`done=True`) carries the
+    listing validated against CarListing, rendered as `output`. Cached and
+    near-duplicate listings are replayed field by field at once. The request
+    always uses the full field names (LLM_COMPACT_OUTPUT does not apply), so the
+    fields can be reported without waiting for the whole answer.
+
+        async for event in stream_listing(text):
+            if event.done:
+                listing = event.value
+            else:
+                print(event.name, event.value)
+    """
+    if output not in OUTPUT_FORMATS:
+        raise ValueError(f"output must be one of {OUTPUT_FORMATS}")
+    with metrics.span("sanitize"):
+        sanitized = sanitize_text(user_text)
+    if len(sanitized.strip()) < 10:
+        raise ValueError("Text too short or contains no meaningful content after sanitization")
+
+    key = None
+    if cache is not None:
+        key = cache_key_for(sanitized)
+        cached = cache.get_json(key)
+        metrics.inc("extraction_cache_requests_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            for event in _listing_events(CarListing.model_validate_json(cached), output):
+                yield event
+            return
+    if near_duplicates is not None:
+        match = near_duplicates.query(sanitized)
+        metrics.inc("near_duplicate_requests_total", result="miss" if match is None else "hit")
+        if match is not None:
+            for event in _listing_events(_reuse_near_duplicate(sanitized, match.value), output):
+                yield event
+            return
+
+    start = time.perf_counter()
+    spec = build_request(CarListing)
+    reported = set()  # fields already yielded, not repeated when a cut-off answer is requested again
+    while True:
+        parser: Optional[IncrementalJSONParser] = IncrementalJSONParser()
+        parts: List[str] = []
+        finish_reasons: List[str] = []
+        async for text in _stream_text(sanitized, spec, finish_reasons=finish_reasons):
+            parts.append(text)
+            if parser is None:
+                continue
+            try:
+                completed = parser.feed(text)
+            except json.JSONDecodeError:
+                parser = None  # malformed; the full answer still gets the tolerant decode below
+                continue
+            for path, value in completed:
+                if len(path) == 2 and path[0] == "car" and path[1] not in reported:
+                    if not reported:
+                        metrics.observe("llm_time_to_first_field_seconds", time.perf_counter() - start)
+                    reported.add(path[1])
+                    yield ListingEvent(path[1], value)
+        larger = with_more_tokens(spec) if "length" in finish_reasons else None
+        if larger is None:
+            break
+        metrics.inc("llm_length_retries_total")
+        spec = larger
+
+    raw_response = "".join(parts)
+    try:
+        with metrics.span("decode"):
+            listing = decode_model(raw_response, CarListing)
     except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON returned: {e}\nRaw: {raw_response}")
+        raise PermanentExtractionError(f"Invalid JSON returned: {e}\nRaw: {raw_response}")
+    except ValidationError as e:
+        raise PermanentExtractionError(f"Failed to extract car information: {str(e)}")
+    data = None
+    if key is not None:
+        data = listing.model_dump_json()
+        cache.set_json(key, data)
+    if near_duplicates is not None:
+        near_duplicates.add(sanitized, listing.model_dump())
+    yield ListingEvent(None, _render(listing, output, data), True)
+
+
+# ---- Batch extraction
+
+class TokenBucket:
+    """Async token-bucket limiter allowing `rate` requests per second, bursting up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and consume it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one item in a batch: either `result` or `error` is set."""
+    index: int
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+async def _extract_one(index: int, text: str, limiter: Optional[TokenBucket]) -> BatchResult:
+    try:
+        if limiter is not None:
+            await limiter.acquire()
+        return BatchResult(index=index, result=await extract_listing(text))
     except Exception as e:
-        raise ValueError(f"Failed to extract car information: {str(e)}")
-    
\ No newline at end of file
+        return BatchResult(index=index, error=e)
+
+
+async def iter_extract_listings(
+    texts: Iterable[str],
+    max_concurrency: int = 8,
+    rate_limit: Optional[float] = None,
+) -> AsyncIterator[BatchResult]:
+    """
+    Extract many listings concurrently, yielding results as they finish.
+
+    At most `max_concurrency` requests are in flight at once and `texts` is
+    consumed lazily, so arbitrarily long feeds can be streamed through.
+
+    Args:
+        texts: Car descriptions to extract
+        max_concurrency: Maximum number of simultaneous requests
+        rate_limit: Optional maximum requests per second
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+
+    limiter = TokenBucket(rate_limit) if rate_limit else None
+    items = enumerate(texts)
+    pending = set()
+
+    def fill() -> None:
+        for index, text in items:
+            pending.add(asyncio.ensure_future(_extract_one(index, text, limiter)))
+            if len(pending) >= max_concurrency:
+                return
+
+    fill()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.discard(task)
+                yield task.result()
+            fill()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def extract_listings_batch(
+    texts: Iterable[str],
+    max_concurrency: int = 8,
+    rate_limit: Optional[float] = None,
+) -> List[BatchResult]:
+    """Extract many listings concurrently and return the results in input order."""
+    results = [item async for item in iter_extract_listings(texts, max_concurrency, rate_limit)]
+    results.sort(key=lambda item: item.index)
+    return results
+
+
+# ---- Packed extraction: several short listings per LLM call
+
+class PackedListing(CarListing):
+    id: int
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of `text` (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+@lru_cache(maxsize=64)
+def _packed_model(size: int) -> Type[BaseModel]:
+    """Response model for a pack of `size` listings; maxItems lets max_tokens scale with the pack."""
+    return create_model("PackedListings", items=(List[PackedListing], Field(..., max_length=size)))
+
+
+def plan_packs(sizes: List[int], token_budget: int, max_items: int) -> List[List[int]]:
+    """Greedily group positions of `sizes` (token counts) into packs of at most `max_items`
+    whose total stays within `token_budget`; an item over the budget gets a pack of its own."""
+    packs: List[List[int]] = []
+    current: List[int] = []
+    used = 0
+    for position, size in enumerate(sizes):
+        if current and (used + size > token_budget or len(current) >= max_items):
+            packs.append(current)
+            current, used = [], 0
+        current.append(position)
+        used += size
+    if current:
+        packs.append(current)
+    return packs
+
+
+async def _extract_pack(texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """Extract a pack of sanitized texts in one call. Items the model dropped or got
+    wrong come back as None; a retryable failure of the call itself is raised."""
+    packed_input = "\n".join(f"[{i}] {text}" for i, text in enumerate(texts))
+    metrics.observe("packed_listings_per_request", len(texts), buckets=PACK_BUCKETS)
+    try:
+        parsed = await _request_json(packed_input, _packed_model(len(texts)), name="car_listings",
+                                     system_prompt=PACKED_SYSTEM_PROMPT)
+    except PermanentExtractionError:
+        return [None] * len(texts)
+
+    results: List[Optional[Dict[str, Any]]] = [None] * len(texts)
+    for item in parsed.get("items") or []:
+        if not isinstance(item, dict) or not isinstance(item.get("id"), int) or not 0 <= item["id"] < len(texts):
+            continue
+        try:
+            # validated one by one so a single bad item does not sink the pack
+            results[item["id"]] = _validate_listing({"car": item.get("car")})
+        except PermanentExtractionError:
+            pass
+    return results
+
+
+async def extract_listings_packed(
+    texts: Iterable[str],
+    token_budget: Optional[int] = None,
+    max_items: Optional[int] = None,
+    max_concurrency: int = 8,
+) -> List[BatchResult]:
+    """
+    Extract many short listings, several per LLM call, and return the results in input order.
+
+    Descriptions are sanitized, looked up in the cache, and the rest grouped into packs
+    that fit `token_budget` input tokens. Items a pack fails to return valid data for
+    are re-run individually with extract_listing.
+
+    Args:
+        texts: Car descriptions to extract
+        token_budget: Maximum estimated input tokens per pack (LLM_PACK_TOKEN_BUDGET)
+        max_items: Maximum listings per pack (LLM_PACK_MAX_ITEMS)
+        max_concurrency: Maximum number of simultaneous requests
+    """
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+    token_budget = token_budget or settings.LLM_PACK_TOKEN_BUDGET
+    max_items = max_items or settings.LLM_PACK_MAX_ITEMS
+
+    texts = list(texts)
+    results = [BatchResult(index=i) for i in range(len(texts))]
+    todo: List[Tuple[int, str, Optional[str]]] = []  # (index, sanitized, cache key)
+    for index, text in enumerate(texts):
+        try:
+            sanitized = sanitize_text(text)
+        except ValueError as e:  # e.g. an encoded payload: fails this item only
+            results[index].error = e
+            continue
+        if len(sanitized.strip()) < 10:
+            results[index].error = ValueError("Text too short or contains no meaningful content after sanitization")
+            continue
+        key = cache_key_for(sanitized) if cache is not None else None
+        cached = cache.get(key) if key is not None else None
+        if cache is not None:
+            metrics.inc("extraction_cache_requests_total", result="miss" if cached is None else "hit")
+        if cached is not None:
+            results[index].result = cached
+        else:
+            todo.append((index, sanitized, key))
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run_pack(pack: List[Tuple[int, str, Optional[str]]]) -> None:
+        async with semaphore:
+            try:
+                extracted = await _extract_pack([sanitized for _, sanitized, _ in pack])
+            except Exception as e:
+                for index, _, _ in pack:
+                    results[index].error = e
+                return
+        retries = []
+        for (index, sanitized, key), result in zip(pack, extracted):
+            if result is None:
+                retries.append(index)
+                continue
+            results[index].result = result
+            if key is not None:
+                cache.set(key, result)
+        if retries:
+            metrics.inc("packed_item_retries_total", value=len(retries))
+            await asyncio.gather(*(run_single(index) for index in retries))
+
+    async def run_single(index: int) -> None:
+        async with semaphore:
+            try:
+                results[index].result = await extract_listing(texts[index])
+            except Exception as e:
+                results[index].error = e
+
+    packs = plan_packs([estimate_tokens(sanitized) for _, sanitized, _ in todo], token_budget, max_items)
+    await asyncio.gather(*(run_pack([todo[i] for i in pack]) for pack in packs))
+    return results
@@ -1,15 +1,107 @@
 import streamlit as st
-from datetime import datetime
-from text_extractor import extract_listing
-from car_type_classifier import classify_car_type
-from gmail_sender import send_email_with_json_and_image   # <-- import your email sender
-import json
 import asyncio
+import hashlib
 import os
+import queue
+import tempfile
+from pipeline import BackgroundLoop, process_listing
+from gmail_sender import send_email_with_json_and_image   # <-- import your email sender
+from car_type_classifier import get_classifier
+from response_decoder import dumps, loads
+from job_queue import JobQueue
+from result_store import SQLiteResultStore
+from config import settings
+import text_extractor
 
 st.set_page_config(page_title="Car Listing Extractor", page_icon="🚗", layout="centered")
 st.title("🚗 Car Listing Extractor (MVP)")
-st.caption("Upload a car image + paste a description. We extract structured JSON from text and add car_type from a dummy classifier.")
+st.caption("Upload a car image + paste a description. We extract structured JSON from text and add the body type from an image classifier.")
+
+
+# ---- Shared resources (one per server process, shared by every session)
+@st.cache_resource
+def get_loop() -> BackgroundLoop:
+    """Event loop all sessions run their work on, so no session blocks on its own asyncio.run."""
+    return BackgroundLoop(name="ui-pipeline")
+
+
+@st.cache_resource
+def load_classifier():
+    return get_classifier()
+
+
+@st.cache_resource
+def load_llm_client():
+    # built on the shared loop, which never closes, so its pooled connections stay usable
+    async def build():
+        return text_extractor.get_client()
+    return get_loop().run(build())
+
+
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    return JobQueue(settings.JOB_QUEUE_PATH, visibility_timeout=settings.JOB_VISIBILITY_TIMEOUT_SECONDS,
+                    max_attempts=settings.JOB_MAX_ATTEMPTS)
+
+
+def _payload(result) -> dict:
+    """The parts of a pipeline result the page keeps: bytes only, no paths."""
+    with open(result.image.email_path, "rb") as f:
+        email_image = f.read()
+    return {
+        "listing": dumps(result.listing, indent=True),
+        "email_image": email_image,
+        "image_name": os.path.basename(result.image.email_path),
+        "timings": result.timings,
+    }
+
+
+@st.cache_data(show_spinner="Extracting the listing and classifying the image...", max_entries=512, ttl=3600)
+def extract(desc: str, image_hash: str, _image: bytes, _work_dir: str) -> dict:
+    """Runs the pipeline once per (description, image hash), for every session.
+
+    The result holds no paths, only bytes: the files in `_work_dir` belong to the
+    session that ran the extraction first and go away with it."""
+    load_llm_client()
+    load_classifier()
+    return _payload(get_loop().run(process_listing(_image, desc, cache_dir=_work_dir)))
+
+
+def count_stored(brand: str, model: str) -> int:
+    """Listings of this brand and model already in the result store (RESULT_STORE_PATH)."""
+    with SQLiteResultStore(settings.RESULT_STORE_PATH) as store:
+        return sum(1 for _ in store.query(brand=brand, model=model))
+
+
+def extract_streaming(desc: str, image: bytes, work_dir: str, placeholder) -> dict:
+    """Runs the pipeline with the car's fields shown in `placeholder` as the model generates them,
+    while the image is preprocessed and classified on the same loop.
+
+    As soon as brand and model are out, the result store is searched for the same
+    car, before the rest of the answer is generated. The finished listing lands in
+    the extraction cache, so the LLM is not asked again for the same description."""
+    load_llm_client()
+    load_classifier()
+    events = queue.Queue()
+    future = get_loop().submit(process_listing(image, desc, cache_dir=work_dir,
+                                               on_field=lambda name, value: events.put((name, value))))
+    future.add_done_callback(lambda _: events.put(None))
+    fields = {}
+    lookup = None
+    while (event := events.get()) is not None:
+        name, value = event
+        fields[name] = value
+        placeholder.code(dumps({"car": fields}, indent=True).decode("utf-8"), language="json")
+        if lookup is None and settings.RESULT_STORE_PATH and fields.get("brand") and fields.get("model"):
+            lookup = get_loop().submit(asyncio.to_thread(count_stored, fields["brand"], fields["model"]))
+    payload = _payload(future.result())  # raises the extraction error, if any
+    if lookup is not None:
+        try:
+            payload["stored"] = (fields["brand"], fields["model"], lookup.result())
+        except Exception as e:
+            print("❌ Result store lookup failed:", e)
+    return payload
+
 
 # ---- Inputs
 img_file = st.file_uploader("Car image", type=["jpg","jpeg","png"])
@@ -21,8 +113,11 @@ send_btn = st.button("📧 Send to Gmail", type="secondary", use_container_width
 # ---- State
 if "listing" not in st.session_state:
     st.session_state["listing"] = None
-if "image_path" not in st.session_state:
-    st.session_state["image_path"] = None
+if "image" not in st.session_state:
+    st.session_state["image"] = None
+if "work_dir" not in st.session_state:
+    # per-session scratch space, removed when the session (and its state) is dropped
+    st.session_state["work_dir"] = tempfile.TemporaryDirectory(prefix="car_ui_")
 
 
 def run_extraction():
@@ -34,28 +129,33 @@ def run_extraction():
         st.error("Please enter a description.")
         return
 
-    # ---- 1. Extract JSON from description
-    listing = asyncio.run(extract_listing(desc))
-
-    # ---- 2. Dummy car type classification
-    car_type = classify_car_type(img_file)
-
-    # ---- 3. Merge results (update inside car object)
-    if "car" in listing and isinstance(listing["car"], dict):
-        listing["car"]["body_type"] = car_type
-
-    # Save image temporarily to disk for email sending
-    image_path = f"temp_{img_file.name}"
-    with open(image_path, "wb") as f:
-        f.write(img_file.getbuffer())
+    # ---- 1. Extract JSON from the description while the image is preprocessed and classified
+    image = img_file.getvalue()
+    work_dir = st.session_state["work_dir"].name
+    preview = st.empty()
+    try:
+        if text_extractor.cache is not None:
+            # the extraction cache stands in for extract()'s cache, so the fields can be streamed
+            result = extract_streaming(desc, image, work_dir, preview)
+        else:
+            result = extract(desc, hashlib.sha256(image).hexdigest(), image, work_dir)
+    except Exception as e:
+        st.error(f"❌ Extraction failed: {e}")
+        return
+    finally:
+        preview.empty()
 
     # Save to session state
-    st.session_state["listing"] = listing
-    st.session_state["image_path"] = image_path
+    st.session_state["listing"] = result["listing"]
+    st.session_state["image"] = (result["email_image"], result["image_name"])
 
-    # ---- 4. Display final result
+    # ---- 2. Display final result
     st.subheader("Extracted JSON + Car Type")
-    st.code(json.dumps(listing, indent=2), language="json") 
+    st.code(result["listing"].decode("utf-8"), language="json")
+    st.caption(" · ".join(f"{stage}: {seconds * 1000:.0f} ms" for stage, seconds in result["timings"].items()))
+    if result.get("stored"):
+        brand, model, count = result["stored"]
+        st.info(f"📚 {count} earlier listing(s) of {brand} {model} in the result store.")
     st.success("Extraction complete! You can now send this data via Gmail.")
 
 
@@ -64,24 +164,38 @@ def run_sender():
     if not st.session_state["listing"]:
         st.error("No extracted listing found. Please extract JSON first.")
         return
-    if not st.session_state["image_path"]:
+    if not st.session_state["image"]:
         st.error("No image found. Please re-upload and extract first.")
         return
 
     try:
-        sender_email = ""
-        sender_password = "" 
-        recipient_email = ""
-        subject = "Car Listing Extracted Data"
-        body = json.dumps(st.session_state["listing"], indent=2)
-
-        send_email_with_json_and_image(sender_email=sender_email, 
-                                       sender_password=sender_password, 
-                                       recipient_email=recipient_email, 
-                                       extracted_json=body,
-                                       image_path= st.session_state["image_path"])
-
-        st.success(f"✅ Email sent successfully to {recipient_email}!")
+        sender_email = settings.SENDER_EMAIL or ""
+        sender_password = settings.SENDER_PASSWORD or ""
+        recipient_email = settings.RECIPIENT_EMAIL or ""
+        image, image_name = st.session_state["image"]
+
+        if settings.JOB_QUEUE_PATH:
+            # durable: survives a restart, and failed sends are retried by `job_queue.py work`
+            jobs = get_job_queue()
+            listing = st.session_state["listing"]
+            key = hashlib.sha256(listing + image + recipient_email.encode()).hexdigest()
+            job_id = jobs.enqueue({"listing": loads(listing), "image": jobs.spool(image, image_name),
+                                    "recipient": recipient_email}, idempotency_key=key, stage="email")
+            st.success(f"✅ Email queued for {recipient_email} (job {job_id}).")
+            return
+
+        with st.spinner("Sending..."):
+            result = send_email_with_json_and_image(sender_email=sender_email,
+                                                    sender_password=sender_password,
+                                                    recipient_email=recipient_email,
+                                                    extracted_json=st.session_state["listing"],
+                                                    image_path=image,
+                                                    image_name=image_name)
+
+        if result.success:
+            st.success(f"✅ Email sent successfully to {recipient_email}!")
+        else:
+            st.error(f"❌ Failed to send email after {result.attempts} attempt(s): {result.error}")
 
     except Exception as e:
         st.error(f"❌ Failed to send email: {e}")
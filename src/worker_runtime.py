@@ -0,0 +1,129 @@
+"""
+Process-pool runtime for the CPU-bound image stages.
+
+Preprocessing and body-type classification run in worker processes, so they
+neither block the event loop that drives the LLM calls nor compete for the GIL.
+Each worker loads the classifier once, when it starts. Uploaded image bytes reach
+the workers through a shared-memory block instead of being pickled into the task;
+paths are passed as is and read by the worker.
+
+    with ImageWorkerPool(max_workers=4) as workers:
+        result = await process_listing(image, text, workers=workers)
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, BinaryIO, Dict, Optional, Tuple, Union
+
+import metrics
+from config import settings
+import car_type_classifier
+from car_type_classifier import CarTypePrediction, classify_car_type
+from image_preprocessing import PreprocessedImage, preprocess_image
+
+WorkerResult = Tuple[PreprocessedImage, CarTypePrediction, Dict[str, float]]
+
+
+def _init_worker(classifier_threads: int) -> None:
+    # a forked worker inherits the parent's classifier (or its load error); load its own
+    car_type_classifier._classifier = None
+    car_type_classifier._classifier_error = None
+    # several processes share the cores, so each gets a small intra-op thread pool
+    settings.CAR_CLASSIFIER_THREADS = classifier_threads
+    car_type_classifier.get_classifier()
+
+
+def _run_job(source: Union[str, Tuple[str, int]], cache_dir: Optional[str]) -> WorkerResult:
+    """Worker side: preprocess and classify one image given by path or (shared memory name, size)."""
+    timings: Dict[str, float] = {"started_at": time.time()}
+    start = time.perf_counter()
+    if isinstance(source, tuple):
+        name, size = source
+        block = shared_memory.SharedMemory(name=name)
+        try:
+            with block.buf[:size] as view:
+                preprocessed = preprocess_image(view, cache_dir)
+        finally:
+            block.close()
+    else:
+        preprocessed = preprocess_image(source, cache_dir)
+    timings["preprocess"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    prediction = classify_car_type(preprocessed.thumbnail_path)
+    timings["classify"] = time.perf_counter() - start
+    return preprocessed, prediction, timings
+
+
+class ImageWorkerPool:
+    """
+    A ProcessPoolExecutor running preprocess + classify jobs.
+
+    Args:
+        max_workers (int): Worker processes, defaults to WORKER_PROCESSES (or the CPU count)
+        classifier_threads (int): ONNX Runtime intra-op threads in each worker
+        mp_context: multiprocessing context, e.g. multiprocessing.get_context("spawn")
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, classifier_threads: int = 1, mp_context: Any = None):
+        self.max_workers = max_workers or settings.WORKER_PROCESSES or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(self.max_workers, mp_context=mp_context,
+                                             initializer=_init_worker, initargs=(classifier_threads,))
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _track(self, delta: int) -> None:
+        with self._lock:
+            self._in_flight += delta
+            in_flight = self._in_flight
+        metrics.set_gauge("worker_queue_depth", max(0, in_flight - self.max_workers))
+        metrics.set_gauge("worker_jobs_in_flight", in_flight)
+
+    def stats(self) -> Dict[str, int]:
+        """Worker count, jobs submitted and not finished, and how many of them wait for a worker."""
+        with self._lock:
+            in_flight = self._in_flight
+        return {"workers": self.max_workers, "in_flight": in_flight, "queued": max(0, in_flight - self.max_workers)}
+
+    async def process(self, image: Union[str, bytes, BinaryIO], cache_dir: Optional[str] = None) -> WorkerResult:
+        """Preprocess and classify `image` in a worker; returns the derivatives, the prediction and
+        the stage timings (preprocess, classify, queue)."""
+        if not isinstance(image, (str, bytes, bytearray, memoryview)):
+            image = image.getvalue() if hasattr(image, "getvalue") else image.read()
+
+        block = None
+        if isinstance(image, str):
+            job: Union[str, Tuple[str, int]] = image
+        else:
+            data = memoryview(image)
+            block = shared_memory.SharedMemory(create=True, size=max(1, data.nbytes))
+            block.buf[:data.nbytes] = data
+            job = (block.name, data.nbytes)
+
+        submitted_at = time.time()
+        self._track(1)
+        try:
+            future = self._executor.submit(_run_job, job, cache_dir)
+            preprocessed, prediction, timings = await asyncio.wrap_future(future)
+        finally:
+            self._track(-1)
+            if block is not None:
+                block.close()
+                block.unlink()
+
+        timings["queue"] = max(0.0, timings.pop("started_at") - submitted_at)
+        metrics.observe("worker_queue_wait_seconds", timings["queue"])
+        metrics.inc("worker_jobs_total")
+        return preprocessed, prediction, timings
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def __enter__(self) -> "ImageWorkerPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
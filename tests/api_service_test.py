@@ -0,0 +1,163 @@
+import asyncio
+import io
+import json
+
+from PIL import Image
+
+import api_service
+import metrics
+from car_type_classifier import CarTypePrediction
+from gmail_sender import SendResult
+from resilience import RetryableExtractionError
+
+TEXT = "2018 Toyota Corolla, white, 1600cc, 650,000 EGP"
+
+
+def _jpeg() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8), "white").save(buffer, "JPEG")
+    return buffer.getvalue()
+
+
+async def _call(app, method, path, body=b"", headers=()):
+    """Sends one request straight to the ASGI app; returns (status, headers, body)."""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+             "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"content-type", b"application/json"), *headers], "client": ("test", 1), "server": ("test", 80)}
+    await app(scope, receive, send)
+    start = sent[0]
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in sent[1:])
+
+
+def test_identical_extractions_are_coalesced(monkeypatch):
+    calls = []
+
+    async def fake_extract(text, local_first=False, output="dict"):
+        calls.append(text)
+        await asyncio.sleep(0.05)
+        return json.dumps({"car": {"brand": "Toyota"}}).encode()
+
+    monkeypatch.setattr(api_service, "extract_listing", fake_extract)
+    app = api_service.create_app()
+
+    async def run():
+        body = json.dumps({"text": TEXT}).encode()
+        other = json.dumps({"text": TEXT + "  "}).encode()  # the same once sanitized
+        return await asyncio.gather(*[_call(app, "POST", "/extract", b) for b in [body] * 9 + [other]])
+
+    responses = asyncio.run(run())
+
+    assert len(calls) == 1
+    assert all(status == 200 and json.loads(body)["car"]["brand"] == "Toyota" for status, _, body in responses)
+
+
+def test_rejects_with_429_when_full(monkeypatch):
+    release = None
+
+    async def slow_extract(text, local_first=False, output="dict"):
+        await release.wait()
+        return b"{}"
+
+    monkeypatch.setattr(api_service, "extract_listing", slow_extract)
+    app = api_service.create_app(max_pending=2)
+
+    async def run():
+        nonlocal release
+        release = asyncio.Event()
+        busy = [asyncio.ensure_future(_call(app, "POST", "/extract", json.dumps({"text": f"{TEXT} {i}"}).encode()))
+                for i in range(2)]
+        await asyncio.sleep(0.01)
+        rejected = await _call(app, "POST", "/extract", json.dumps({"text": TEXT}).encode())
+        release.set()
+        return rejected, await asyncio.gather(*busy)
+
+    (status, headers, _), served = asyncio.run(run())
+
+    assert status == 429 and headers[b"retry-after"] == b"1"
+    assert [s for s, _, _ in served] == [200, 200]
+    assert app.state.admission.pending == 0
+
+
+def test_error_mapping_and_classify(monkeypatch):
+    async def throttled(text, local_first=False, output="dict"):
+        raise RetryableExtractionError("throttled", retry_after=2.5)
+
+    monkeypatch.setattr(api_service, "extract_listing", throttled)
+    monkeypatch.setattr(api_service, "classify_car_type", lambda image: CarTypePrediction("suv", 0.9, 3.0))
+    app = api_service.create_app()
+
+    status, headers, _ = asyncio.run(_call(app, "POST", "/extract", json.dumps({"text": TEXT}).encode()))
+    assert status == 503 and headers[b"retry-after"] == b"3"
+    assert asyncio.run(_call(app, "POST", "/extract", b"not json"))[0] == 422
+
+    status, _, body = asyncio.run(_call(app, "POST", "/classify", _jpeg()))
+    assert status == 200 and json.loads(body)["label"] == "suv"
+
+
+def test_classify_rejects_bytes_that_are_not_an_image(monkeypatch):
+    registry = metrics.MetricsRegistry(enabled=True)
+    monkeypatch.setattr(metrics, "registry", registry)
+    app = api_service.create_app()
+    status, _, body = asyncio.run(_call(app, "POST", "/classify", b"garbage, not an image"))
+    assert status == 422 and "not a supported image" in json.loads(body)["detail"]
+
+    monkeypatch.setattr(api_service, "classify_car_type",
+                        lambda image: CarTypePrediction("To_be_determined", 0.0, error="image file is truncated"))
+    assert asyncio.run(_call(app, "POST", "/classify", _jpeg()))[0] == 422
+    assert registry.counter_value("api_requests_total", endpoint="classify", status="422") == 2
+
+
+def test_send_requires_api_key_and_ignores_recipient(monkeypatch):
+    sent_to = []
+
+    def fake_send(sender, password, recipient, listing, image, image_name):
+        sent_to.append(recipient)
+        return SendResult(True, 1)
+
+    monkeypatch.setattr(api_service, "send_email_with_json_and_image", fake_send)
+    monkeypatch.setattr(api_service.settings, "SENDER_EMAIL", "bot@example.com")
+    monkeypatch.setattr(api_service.settings, "RECIPIENT_EMAIL", "sales@example.com")
+    monkeypatch.setattr(api_service.settings, "API_KEY", "s3cret")
+    app = api_service.create_app()
+    body = json.dumps({"listing": {"car": {}}, "recipient": "victim@example.org"}).encode()
+
+    assert asyncio.run(_call(app, "POST", "/send", body))[0] == 401
+    assert asyncio.run(_call(app, "POST", "/send", body, [(b"x-api-key", b"wrong")]))[0] == 401
+    status, _, _ = asyncio.run(_call(app, "POST", "/send", body, [(b"x-api-key", b"s3cret")]))
+    assert status == 200 and sent_to == ["sales@example.com"]
+
+
+def test_oversized_bodies_are_refused_with_413(monkeypatch):
+    monkeypatch.setattr(api_service.settings, "API_MAX_BODY_MB", 0.001)  # ~1 KB
+    app = api_service.create_app()
+    big = b"x" * 4096
+
+    declared = [(b"content-length", str(len(big)).encode())]
+    assert asyncio.run(_call(app, "POST", "/classify", big, declared))[0] == 413
+    assert asyncio.run(_call(app, "POST", "/classify", big))[0] == 413  # no Content-Length: capped while reading
+    text = json.dumps({"text": "x" * 4096}).encode()
+    assert asyncio.run(_call(app, "POST", "/extract", text))[0] == 413
+
+
+def test_classify_maps_pillow_errors_to_4xx(monkeypatch):
+    app = api_service.create_app()
+    monkeypatch.setattr(Image, "MAX_IMAGE_PIXELS", 10)  # an 8x8 image is now a decompression bomb
+    assert asyncio.run(_call(app, "POST", "/classify", _jpeg()))[0] == 413
+
+    monkeypatch.undo()
+
+    def broken(image):
+        raise OSError("broken data stream when reading image file")
+
+    monkeypatch.setattr(api_service, "classify_car_type", broken)
+    status, _, body = asyncio.run(_call(app, "POST", "/classify", _jpeg()))
+    assert status == 422 and "could not be decoded" in json.loads(body)["detail"]
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import re
+import time
+from types import SimpleNamespace
+
+import text_extractor
+from text_extractor import (TokenBucket, extract_listings_batch, extract_listings_packed, iter_extract_listings,
+                            plan_packs)
+
+
+def _fake_extract(delays):
+    async def fake(text):
+        await asyncio.sleep(delays.get(text, 0))
+        if text == "bad":
+            raise ValueError("Failed to extract car information")
+        return {"car": {"brand": text}}
+    return fake
+
+
+def test_batch_keeps_input_order_and_reports_errors(monkeypatch):
+    monkeypatch.setattr(text_extractor, "extract_listing", _fake_extract({"a": 0.05, "b": 0.0}))
+
+    results = asyncio.run(extract_listings_batch(["a", "bad", "b"], max_concurrency=3))
+
+    assert [r.index for r in results] == [0, 1, 2]
+    assert results[0].result == {"car": {"brand": "a"}}
+    assert not results[1].ok and isinstance(results[1].error, ValueError)
+    assert results[2].result == {"car": {"brand": "b"}}
+
+
+def test_streaming_yields_in_completion_order(monkeypatch):
+    monkeypatch.setattr(text_extractor, "extract_listing", _fake_extract({"slow": 0.1, "fast": 0.0}))
+
+    async def collect():
+        return [item.index async for item in iter_extract_listings(["slow", "fast"], max_concurrency=2)]
+
+    assert asyncio.run(collect()) == [1, 0]
+
+
+def test_concurrency_is_bounded(monkeypatch):
+    in_flight = peak = 0
+
+    async def fake(text):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return {"car": {}}
+
+    monkeypatch.setattr(text_extractor, "extract_listing", fake)
+    asyncio.run(extract_listings_batch([str(i) for i in range(20)], max_concurrency=4))
+
+    assert peak == 4
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(rate=50, capacity=1)
+        start = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(run()) >= 0.09
+
+
+# ---- Packed extraction
+
+CAR = {"body_type": None, "color": None, "brand": None, "model": None, "manufactured_year": None,
+       "motor_size_cc": None, "tires": None, "windows": None, "notices": [], "price": None}
+
+
+class PackedCompletions:
+    """Answers packed requests with brand = the listing text; drops lines containing 'skip'."""
+
+    def __init__(self):
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        text = kwargs["messages"][1]["content"]
+        if kwargs["response_format"]["json_schema"]["name"] == "car_listing":
+            content = json.dumps({"car": {**CAR, "brand": text}})
+        else:
+            items = [{"id": int(i), "car": {**CAR, "brand": line}}
+                     for i, line in re.findall(r"^\[(\d+)\] (.*)$", text, re.M) if "skip" not in line]
+            content = json.dumps({"items": items})
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def test_plan_packs_respects_budget_and_item_limit():
+    assert plan_packs([10, 10, 10, 10, 10], token_budget=25, max_items=8) == [[0, 1], [2, 3], [4]]
+    assert plan_packs([1] * 5, token_budget=100, max_items=2) == [[0, 1], [2, 3], [4]]
+    assert plan_packs([50, 1], token_budget=10, max_items=8) == [[0], [1]]
+
+
+def test_packed_extraction_reruns_dropped_items(monkeypatch):
+    completions = PackedCompletions()
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(text_extractor, "cache", None)
+    texts = [f"listing number {i}" for i in range(5)] + ["please skip this one", "x"]
+
+    results = asyncio.run(extract_listings_packed(texts, token_budget=1000, max_items=4))
+
+    assert [r.result["car"]["brand"] for r in results[:5]] == texts[:5]
+    assert results[5].result["car"]["brand"] == "please skip this one"  # recovered by the single call
+    assert isinstance(results[6].error, ValueError)  # too short
+    # two packs (4 + 2 listings) and one individual retry
+    assert len(completions.requests) == 3
+    assert completions.requests[0]["response_format"]["json_schema"]["name"] == "car_listings"
+    assert completions.requests[2]["response_format"]["json_schema"]["name"] == "car_listing"
+
+
+def test_packed_extraction_fails_only_the_rejected_item(monkeypatch):
+    completions = PackedCompletions()
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(text_extractor, "cache", None)
+    texts = ["Toyota Corolla 2018 white", "A" * 120, "Hyundai Elantra 2019 silver"]
+
+    results = asyncio.run(extract_listings_packed(texts, token_budget=1000, max_items=4))
+
+    assert isinstance(results[1].error, ValueError) and results[1].result is None
+    assert [results[i].result["car"]["brand"] for i in (0, 2)] == [texts[0], texts[2]]
+    assert len(completions.requests) == 1 and "A" * 120 not in completions.requests[0]["messages"][1]["content"]
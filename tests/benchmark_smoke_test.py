@@ -0,0 +1,28 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import text_extractor  # noqa: E402
+from mock_azure_server import MockConfig  # noqa: E402
+from resilience import CircuitBreaker, ResilientCaller, RetryPolicy  # noqa: E402
+from run_benchmarks import run  # noqa: E402
+
+
+def test_benchmark_runs_offline_against_mock_server():
+    results = run([1, 4], requests=8, config=MockConfig(latency=0.01, seed=0), skip_micro=True)
+
+    assert [level["concurrency"] for level in results["extraction"]] == [1, 4]
+    assert all(level["ok"] == 8 and not level["errors"] for level in results["extraction"])
+    assert results["meta"]["mock"]["requests_served"] == 16
+
+
+def test_injected_errors_are_counted(monkeypatch):
+    # no retries and a breaker that never opens, so every injected error surfaces
+    monkeypatch.setattr(text_extractor, "llm_caller",
+                        ResilientCaller(RetryPolicy(max_attempts=1), breaker=CircuitBreaker(failure_threshold=10**6)))
+    results = run([4], requests=20, config=MockConfig(latency=0.0, error_rate=0.5, seed=1), skip_micro=True)
+
+    level = results["extraction"][0]
+    assert level["ok"] + sum(level["errors"].values()) == 20
+    assert 0 < level["ok"] < 20
@@ -0,0 +1,95 @@
+import io
+
+import pytest
+from PIL import Image
+
+import car_type_classifier
+from car_type_classifier import (CarTypeClassifier, CarTypePrediction, classify_car_type,
+                                 classify_car_types_batch, merge_body_type)
+
+
+def _tiny_model(path, num_labels=3):
+    """A 'model' scoring each label by the mean of one colour channel."""
+    onnx = pytest.importorskip("onnx")
+    from onnx import TensorProto, helper
+
+    graph = helper.make_graph(
+        [helper.make_node("ReduceMean", ["image"], ["scores"], axes=[2, 3], keepdims=0)],
+        "tiny",
+        [helper.make_tensor_value_info("image", TensorProto.FLOAT, ["N", 3, 32, 32])],
+        [helper.make_tensor_value_info("scores", TensorProto.FLOAT, ["N", num_labels])],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    onnx.save(model, str(path))
+    return str(path)
+
+
+def test_batch_prediction_with_onnx_model(tmp_path):
+    pytest.importorskip("onnxruntime")
+    classifier = CarTypeClassifier(_tiny_model(tmp_path / "m.onnx"), labels=["red", "green", "blue"],
+                                   intra_op_threads=1, max_batch_size=2)
+    images = [Image.new("RGB", (64, 48), color) for color in ((255, 0, 0), (0, 255, 0), (0, 0, 255))]
+
+    predictions = classifier.predict(images)
+
+    assert [p.label for p in predictions] == ["red", "green", "blue"]
+    assert all(0.5 < p.confidence <= 1.0 for p in predictions)
+
+
+def test_undecodable_image_does_not_fail_the_batch(tmp_path):
+    pytest.importorskip("onnxruntime")
+    classifier = CarTypeClassifier(_tiny_model(tmp_path / "m.onnx"), labels=["red", "green", "blue"],
+                                   intra_op_threads=1)
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 48), (0, 0, 255)).save(buffer, "JPEG")
+
+    valid, invalid = classifier.predict([buffer.getvalue(), b"garbage"])
+
+    assert valid.label == "blue" and valid.error is None
+    assert invalid.label == car_type_classifier.UNKNOWN_LABEL and invalid.confidence == 0.0 and invalid.error
+
+
+def test_without_model_nothing_is_overwritten(monkeypatch):
+    monkeypatch.setattr(car_type_classifier, "_classifier", None)
+    monkeypatch.setattr(car_type_classifier, "_classifier_error", "CAR_CLASSIFIER_MODEL is not set")
+
+    prediction = classify_car_type("car.jpg")
+    listing = merge_body_type({"car": {"body_type": "sedan"}}, prediction)
+
+    assert prediction == CarTypePrediction("To_be_determined", 0.0)
+    assert listing["car"]["body_type"] == "sedan"
+    assert len(classify_car_types_batch(["a", "b"])) == 2
+
+
+def test_merge_respects_confidence():
+    listing = {"car": {"body_type": "sedan"}}
+    merge_body_type(listing, CarTypePrediction("suv", 0.4), min_confidence=0.6)
+    assert listing["car"]["body_type"] == "sedan"
+    merge_body_type(listing, CarTypePrediction("suv", 0.9), min_confidence=0.6)
+    assert listing["car"]["body_type"] == "suv"
+
+
+def test_near_duplicate_images_reuse_the_prediction(monkeypatch):
+    from image_hash import ImageHashIndex
+
+    class CountingClassifier:
+        calls = 0
+
+        def predict(self, images):
+            self.calls += len(images)
+            return [CarTypePrediction("suv", 0.9, 5.0) for _ in images]
+
+    classifier = CountingClassifier()
+    monkeypatch.setattr(car_type_classifier, "_classifier", classifier)
+    car_type_classifier.set_image_index(ImageHashIndex(max_distance=6))
+    try:
+        photo = Image.linear_gradient("L").convert("RGB").resize((640, 480))
+        first = classify_car_type(photo)
+        again = classify_car_types_batch([photo.resize((320, 240)), photo.rotate(90)])
+    finally:
+        car_type_classifier.set_image_index(None)
+
+    assert first == CarTypePrediction("suv", 0.9, 5.0)
+    assert again[0] == CarTypePrediction("suv", 0.9, 0.0)  # reused, no inference
+    assert classifier.calls == 2  # the original and the rotated image
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# modules under src/ import each other by bare name (e.g. `from schema import CarListing`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
+
+# placeholder Azure settings so the client can be constructed without a .env file
+os.environ.setdefault("AZURE_OPENAI_API_KEY", "test")
+os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://example.openai.azure.com")
+os.environ.setdefault("AZURE_OPENAI_DEPLOYMENT", "test-deployment")
+os.environ.setdefault("AZURE_OPENAI_API_VERSION", "2024-08-01-preview")
@@ -0,0 +1,80 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import text_extractor
+from extraction_cache import ExtractionCache, make_cache_key
+
+LISTING = {"car": {"body_type": None, "color": "Blue", "brand": "Ford", "model": "Fusion",
+                   "manufactured_year": 2015, "motor_size_cc": 2000, "tires": None,
+                   "windows": None, "notices": [], "price": None}}
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.calls = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        message = SimpleNamespace(content=json.dumps(LISTING))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def test_key_depends_on_every_input():
+    base = ("text", "prompt", {"a": 1}, "gpt", 0.3)
+    key = make_cache_key(*base)
+    assert key == make_cache_key(*base)
+    for i, other in enumerate(("text2", "prompt2", {"a": 2}, "gpt2", 0.4)):
+        changed = list(base)
+        changed[i] = other
+        assert make_cache_key(*changed) != key
+
+
+def test_lru_eviction_and_ttl(monkeypatch):
+    cache = ExtractionCache(max_entries=2)
+    cache.set("a", {"v": 1})
+    cache.set("b", {"v": 2})
+    assert cache.get("a") == {"v": 1}
+    cache.set("c", {"v": 3})
+    assert cache.get("b") is None
+    assert cache.stats()["evictions"] == 1
+
+    clock = [1000.0]
+    monkeypatch.setattr("extraction_cache.time.time", lambda: clock[0])
+    cache = ExtractionCache(ttl_seconds=10)
+    cache.set("a", {"v": 1})
+    clock[0] += 11
+    assert cache.get("a") is None
+
+
+def test_hits_return_independent_copies():
+    cache = ExtractionCache()
+    cache.set("a", {"car": {"body_type": None}})
+    cache.get("a")["car"]["body_type"] = "sedan"
+    assert cache.get("a") == {"car": {"body_type": None}}
+    assert cache.stats()["hits"] == 2
+
+
+def test_sqlite_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ExtractionCache(sqlite_path=path)
+    cache.set("a", {"v": 1})
+    cache.close()
+
+    reopened = ExtractionCache(sqlite_path=path)
+    assert reopened.get("a") == {"v": 1}
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_extract_listing_uses_cache(monkeypatch):
+    completions = FakeCompletions()
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(text_extractor, "cache", ExtractionCache())
+
+    text = "Blue Ford Fusion produced in 2015 featuring a 2.0-liter engine."
+    first = asyncio.run(text_extractor.extract_listing(text))
+    second = asyncio.run(text_extractor.extract_listing("  " + text))
+
+    assert first == second == LISTING
+    assert completions.calls == 1
+    assert text_extractor.cache.stats()["hits"] == 1
@@ -0,0 +1,231 @@
+import email
+import os
+import smtplib
+
+from gmail_sender import MailSender, StreamingMessage, detect_image_subtype
+
+PNG_BYTES = b"\x89PNG\r\n\x1a\n" + os.urandom(300_000)
+
+
+class FakeSMTP:
+    """Records what a MailSender does with its connections."""
+    instances = []
+    always_fail = None
+    rcpt_replies = []  # replies to RCPT TO before the default 250, shared by every connection
+
+    def __init__(self, host, port, timeout=None):
+        self.host, self.port = host, port
+        self.sent = []
+        self.logins = 0
+        self.noops = 0
+        self.fail_next = []
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        self.logins += 1
+
+    def noop(self):
+        self.noops += 1
+        return (250, b"OK")
+
+    def _maybe_fail(self):
+        if self.fail_next:
+            raise self.fail_next.pop(0)
+        if FakeSMTP.always_fail:
+            raise FakeSMTP.always_fail
+
+    # the low-level calls used when streaming a message
+    def ehlo_or_helo_if_needed(self):
+        pass
+
+    def mail(self, sender):
+        self._maybe_fail()
+        self.stream = []
+        return (250, b"OK")
+
+    def rcpt(self, recipient):
+        return FakeSMTP.rcpt_replies.pop(0) if FakeSMTP.rcpt_replies else (250, b"OK")
+
+    def putcmd(self, cmd):
+        self.stream.append(("cmd", cmd))
+
+    def getreply(self):
+        if self.stream[-1] == ("cmd", "data"):
+            return (354, b"go ahead")
+        self.sent.append(b"".join(self.stream[1:-1]))  # the message is complete after "."
+        return (250, b"OK")
+
+    def send(self, data):
+        self.stream.append(data)
+
+    def rset(self):
+        pass
+
+    def quit(self):
+        self.closed = True
+
+    def close(self):
+        self.closed = True
+
+
+def _sender(**kwargs):
+    FakeSMTP.instances = []
+    FakeSMTP.always_fail = None
+    FakeSMTP.rcpt_replies = []
+    kwargs.setdefault("backoff", 0)
+    return MailSender("me@example.com", "secret", host="localhost", port=2525, smtp_factory=FakeSMTP, **kwargs)
+
+
+def _message():
+    return StreamingMessage("me@example.com", "you@example.com", {"car": {"brand": "Ford"}})
+
+
+def test_reuses_one_authenticated_connection():
+    sender = _sender(pool_size=1)
+    results = [sender.send(_message()) for _ in range(5)]
+
+    assert all(r.success and r.attempts == 1 for r in results)
+    assert len(FakeSMTP.instances) == 1
+    server = FakeSMTP.instances[0]
+    assert (server.host, server.port, server.logins, len(server.sent)) == ("localhost", 2525, 1, 5)
+
+
+def test_idle_connection_is_checked_with_noop():
+    sender = _sender(pool_size=1, noop_interval=0)
+    sender.send(_message())
+    sender.send(_message())
+    assert FakeSMTP.instances[0].noops == 1
+
+
+def test_reconnects_after_disconnect():
+    sender = _sender(pool_size=1)
+    sender.send(_message())
+    FakeSMTP.instances[0].fail_next.append(smtplib.SMTPServerDisconnected("gone"))
+
+    result = sender.send(_message())
+
+    assert result.success and result.attempts == 2
+    assert len(FakeSMTP.instances) == 2
+    assert FakeSMTP.instances[0].closed
+
+
+def test_permanent_error_is_not_retried():
+    sender = _sender(pool_size=1)
+    sender.send(_message())
+    FakeSMTP.instances[0].fail_next.append(smtplib.SMTPDataError(554, b"rejected"))
+
+    result = sender.send(_message())
+
+    assert not result.success and result.attempts == 1
+    assert "rejected" in result.error
+
+
+def test_temporary_rcpt_refusal_is_retried_and_permanent_one_is_not():
+    sender = _sender(pool_size=1)
+    msg = StreamingMessage("me@example.com", "you@example.com", {})
+    FakeSMTP.rcpt_replies = [(451, b"4.7.1 greylisted, try again later")]
+
+    result = sender.send(msg)
+
+    assert result.success and result.attempts == 2
+
+    FakeSMTP.rcpt_replies = [(550, b"5.1.1 no such user")]
+    result = sender.send(msg)
+    assert not result.success and result.attempts == 1
+
+
+def test_gives_up_after_max_retries():
+    sender = _sender(pool_size=1, max_retries=2)
+    FakeSMTP.always_fail = smtplib.SMTPDataError(451, b"try later")
+
+    result = sender.send(_message())
+
+    assert not result.success and result.attempts == 3
+    assert len(FakeSMTP.instances) == 3
+
+
+def test_background_queue_reports_each_message():
+    with _sender(pool_size=2) as sender:
+        futures = [sender.submit(_message()) for _ in range(10)]
+        results = [f.result(timeout=5) for f in futures]
+
+    assert all(r.success for r in results)
+    assert sum(len(s.sent) for s in FakeSMTP.instances) == 10
+    assert len(FakeSMTP.instances) <= 2
+    assert all(s.closed for s in FakeSMTP.instances)
+
+
+def test_detects_real_image_type():
+    assert detect_image_subtype(PNG_BYTES[:16], "photo.jpg") == "png"
+    assert detect_image_subtype(b"\xff\xd8\xff\xe0", "photo.png") == "jpeg"
+    assert detect_image_subtype(b"RIFF\x00\x00\x00\x00WEBPVP8 ", "x") == "webp"
+
+
+def test_streamed_message_round_trips(tmp_path):
+    image_path = tmp_path / "car.jpg"
+    image_path.write_bytes(PNG_BYTES)
+    msg = StreamingMessage("me@example.com", "you@example.com", {"car": {"brand": "Ford"}}, str(image_path))
+
+    chunks = list(msg)
+    assert max(len(c) for c in chunks) < 100_000  # the image is never held in one piece
+    assert not any(line.startswith(b".") for c in chunks for line in c.split(b"\r\n"))
+
+    parsed = email.message_from_bytes(b"".join(chunks))
+    parts = parsed.get_payload()
+    assert parsed["To"] == "you@example.com"
+    assert parts[1].get_filename() == "car_listing.json"
+    assert parts[1].get_payload(decode=True) == b'{\n    "car": {\n        "brand": "Ford"\n    }\n}'
+    assert parts[2].get_content_type() == "image/png"
+    assert parts[2].get_filename() == "car.jpg"
+    assert parts[2].get_payload(decode=True) == PNG_BYTES
+
+
+def test_body_text_is_encoded_safely():
+    body = "Prix négocié, contactez-nous.\n.Line starting with a dot\n."
+    chunks = list(StreamingMessage("me@example.com", "you@example.com", {}, body=body))
+
+    assert not any(line.startswith(b".") for c in chunks for line in c.split(b"\r\n"))
+    text = email.message_from_bytes(b"".join(chunks)).get_payload()[0]
+    assert text.get_content_charset() == "utf-8"
+    assert text.get_payload(decode=True).decode("utf-8") == body
+
+
+def test_streams_from_memoryview_over_smtp():
+    sender = _sender(pool_size=1)
+    msg = StreamingMessage("me@example.com", "you@example.com", {}, memoryview(PNG_BYTES), "car.png")
+
+    assert sender.send(msg).success
+
+    stream = FakeSMTP.instances[0].stream
+    assert stream[0] == ("cmd", "data") and stream[-1] == b".\r\n"
+    parsed = email.message_from_bytes(b"".join(stream[1:-1]))
+    assert parsed.get_payload()[2].get_payload(decode=True) == PNG_BYTES
+
+
+def test_identical_image_is_not_attached_twice(monkeypatch):
+    import io
+    import gmail_sender
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.linear_gradient("L").save(buf, "PNG")
+    sender = _sender(pool_size=1)
+    monkeypatch.setattr(gmail_sender, "get_sender", lambda email, password: sender)
+    monkeypatch.setattr(gmail_sender, "_sent_images", {})
+
+    def send():
+        assert gmail_sender.send_email_with_json_and_image("me@example.com", "secret", "you@example.com", {},
+                                                           buf.getvalue(), "car.png",
+                                                           skip_duplicate_image=True).success
+        return email.message_from_bytes(b"".join(FakeSMTP.instances[0].stream[1:-1]))
+
+    first = send()
+    second = send()
+
+    assert len(first.get_payload()) == 3
+    assert len(second.get_payload()) == 2
+    assert first["Message-ID"] in second.get_payload()[0].get_payload(decode=True).decode()
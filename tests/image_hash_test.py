@@ -0,0 +1,54 @@
+import io
+import random
+
+import numpy as np
+from PIL import Image
+
+from image_hash import BKTree, ImageHashIndex, dhash, hamming, phash
+
+
+def _photo(seed, size=(640, 480)):
+    """A smooth random 'photo' (large blobs of brightness, like a real scene)."""
+    rng = np.random.RandomState(seed)
+    small = (rng.rand(6, 8, 3) * 255).astype(np.uint8)
+    return Image.fromarray(small).resize(size, Image.BICUBIC)
+
+
+def _jpeg(img, quality=90):
+    buf = io.BytesIO()
+    img.save(buf, "JPEG", quality=quality)
+    return buf.getvalue()
+
+
+def test_resized_and_recompressed_copies_stay_close():
+    original = _photo(1)
+    copy = _jpeg(original.resize((320, 240), Image.LANCZOS), quality=60)
+
+    for hash_ in (phash, dhash):
+        assert hamming(hash_(_jpeg(original)), hash_(copy)) <= 6
+        assert hamming(hash_(_jpeg(original)), hash_(_jpeg(_photo(2)))) > 12
+
+
+def test_bk_tree_search_matches_brute_force():
+    rng = random.Random(0)
+    hashes = [rng.getrandbits(64) for _ in range(2000)]
+    tree = BKTree()
+    for i, hash_ in enumerate(hashes):
+        tree.add(hash_, i)
+    assert not tree.add(hashes[0], "again") and len(tree) == len(hashes)
+
+    query = hashes[7] ^ 0b1011  # 3 bits away from entry 7
+    found = [(m.distance, m.value) for m in tree.search(query, 20)]
+    expected = sorted((hamming(query, h), i) for i, h in enumerate(hashes) if hamming(query, h) <= 20)
+    assert sorted(found) == expected
+    assert found[0] == (3, 7)
+
+
+def test_index_reports_closest_within_distance():
+    index = ImageHashIndex(max_distance=4)
+    index.add(0b0000, "a")
+    index.add(0b1111_1111, "b")
+
+    assert index.query(0b0011).value == "a"
+    assert index.query(0b0011).distance == 2
+    assert index.query(0b1111_1111_0000_0000) is None
@@ -0,0 +1,101 @@
+import io
+import os
+import threading
+
+from PIL import Image
+
+import image_preprocessing
+from config import settings
+from image_preprocessing import preprocess_directory, preprocess_image, prune_cache
+
+
+def _jpeg(size=(4000, 3000), orientation=None) -> bytes:
+    img = Image.new("RGB", size, (200, 30, 30))
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    img.save(buf, "JPEG", quality=95, exif=exif)
+    return buf.getvalue()
+
+
+def test_large_photo_is_downscaled(tmp_path):
+    result = preprocess_image(_jpeg(), cache_dir=str(tmp_path))
+
+    assert result.original_size == (4000, 3000)
+    with Image.open(result.email_path) as email_img:
+        assert max(email_img.size) == 1600 and email_img.format == "JPEG"
+    with Image.open(result.thumbnail_path) as thumb:
+        assert thumb.size == (224, 224) and thumb.mode == "RGB"
+
+
+def test_exif_orientation_is_applied(tmp_path):
+    result = preprocess_image(_jpeg((2000, 1000), orientation=6), cache_dir=str(tmp_path))
+    with Image.open(result.email_path) as email_img:
+        assert email_img.size == (800, 1600)
+
+
+def test_small_jpeg_is_kept_and_results_are_cached(tmp_path):
+    data = _jpeg((640, 480))
+    first = preprocess_image(data, cache_dir=str(tmp_path))
+    with open(first.email_path, "rb") as f:
+        assert f.read() == data
+
+    mtime = os.path.getmtime(first.thumbnail_path)
+    second = preprocess_image(io.BytesIO(data), cache_dir=str(tmp_path))
+    assert second == first
+    assert os.path.getmtime(second.thumbnail_path) == mtime
+
+
+def test_directory_batch_reports_errors(tmp_path):
+    images = tmp_path / "in"
+    images.mkdir()
+    (images / "a.jpg").write_bytes(_jpeg((800, 600)))
+    (images / "b.png").write_bytes(b"not an image")
+    (images / "notes.txt").write_text("ignored")
+
+    results = dict(preprocess_directory(str(images), cache_dir=str(tmp_path / "cache")))
+
+    assert set(results) == {str(images / "a.jpg"), str(images / "b.png")}
+    assert results[str(images / "a.jpg")].original_size == (800, 600)
+    assert isinstance(results[str(images / "b.png")], Exception)
+
+
+def test_concurrent_writes_of_the_same_image_do_not_collide(tmp_path):
+    data = _jpeg((2000, 1500))
+    errors = []
+
+    def run():
+        try:
+            preprocess_image(data, cache_dir=str(tmp_path))
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".tmp")]
+
+
+def test_cache_is_pruned_least_recently_used_first(tmp_path, monkeypatch):
+    for i, stem in enumerate(["old", "used", "new"]):
+        for name in (f"{stem}_1600q85.jpg", f"{stem}.size"):
+            path = tmp_path / name
+            path.write_bytes(b"x" * 50)
+            os.utime(path, (1000 + i, 1000 + i))
+    os.utime(tmp_path / "used.size", (2000, 2000))  # read since it was written
+
+    assert prune_cache(str(tmp_path), 200) == 100
+    assert sorted(os.listdir(tmp_path)) == ["new.size", "new_1600q85.jpg", "used.size", "used_1600q85.jpg"]
+
+    # preprocess_image keeps its cache directory under IMAGE_CACHE_MAX_MB
+    cache = tmp_path / "cache"
+    monkeypatch.setattr(settings, "IMAGE_CACHE_MAX_MB", 0.05)
+    monkeypatch.setattr(image_preprocessing, "_written", {})
+    for color in range(6):
+        preprocess_image(_jpeg((200 + color, 150)), cache_dir=str(cache))
+    assert sum(entry.stat().st_size for entry in os.scandir(cache)) <= 0.05 * 1024 * 1024
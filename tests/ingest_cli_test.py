@@ -0,0 +1,123 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+import ingest_cli
+from ingest_cli import Checkpoint, LatencyStats, read_records, run
+from result_store import SQLiteResultStore
+
+
+def _fake_extract(fail_on=()):
+    async def fake(text, local_first=False):
+        await asyncio.sleep(0.01)
+        if text in fail_on:
+            raise ValueError("Failed to extract car information")
+        return {"car": {"brand": text}}
+    return fake
+
+
+def _feed(n):
+    return io.StringIO("".join(json.dumps({"id": f"L{i}", "text": f"car {i}"}) + "\n" for i in range(n)))
+
+
+def test_streams_feed_to_jsonl(monkeypatch):
+    monkeypatch.setattr(ingest_cli, "extract_listing", _fake_extract(fail_on={"car 3"}))
+    out = io.StringIO()
+
+    summary = asyncio.run(run(read_records(_feed(10), "jsonl"), out, Checkpoint(None), concurrency=4))
+
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert sorted(line["id"] for line in lines) == [f"L{i}" for i in range(10)]
+    assert next(line for line in lines if line["id"] == "L3")["ok"] is False
+    assert summary["processed"] == 10 and summary["errors"] == 1
+    assert summary["errors_by_type"] == {"ValueError": 1}
+    assert summary["p50_ms"] > 0 and summary["p95_ms"] >= summary["p50_ms"]
+
+
+def test_resumes_from_checkpoint(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest_cli, "extract_listing", _fake_extract())
+    path = str(tmp_path / "feed.ckpt")
+    checkpoint = Checkpoint(path)
+    for index in (0, 1, 2, 4):
+        checkpoint.mark_done(index)
+
+    out = io.StringIO()
+    summary = asyncio.run(run(read_records(_feed(6), "jsonl"), out, Checkpoint(path), concurrency=2))
+
+    assert sorted(json.loads(line)["index"] for line in out.getvalue().splitlines()) == [3, 5]
+    assert summary["skipped"] == 4
+    assert json.load(open(path)) == {"next_index": 6, "done_after": []}
+
+
+def test_csv_and_bad_lines():
+    rows = list(read_records(io.StringIO("id,text\n1,Blue Ford\n2,Red Kia\n"), "csv"))
+    assert rows == [(0, {"id": "1", "text": "Blue Ford"}), (1, {"id": "2", "text": "Red Kia"})]
+
+    records = list(read_records(io.StringIO('{"text": "a"}\nnot json\n\n{"text": "b"}\n'), "jsonl"))
+    assert [index for index, _ in records] == [0, 1, 2]
+    assert isinstance(records[1][1], json.JSONDecodeError)
+
+
+def test_latency_percentiles_are_close():
+    stats = LatencyStats()
+    for ms in range(1, 1001):
+        stats.add(ms / 1000)
+    assert abs(stats.percentile(50) - 0.5) < 0.02
+    assert abs(stats.percentile(95) - 0.95) < 0.03
+
+
+async def _extract_valid(text, local_first=False):
+    return {"car": {"body_type": None, "color": None, "brand": text, "model": None, "manufactured_year": 2020,
+                    "motor_size_cc": None, "tires": None, "windows": None, "notices": [], "price": None}}
+
+
+def test_listings_are_appended_to_the_store(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest_cli, "extract_listing", _extract_valid)
+    store = SQLiteResultStore(str(tmp_path / "listings.db"), batch_size=2)
+
+    asyncio.run(run(read_records(_feed(3), "jsonl"), io.StringIO(), Checkpoint(None), concurrency=2, store=store))
+
+    assert sorted((row["listing_id"], row["brand"]) for row in store.query(year_from=2020)) == [
+        ("L0", "car 0"), ("L1", "car 1"), ("L2", "car 2")]
+    store.close()
+
+
+def test_checkpoint_waits_for_the_store_to_flush(monkeypatch, tmp_path):
+    monkeypatch.setattr(ingest_cli, "extract_listing", _extract_valid)
+    path = str(tmp_path / "feed.ckpt")
+
+    class FailingStore(SQLiteResultStore):
+        def _write(self, rows):
+            raise OSError("disk full")
+
+    store = FailingStore(str(tmp_path / "listings.db"), batch_size=10)
+    with pytest.raises(OSError):
+        asyncio.run(run(read_records(_feed(3), "jsonl"), io.StringIO(), Checkpoint(path), concurrency=2, store=store))
+
+    # the buffered rows never reached the store, so a resume must process them again
+    assert all(not Checkpoint(path).is_done(index) for index in range(3))
+
+
+def test_commits_on_a_bounded_cadence_independent_of_the_store_batch(monkeypatch, tmp_path):
+    import sqlite3
+
+    monkeypatch.setattr(ingest_cli, "extract_listing", _extract_valid)
+    db = str(tmp_path / "listings.db")
+    store = SQLiteResultStore(db, batch_size=50_000)  # the store alone would buffer the whole feed
+    checkpoint = Checkpoint(str(tmp_path / "feed.ckpt"))
+    saves = []
+
+    def save():
+        stored = sqlite3.connect(db).execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+        saves.append((checkpoint.next_index, stored))
+        Checkpoint.save(checkpoint)
+
+    monkeypatch.setattr(checkpoint, "save", save)
+    asyncio.run(run(read_records(_feed(9), "jsonl"), io.StringIO(), checkpoint, concurrency=1, store=store,
+                    commit_every=3))
+    store.close()
+
+    assert saves == [(3, 3), (6, 6), (9, 9)]  # one checkpoint write per commit, each after its rows are stored
+    assert Checkpoint(str(tmp_path / "feed.ckpt")).next_index == 9
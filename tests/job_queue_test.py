@@ -0,0 +1,129 @@
+import asyncio
+import time
+
+import pytest
+
+import job_queue
+from job_queue import JobQueue, JobWorker
+from resilience import RetryableExtractionError
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = JobQueue(str(tmp_path / "jobs.db"), visibility_timeout=30, max_attempts=3, backoff=0)
+    yield q
+    q.close()
+
+
+def test_enqueue_is_idempotent_and_claims_are_exclusive(queue, tmp_path):
+    first = queue.enqueue({"text": "a"}, idempotency_key="feed:1")
+    assert queue.enqueue({"text": "changed"}, idempotency_key="feed:1") == first
+    queue.enqueue({"text": "b"}, idempotency_key="feed:2")
+
+    # a second process-like handle on the same file sees the same jobs
+    other = JobQueue(str(tmp_path / "jobs.db"))
+    claimed = queue.claim("w1", limit=1) + other.claim("w2", limit=5)
+    other.close()
+
+    assert sorted(job.payload["text"] for job in claimed) == ["a", "b"]
+    assert queue.claim("w3") == []
+
+
+def test_expired_lease_is_taken_over_and_stale_worker_cannot_complete(queue):
+    queue.visibility_timeout = 0.05
+    queue.enqueue({"text": "a"})
+    stale = queue.claim("w1")[0]
+    time.sleep(0.1)
+
+    fresh = queue.claim("w2")[0]
+
+    assert fresh.id == stale.id and fresh.attempts == 2
+    assert not queue.complete(stale, {"text": "a"})
+    assert queue.complete(fresh, {"text": "a", "listing": {}}, next_stage="email")
+    job = queue.get(fresh.id)
+    assert (job["stage"], job["state"], job["attempts"]) == ("email", "ready", 0)
+
+
+def test_retries_then_dead_letters_and_requeues(queue):
+    job_id = queue.enqueue({"text": "a"})
+    for attempt in range(1, 4):
+        job = queue.claim("w1")[0]
+        assert job.attempts == attempt
+        state = queue.fail(job, "boom")
+    assert state == "dead"
+    assert [d["id"] for d in queue.dead_letters()] == [job_id]
+    assert queue.stats()["throughput"]["extract"]["failures"] == 3
+
+    assert queue.requeue() == 1
+    assert queue.claim("w1")[0].attempts == 1
+
+
+def test_worker_runs_stages_and_backs_off_transient_errors(queue, monkeypatch):
+    calls = []
+
+    async def fake_extract(payload):
+        calls.append("extract")
+        if len(calls) == 1:
+            raise RetryableExtractionError("throttled", retry_after=0)
+        payload["listing"] = {"car": {"brand": "Ford"}}
+        return "email"
+
+    async def fake_email(payload, job):
+        calls.append(("email", job_queue.message_id_for(job)))
+        payload["emailed"] = True
+
+    monkeypatch.setattr(job_queue, "run_extract", fake_extract)
+    monkeypatch.setattr(job_queue, "run_email", fake_email)
+    job_id = queue.enqueue({"text": "Ford Fusion 2015", "email": True}, idempotency_key="k")
+
+    processed = asyncio.run(JobWorker(queue, concurrency=2, poll_interval=0.01).run(drain=True))
+
+    job = queue.get(job_id)
+    assert processed == 3
+    assert job["state"] == "done" and job["payload"]["emailed"]
+    assert calls[2] == ("email", job_queue.message_id_for(job_queue.Job(job_id, "k", "email", {}, 1, "x")))
+    assert queue.stats()["depth"] == {"email": {"done": 1}}
+
+
+def test_bad_input_is_dead_lettered_at_once(queue, monkeypatch):
+    async def short_text(payload):
+        raise ValueError("Text too short or contains no meaningful content after sanitization")
+
+    monkeypatch.setattr(job_queue, "run_extract", short_text)
+    job_id = queue.enqueue({"text": "x"})
+
+    asyncio.run(JobWorker(queue, concurrency=1).run(drain=True))
+
+    assert queue.get(job_id)["state"] == "dead"
+
+
+def test_long_stage_keeps_its_lease_and_a_lost_lease_cancels_it(queue, monkeypatch):
+    queue.visibility_timeout = 0.15
+    cancelled = []
+
+    async def slow_extract(payload):
+        try:
+            await asyncio.sleep(0.5)  # over three visibility timeouts
+        except asyncio.CancelledError:
+            cancelled.append(payload["text"])
+            raise
+        return None
+
+    monkeypatch.setattr(job_queue, "run_extract", slow_extract)
+    worker = JobWorker(queue, concurrency=1)
+
+    async def run_with_rival():
+        queue.enqueue({"text": "a"})
+        job = queue.claim("w1")[0]
+        processing = asyncio.ensure_future(worker.process(job))
+        await asyncio.sleep(0.3)
+        rival = queue.claim("w2")
+        return await processing, rival
+
+    state, rival = asyncio.run(run_with_rival())
+    assert state == "done" and rival == []
+
+    monkeypatch.setattr(queue, "extend", lambda job: False)
+    queue.enqueue({"text": "b"})
+    assert asyncio.run(worker.process(queue.claim("w1")[0])) == "lost"
+    assert cancelled == ["b"]
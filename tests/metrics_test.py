@@ -0,0 +1,77 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import metrics
+import text_extractor
+from extraction_cache import ExtractionCache
+from metrics import MetricsRegistry
+
+LISTING = {"car": {"body_type": None, "color": "Blue", "brand": "Ford", "model": "Fusion",
+                   "manufactured_year": 2015, "motor_size_cc": 2000, "tires": None,
+                   "windows": None, "notices": [], "price": None}}
+
+
+@pytest.fixture
+def enabled_metrics(monkeypatch):
+    registry = MetricsRegistry(enabled=True)
+    monkeypatch.setattr(metrics, "registry", registry)
+    return registry
+
+
+def test_disabled_registry_records_nothing(monkeypatch):
+    registry = MetricsRegistry(enabled=False)
+    monkeypatch.setattr(metrics, "registry", registry)
+    with metrics.span("sanitize"):
+        pass
+    metrics.inc("email_sent_total")
+    assert registry.export_prometheus() == "\n"
+
+
+def test_prometheus_export(enabled_metrics):
+    with metrics.span("sanitize"):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.span("llm_request"):
+            raise RuntimeError("boom")
+    metrics.inc("email_sent_total", result="success")
+    metrics.inc("email_sent_total", result="success")
+
+    text = enabled_metrics.export_prometheus()
+
+    assert "# TYPE car_extractor_email_sent_total counter" in text
+    assert 'car_extractor_email_sent_total{result="success"} 2' in text
+    assert 'car_extractor_stage_duration_seconds_count{outcome="ok",stage="sanitize"} 1' in text
+    assert 'car_extractor_stage_duration_seconds_bucket{outcome="error",stage="llm_request",le="+Inf"} 1' in text
+
+
+def test_hooks_receive_measurements(enabled_metrics):
+    seen = []
+    metrics.add_hook(lambda kind, name, value, labels: seen.append((kind, name, value, labels)))
+    metrics.inc("email_retries_total")
+    metrics.observe("classifier_batch_size", 4)
+    assert seen == [("counter", "email_retries_total", 1.0, {}),
+                    ("histogram", "classifier_batch_size", 4, {})]
+
+
+def test_extraction_records_stages_tokens_and_cache(enabled_metrics, monkeypatch):
+    async def create(**kwargs):
+        usage = SimpleNamespace(prompt_tokens=1000, completion_tokens=100)
+        message = SimpleNamespace(content=json.dumps(LISTING))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(text_extractor, "cache", ExtractionCache())
+    text = "Blue Ford Fusion produced in 2015 featuring a 2.0-liter engine."
+    asyncio.run(text_extractor.extract_listing(text))
+    asyncio.run(text_extractor.extract_listing(text))
+
+    for stage in ("sanitize", "llm_request", "decode"):
+        assert enabled_metrics.histogram("stage_duration_seconds", outcome="ok", stage=stage) is not None
+    assert enabled_metrics.counter_value("llm_tokens_total", kind="prompt") == 1000
+    assert enabled_metrics.counter_value("llm_tokens_total", kind="completion") == 100
+    assert enabled_metrics.counter_value("llm_cost_usd_total") == pytest.approx(0.00021)
+    assert enabled_metrics.counter_value("extraction_cache_requests_total", result="miss") == 1
+    assert enabled_metrics.counter_value("extraction_cache_requests_total", result="hit") == 1
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+
+import text_extractor
+from near_duplicate import NearDuplicateIndex, normalize, similarity
+
+ORIGINAL = "Toyota Corolla 2018, white, automatic, 75k km, price 220K L.E, new tires, excellent condition"
+REWORDED = "Toyota corolla 2018 white automatic 75,000 km price 220,000 LE new tires excellent condition!"
+REPRICED = "Toyota Corolla 2018, white, automatic, 75k km, price 250,000 L.E, new tires, excellent condition"
+OTHER = "Hyundai Elantra 2016 silver manual 120k km price 300K L.E"
+
+LISTING = {"car": {"body_type": "sedan", "color": "White", "brand": "Toyota", "model": "Corolla",
+                   "manufactured_year": 2018, "motor_size_cc": None, "tires": None, "windows": None,
+                   "notices": [], "price": {"amount": 220000, "currency": "L.E"}}}
+
+
+def test_normalize_spells_numbers_and_currency_one_way():
+    assert normalize(ORIGINAL) == normalize(REWORDED)
+    assert similarity(ORIGINAL, OTHER) < 0.3
+
+
+def test_index_matches_near_duplicates_only(tmp_path):
+    path = str(tmp_path / "nd.db")
+    index = NearDuplicateIndex(threshold=0.85, sqlite_path=path)
+    index.add(ORIGINAL, LISTING, key="L1")
+
+    match = index.query(REWORDED)
+    assert match.key == "L1" and match.similarity == 1.0 and match.value == LISTING
+    assert index.query(REPRICED).key == "L1"
+    assert index.query(OTHER) is None
+    assert index.query(REPRICED, threshold=0.99) is None
+    index.close()
+
+    reloaded = NearDuplicateIndex(threshold=0.85, sqlite_path=path)
+    assert len(reloaded) == 1 and reloaded.query(REWORDED).value == LISTING
+
+
+def test_lookup_stays_fast_as_the_index_grows():
+    rng = random.Random(0)
+    words = "toyota kia bmw fiat red blue 2015 2016 automatic manual km price sedan suv new used".split()
+    index = NearDuplicateIndex()
+    for i in range(5000):
+        index.add(" ".join(rng.choice(words) for _ in range(12)) + f" {i}", i)
+    index.add(ORIGINAL, "original")
+
+    start = time.perf_counter()
+    for _ in range(200):
+        match = index.query(REWORDED)
+    assert (time.perf_counter() - start) / 200 < 0.005
+    assert match.value == "original"
+
+
+def test_extraction_reuses_near_duplicate_listing(monkeypatch):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(LISTING)))])
+
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(text_extractor, "cache", None)
+    monkeypatch.setattr(text_extractor, "near_duplicates", NearDuplicateIndex(threshold=0.85))
+
+    assert asyncio.run(text_extractor.extract_listing(ORIGINAL)) == LISTING
+    assert asyncio.run(text_extractor.extract_listing(REWORDED)) == LISTING
+    repriced = asyncio.run(text_extractor.extract_listing(REPRICED))
+
+    assert len(calls) == 1
+    # the stored listing is reused, with the price read from the new description
+    assert repriced["car"]["price"] == {"amount": 250000, "currency": "L.E"}
+    assert repriced["car"]["model"] == "Corolla"
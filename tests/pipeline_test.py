@@ -0,0 +1,88 @@
+import asyncio
+import io
+import time
+
+from PIL import Image
+
+import pipeline
+from car_type_classifier import CarTypePrediction
+
+
+def _jpeg() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (800, 600), (10, 20, 30)).save(buf, "JPEG")
+    return buf.getvalue()
+
+
+def test_stages_run_concurrently(monkeypatch, tmp_path):
+    async def slow_extract(text, local_first=False):
+        await asyncio.sleep(0.3)
+        return {"car": {"brand": "Ford", "body_type": "sedan"}}
+
+    def slow_classify(path):
+        time.sleep(0.3)
+        return CarTypePrediction("suv", 0.95)
+
+    monkeypatch.setattr(pipeline, "extract_listing", slow_extract)
+    monkeypatch.setattr(pipeline, "classify_car_type", slow_classify)
+    monkeypatch.setattr("image_preprocessing.CACHE_DIR", str(tmp_path))
+
+    start = time.perf_counter()
+    result = asyncio.run(pipeline.process_listing(io.BytesIO(_jpeg()), "Blue Ford Fusion 2015"))
+    elapsed = time.perf_counter() - start
+
+    assert elapsed < 0.55
+    assert result.listing == {"car": {"brand": "Ford", "body_type": "suv"}}
+    assert result.image.email_path.startswith(str(tmp_path))
+    assert set(result.timings) == {"extract", "preprocess", "classify", "total"}
+    assert result.timings["extract"] >= 0.3 and result.timings["classify"] >= 0.3
+
+
+def test_background_loop_is_shared_across_threads(monkeypatch, tmp_path):
+    loops = set()
+
+    async def extract(text, local_first=False):
+        loops.add(asyncio.get_running_loop())
+        return {"car": {"brand": text, "body_type": None}}
+
+    monkeypatch.setattr(pipeline, "extract_listing", extract)
+    monkeypatch.setattr(pipeline, "classify_car_type", lambda path: CarTypePrediction("suv", 0.95))
+    runner = pipeline.BackgroundLoop()
+    try:
+        results = [runner.run(pipeline.process_listing(_jpeg(), f"car {i}", cache_dir=str(tmp_path))) for i in range(2)]
+    finally:
+        runner.stop()
+
+    assert [r.listing["car"]["brand"] for r in results] == ["car 0", "car 1"]
+    assert loops == {runner.loop}
+    assert results[0].image.email_path.startswith(str(tmp_path))
+    assert runner.loop.is_closed()
+
+
+def test_streamed_fields_arrive_while_the_image_is_classified(monkeypatch, tmp_path):
+    from text_extractor import ListingEvent
+
+    async def stream(text):
+        for name, value in (("brand", "Ford"), ("model", "Fusion")):
+            await asyncio.sleep(0.1)
+            yield ListingEvent(name, value)
+        await asyncio.sleep(0.1)
+        yield ListingEvent(None, {"car": {"brand": "Ford", "model": "Fusion", "body_type": None}}, done=True)
+
+    def slow_classify(path):
+        time.sleep(0.3)
+        return CarTypePrediction("sedan", 0.95)
+
+    monkeypatch.setattr(pipeline, "stream_listing", stream)
+    monkeypatch.setattr(pipeline, "classify_car_type", slow_classify)
+    fields = []
+    start = time.perf_counter()
+
+    result = asyncio.run(pipeline.process_listing(
+        _jpeg(), "Blue Ford Fusion 2015", cache_dir=str(tmp_path),
+        on_field=lambda name, value: fields.append((name, value, time.perf_counter() - start))))
+
+    assert time.perf_counter() - start < 0.55
+    assert [(name, value) for name, value, _ in fields] == [("brand", "Ford"), ("model", "Fusion")]
+    assert fields[0][2] < 0.25  # before the image was classified
+    assert result.listing["car"]["body_type"] == "sedan"
@@ -0,0 +1,121 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import text_extractor
+from config import settings
+from prompt_builder import (MAX_MAX_TOKENS, RequestSpec, _aliases, build_request, estimate_output_tokens,
+                            expand_aliases, model_schema, strict_schema_for, with_more_tokens)
+from schema import CarListing
+
+LISTING = {"car": {"body_type": "sedan", "color": "Blue", "brand": "Ford", "model": "Fusion",
+                   "manufactured_year": 2015, "motor_size_cc": 2000,
+                   "tires": {"type": "used", "manufactured_year": 2020},
+                   "windows": "electric", "notices": [{"type": "Body", "description": "scratch"}],
+                   "price": {"amount": 300000, "currency": "L.E"}}}
+
+
+def _objects(node):
+    if isinstance(node, dict):
+        if node.get("type") == "object" and "properties" in node:
+            yield node
+        for value in node.values():
+            yield from _objects(value)
+    elif isinstance(node, list):
+        for item in node:
+            yield from _objects(item)
+
+
+def _compact(data, schema):
+    """Inverse of expand_aliases, to fake a compact answer."""
+    if isinstance(data, dict):
+        props = schema["properties"]
+        aliases = _aliases(props)
+        return {aliases[k]: _compact(v, _sub(props[k])) for k, v in data.items()}
+    if isinstance(data, list):
+        return [_compact(item, _sub(schema["items"])) for item in data]
+    return data
+
+
+def _sub(node):
+    defs = model_schema(CarListing)["$defs"]
+    for option in node.get("anyOf", [node]):
+        if "$ref" in option:
+            return defs[option["$ref"].rsplit("/", 1)[-1]]
+        if option.get("type") == "array":
+            return option
+    return node
+
+
+def test_strict_schema_is_minimized_and_fully_required():
+    strict = strict_schema_for(model_schema(CarListing))
+    text = json.dumps(strict)
+    assert '"title"' not in text and '"default"' not in text
+    objects = list(_objects(strict))
+    assert len(objects) == 5  # CarListing, Car, Notice, PriceInfo, TireInfo
+    for obj in objects:
+        assert obj["additionalProperties"] is False
+        assert obj["required"] == list(obj["properties"])
+    # a field named like a schema keyword is kept
+    assert "description" in strict["$defs"]["Notice"]["properties"]
+
+
+def test_build_request_is_cached_and_sizes_max_tokens():
+    spec = build_request(CarListing)
+    assert build_request(CarListing) is spec
+    assert spec.response_format["json_schema"]["strict"] is True
+    assert 64 <= spec.max_tokens < 800
+    # a fully filled listing fits comfortably
+    assert len(json.dumps(LISTING, separators=(",", ":"))) / 4 < spec.max_tokens
+    assert estimate_output_tokens({"type": "array", "items": {"type": "integer"}}, array_items=3) == 2 + 3 * 5
+
+
+def test_aliases_are_short_and_unique():
+    aliases = _aliases(["body_type", "brand", "model", "manufactured_year", "motor_size_cc", "type", "tires"])
+    assert aliases["body_type"] == "bt"
+    assert len(set(aliases.values())) == len(aliases)
+
+
+def test_compact_output_round_trip(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_COMPACT_OUTPUT", True)
+    monkeypatch.setattr(text_extractor, "cache", None)
+    compact_answer = _compact(LISTING, model_schema(CarListing))
+    assert expand_aliases(compact_answer, model_schema(CarListing)) == LISTING
+    requests = []
+
+    class Completions:
+        async def create(self, **kwargs):
+            requests.append(kwargs)
+            message = SimpleNamespace(content=json.dumps(compact_answer))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=Completions())))
+    result = asyncio.run(text_extractor.extract_listing("Blue Ford Fusion 2015, 2000cc, 300000 L.E"))
+
+    assert result == LISTING
+    schema = requests[0]["response_format"]["json_schema"]["schema"]
+    assert set(schema["$defs"]["Car"]["properties"]) >= {"bt", "b", "m"}
+    assert requests[0]["max_tokens"] == build_request(CarListing, compact=True).max_tokens
+
+
+def test_answer_cut_off_at_max_tokens_is_retried_with_a_larger_budget(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_COMPACT_OUTPUT", False)
+    monkeypatch.setattr(text_extractor, "cache", None)
+    many = dict(LISTING["car"], notices=[{"type": "Body", "description": f"scratch {i}"} for i in range(12)])
+    full = json.dumps({"car": many})
+    requests = []
+
+    class Completions:
+        async def create(self, **kwargs):
+            requests.append(kwargs["max_tokens"])
+            cut_off = kwargs["max_tokens"] < 2 * build_request(CarListing).max_tokens
+            message = SimpleNamespace(content=full[:len(full) // 2] if cut_off else full)
+            return SimpleNamespace(choices=[SimpleNamespace(message=message,
+                                                            finish_reason="length" if cut_off else "stop")])
+
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=Completions())))
+    result = asyncio.run(text_extractor.extract_listing("Blue Ford Fusion 2015, 2000cc, 300000 L.E, many notices"))
+
+    assert len(result["car"]["notices"]) == 12
+    assert requests == [build_request(CarListing).max_tokens, 2 * build_request(CarListing).max_tokens]
+    assert with_more_tokens(RequestSpec({}, MAX_MAX_TOKENS, False)) is None
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import text_extractor
+from resilience import (AdaptiveConcurrencyLimiter, CircuitBreaker, CircuitOpenError, PermanentExtractionError,
+                        ResilientCaller, RetryableExtractionError, RetryPolicy, classify_error)
+
+
+class StatusError(Exception):
+    def __init__(self, status_code, headers=None):
+        super().__init__(f"status {status_code}")
+        self.status_code = status_code
+        self.response = SimpleNamespace(headers=headers or {})
+
+
+def _caller(**policy):
+    policy.setdefault("base_delay", 0.001)
+    return ResilientCaller(RetryPolicy(**policy), AdaptiveConcurrencyLimiter(initial=8),
+                           CircuitBreaker(failure_threshold=3, recovery_timeout=60))
+
+
+def _flaky(errors, result="ok"):
+    calls = []
+
+    async def fn(timeout):
+        calls.append(timeout)
+        if errors:
+            raise errors.pop(0)
+        return result
+    return fn, calls
+
+
+def test_classification():
+    assert classify_error(StatusError(429, {"retry-after": "2"})) == (True, 2.0)
+    assert classify_error(StatusError(503)) == (True, None)
+    assert classify_error(StatusError(400)) == (False, None)
+    assert classify_error(asyncio.TimeoutError()) == (True, None)
+    assert classify_error(StatusError(429, {"retry-after-ms": "250"}))[1] == 0.25
+
+
+def test_retries_transient_errors_then_succeeds():
+    fn, calls = _flaky([StatusError(500), StatusError(502)])
+    assert asyncio.run(_caller().call(fn)) == "ok"
+    assert len(calls) == 3
+
+
+def test_permanent_error_is_not_retried():
+    fn, calls = _flaky([StatusError(400)])
+    with pytest.raises(PermanentExtractionError):
+        asyncio.run(_caller().call(fn))
+    assert len(calls) == 1
+
+
+def test_honours_retry_after_and_shrinks_limit():
+    caller = _caller()
+    fn, _ = _flaky([StatusError(429, {"retry-after": "0.2"})])
+
+    async def run():
+        start = asyncio.get_running_loop().time()
+        await caller.call(fn)
+        return asyncio.get_running_loop().time() - start
+
+    assert asyncio.run(run()) >= 0.2
+    assert caller.limiter.limit < 8
+
+
+def test_attempts_time_out_within_deadline():
+    async def hang(timeout):
+        await asyncio.sleep(10)
+
+    with pytest.raises(RetryableExtractionError):
+        asyncio.run(_caller(attempt_timeout=0.05, deadline=0.2, max_attempts=10).call(hang))
+
+
+def test_attempts_cut_short_by_the_deadline_are_not_breaker_failures():
+    async def hang(timeout):
+        await asyncio.sleep(10)
+
+    caller = _caller(attempt_timeout=5, deadline=0.05, max_attempts=10)
+    for _ in range(3):
+        with pytest.raises(RetryableExtractionError, match="Deadline"):
+            asyncio.run(caller.call(hang))
+    assert caller.breaker.state == CircuitBreaker.CLOSED and caller.breaker.failures == 0
+
+    class SlowLimiter(AdaptiveConcurrencyLimiter):
+        async def acquire(self, timeout=None):
+            await asyncio.sleep(0.06)  # hands out the slot just after the deadline
+            await super().acquire()
+
+    caller = ResilientCaller(RetryPolicy(deadline=0.05), SlowLimiter(initial=1), CircuitBreaker(failure_threshold=1))
+    fn, calls = _flaky([])
+    with pytest.raises(RetryableExtractionError, match="could start"):
+        asyncio.run(caller.call(fn))
+    assert calls == [] and caller.limiter.in_flight == 0 and caller.breaker.failures == 0
+
+
+def test_circuit_opens_and_fails_fast():
+    caller = _caller(max_attempts=1)
+    for _ in range(3):
+        fn, _ = _flaky([StatusError(503)])
+        with pytest.raises(RetryableExtractionError):
+            asyncio.run(caller.call(fn))
+
+    fn, calls = _flaky([])
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(caller.call(fn))
+    assert calls == []
+
+    caller.breaker.opened_at -= 61
+    assert asyncio.run(caller.call(fn)) == "ok"
+    assert caller.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_limiter_bounds_concurrency():
+    limiter = AdaptiveConcurrencyLimiter(initial=3)
+    peak = 0
+
+    async def work():
+        nonlocal peak
+        async with limiter:
+            peak = max(peak, limiter.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(*(work() for _ in range(20)))
+
+    asyncio.run(run())
+    assert peak == 3
+
+
+def test_waiting_for_a_slot_counts_against_the_deadline():
+    caller = ResilientCaller(RetryPolicy(deadline=0.2), AdaptiveConcurrencyLimiter(initial=1))
+
+    async def hang(timeout):
+        await asyncio.sleep(1)
+        return "late"
+
+    async def run():
+        await caller.limiter.acquire()  # the only slot is taken
+        started = time.monotonic()
+        with pytest.raises(RetryableExtractionError, match="slot"):
+            await caller.call(hang)
+        await caller.limiter.release()
+        return time.monotonic() - started
+
+    assert asyncio.run(run()) < 0.5
+    assert caller.limiter.in_flight == 0
+    assert caller.breaker.state == CircuitBreaker.CLOSED and caller.breaker.failures == 0
+
+
+def test_limiter_slots_are_counted_per_event_loop():
+    limiter = AdaptiveConcurrencyLimiter(initial=2)
+    held, done = threading.Event(), threading.Event()
+
+    async def hold():
+        async with limiter:
+            held.set()
+            await asyncio.to_thread(done.wait)
+
+    async def work():
+        async with limiter:
+            return limiter.in_flight
+
+    other_loop = threading.Thread(target=asyncio.run, args=(hold(),))
+    other_loop.start()
+    try:
+        assert held.wait(5)
+        assert asyncio.run(work()) == 2  # its own slot plus the one the other loop holds
+    finally:
+        done.set()
+        other_loop.join(5)
+    assert limiter.in_flight == 0  # each slot released once, in its own loop
+
+
+def test_extract_listing_falls_back_to_rules_when_endpoint_is_down(monkeypatch):
+    async def create(**kwargs):
+        raise StatusError(503)
+
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(text_extractor, "llm_caller", _caller(max_attempts=2))
+    monkeypatch.setattr(text_extractor, "cache", None)
+    text = "White Daewoo Juliet manufactured at 2001 with a motor size of 1500 cc. Estimated price is 220K L.E."
+
+    with pytest.raises(RetryableExtractionError) as error:
+        asyncio.run(text_extractor.extract_listing(text))
+    assert isinstance(error.value, ValueError)
+    assert str(error.value).startswith("Failed to extract car information")
+
+    monkeypatch.setattr(text_extractor.settings, "LLM_FALLBACK_LOCAL", True)
+    result = asyncio.run(text_extractor.extract_listing(text))
+    assert result["car"]["brand"] == "Daewoo" and result["car"]["motor_size_cc"] == 1500
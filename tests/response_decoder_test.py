@@ -0,0 +1,91 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+from pydantic import ValidationError
+
+import response_decoder
+import text_extractor
+from extraction_cache import ExtractionCache
+from gmail_sender import StreamingMessage
+from response_decoder import decode_model, dumps, loads, repair_json
+from schema import CarListing
+
+LISTING = {"car": {"body_type": None, "color": "Blue", "brand": "Ford", "model": "Fusion",
+                   "manufactured_year": 2015, "motor_size_cc": 2000, "tires": None,
+                   "windows": None, "notices": [], "price": None}}
+
+
+def test_decode_fast_path_and_repair():
+    assert decode_model(json.dumps(LISTING).encode(), CarListing).model_dump() == LISTING
+    messy = "Here you go:\n```json\n" + json.dumps(LISTING, indent=2).replace("}\n", "},\n", 1) + "\n```"
+    assert decode_model(messy, CarListing).model_dump() == LISTING
+
+
+def test_decode_errors():
+    with pytest.raises(ValidationError):
+        decode_model(json.dumps({"car": {"brand": "Ford"}}), CarListing)
+    with pytest.raises(json.JSONDecodeError):
+        decode_model("no json here", CarListing)
+
+
+@pytest.mark.parametrize("use_orjson", [True, False])
+def test_dumps_and_loads_with_and_without_orjson(monkeypatch, use_orjson):
+    if not use_orjson:
+        monkeypatch.setattr(response_decoder, "orjson", None)
+    elif response_decoder.orjson is None:
+        pytest.skip("orjson not installed")
+    data = {"car": {"brand": "Citroën", "notices": []}}
+    assert loads(dumps(data)) == data
+    assert dumps(data, indent=True).startswith(b"{\n  ")
+    assert repair_json('{"a": [1, 2,],}') == {"a": [1, 2]}
+
+
+def test_extract_listing_output_formats(monkeypatch):
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(LISTING)))])
+
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    monkeypatch.setattr(text_extractor, "cache", ExtractionCache())
+    text = "Blue Ford Fusion produced in 2015 featuring a 2.0-liter engine."
+
+    raw = asyncio.run(text_extractor.extract_listing(text, output="json"))
+    assert json.loads(raw) == LISTING
+    model = asyncio.run(text_extractor.extract_listing(text, output="model"))  # served from the cache
+    assert isinstance(model, CarListing) and model.car.brand == "Ford"
+    assert asyncio.run(text_extractor.extract_listing(text, output="json")) == raw
+    assert asyncio.run(text_extractor.extract_listing(text)) == LISTING
+    assert len(calls) == 1
+    with pytest.raises(ValueError):
+        asyncio.run(text_extractor.extract_listing(text, output="xml"))
+
+
+def test_email_attaches_preserialized_json_unchanged():
+    body = dumps(LISTING, indent=True)
+    message = StreamingMessage("a@example.com", "b@example.com", body)
+    assert message.json_bytes is body
+    # a string body used to be JSON-encoded a second time
+    assert StreamingMessage("a@example.com", "b@example.com", body.decode()).json_bytes == body
+
+
+def test_incremental_parser_reports_values_as_they_complete():
+    from response_decoder import IncrementalJSONParser
+
+    answer = "```json\n" + json.dumps({"car": {"brand": 'Ford "GT"', "model": "Fusion", "manufactured_year": 2015,
+                                               "notices": [{"type": "a", "description": "b, c"}]}}) + "\n```"
+    parser = IncrementalJSONParser()
+    events = []
+    for i, char in enumerate(answer):
+        events.extend((i, path, value) for path, value in parser.feed(char))
+
+    by_path = {path: (i, value) for i, path, value in events}
+    assert by_path[("car", "brand")][1] == 'Ford "GT"'
+    assert by_path[("car", "brand")][0] < answer.index('"model"')
+    assert by_path[("car", "manufactured_year")][1] == 2015
+    assert by_path[("car", "notices")][1] == [{"type": "a", "description": "b, c"}]
+    assert by_path[()][1]["car"]["model"] == "Fusion"
+    assert parser.done
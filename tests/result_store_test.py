@@ -0,0 +1,64 @@
+import os
+
+import pytest
+
+from result_store import ParquetResultStore, SQLiteResultStore, flatten, open_store, unflatten
+
+
+def _listing(brand, year, price, notices=()):
+    return {"car": {"body_type": "sedan", "color": "White", "brand": brand, "model": "Corolla",
+                    "manufactured_year": year, "motor_size_cc": 1600,
+                    "tires": {"type": "used", "manufactured_year": 2021}, "windows": None,
+                    "notices": [{"type": "Body", "description": d} for d in notices],
+                    "price": {"amount": price, "currency": "L.E"} if price else None}}
+
+
+def test_flatten_round_trip():
+    listing = _listing("Toyota", 2018, 650000, ["scratch on the rear bumper"])
+    row = flatten(listing, "a1", extracted_at=1.0)
+    assert row["price_amount"] == 650000 and row["notices"] == [{"type": "Body", "description": "scratch on the rear bumper"}]
+    assert unflatten(row) == listing
+    with pytest.raises(ValueError):
+        flatten({"car": {"brand": "Toyota"}})
+
+
+def test_sqlite_store_batches_and_queries(tmp_path):
+    path = str(tmp_path / "listings.db")
+    with SQLiteResultStore(path, batch_size=2) as store:
+        store.append(_listing("Toyota", 2018, 650000, ["dent"]), listing_id="1")
+        store.append(_listing("toyota", 2012, 300000))
+        store.append(_listing("Kia", 2020, None))  # buffered until the query flushes it
+
+        assert [r["listing_id"] for r in store.query(brand="TOYOTA", year_from=2015)] == ["1"]
+        assert {r["brand"] for r in store.query(price_max=400000)} == {"toyota"}
+        assert store.count() == 3
+        plan = store._db.execute("EXPLAIN QUERY PLAN SELECT * FROM listings WHERE brand = ? COLLATE NOCASE",
+                                 ("kia",)).fetchall()
+        assert "listings_brand" in str([tuple(r) for r in plan])
+
+    reopened = SQLiteResultStore(path)
+    batches = list(reopened.read_batches(batch_size=2))
+    assert [len(b) for b in batches] == [2, 1]
+    assert unflatten(batches[0][0]) == _listing("Toyota", 2018, 650000, ["dent"])
+    reopened.close()
+
+
+def test_parquet_store_appends_part_files(tmp_path):
+    pc = pytest.importorskip("pyarrow.compute")
+    directory = str(tmp_path / "listings")
+    with open_store(directory, batch_size=2) as store:
+        assert isinstance(store, ParquetResultStore)
+        store.extend([_listing("Toyota", 2018, 650000, ["dent", "scratch"]), _listing("Kia", 2012, 300000),
+                      _listing("Fiat", 2020, None)])
+    # a second writer continues the part numbering instead of overwriting
+    with ParquetResultStore(directory) as store:
+        store.append(_listing("BMW", 2022, 2000000))
+        table = store.read(["brand", "notices"], pc.field("manufactured_year") >= 2018)
+        rows = [row for batch in store.read_batches() for row in batch]
+
+    assert sorted(os.listdir(directory)) == [
+        "part-000000.parquet", "part-000001.parquet", "part-000002.parquet"]
+    assert sorted(table.column("brand").to_pylist()) == ["BMW", "Fiat", "Toyota"]
+    toyota = next(row for row in rows if row["brand"] == "Toyota")
+    assert unflatten(toyota)["car"]["notices"] == [{"type": "Body", "description": "dent"},
+                                                   {"type": "Body", "description": "scratch"}]
@@ -0,0 +1,93 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import text_extractor
+from rule_extractor import pre_extract
+
+FORD = "Blue Ford Fusion produced in 2015 featuring a 2.0-liter engine. The vehicle has low mileage with only 40,000 miles on the odometer. Equipped with brand-new all-season tires manufactured in 2022. The car's windows are tinted for added privacy. Notably, the rear bumper has been replaced after a minor collision. Priced at 1 million L.E."
+DAEWOO = "White Daewoo Juliet manufactured at 2001 with a motor size of 1500 cc and the four tires are used they are from 2020. The windows are electrical. There is a small notice the wind shield has been changed due to a small accident. Estimated price is 220K L.E."
+
+
+class RecordingCompletions:
+    def __init__(self, car):
+        self.car = car
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        message = SimpleNamespace(content=json.dumps({"car": self.car}))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+def _use_client(monkeypatch, completions):
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(text_extractor, "cache", None)
+
+
+def test_examples_are_resolved_locally():
+    ford = pre_extract(FORD)
+    assert ford.fields == {"brand": "Ford", "model": "Fusion", "manufactured_year": 2015, "motor_size_cc": 2000,
+                           "price": {"amount": 1000000, "currency": "L.E"}, "color": "Blue"}
+    assert ford.missing() == []
+
+    daewoo = pre_extract(DAEWOO)
+    assert daewoo.fields["manufactured_year"] == 2001  # not the tires' 2020
+    assert daewoo.fields["motor_size_cc"] == 1500
+    assert daewoo.fields["price"] == {"amount": 220000, "currency": "L.E"}
+
+
+def test_ambiguous_values_get_low_confidence():
+    result = pre_extract("Toyota or Nissan, red or blue, 2010 2012")
+    assert result.confidence["brand"] < 0.7
+    assert result.confidence["color"] < 0.7
+    assert result.confidence["manufactured_year"] < 0.7
+    assert set(result.missing()) == {"brand", "model", "manufactured_year", "price"}
+
+
+def test_makes_that_are_dictionary_words_need_a_name_or_model():
+    seat = pre_extract("Used car with a torn driver seat, 2016, asking 300K LE")
+    assert "brand" not in seat.fields
+
+    mini = pre_extract("Mini scratches on a 2019 Hyundai Elantra")
+    assert mini.fields["brand"] == "Hyundai" and mini.confidence["brand"] == 0.95
+    assert mini.fields["model"] == "Elantra"
+
+    assert pre_extract("SEAT Ibiza 2017, red").resolved()["brand"] == "Seat"
+    assert pre_extract("mini cooper 2015").resolved()["model"] == "Cooper"
+    assert "brand" not in pre_extract("Seat covers are new, 2018 model").resolved()
+
+
+def test_local_first_skips_llm_when_required_fields_resolved(monkeypatch):
+    completions = RecordingCompletions({})
+    _use_client(monkeypatch, completions)
+
+    result = asyncio.run(text_extractor.extract_listing(DAEWOO, local_first=True))
+
+    assert completions.requests == []
+    assert result["car"]["brand"] == "Daewoo"
+    assert result["car"]["tires"] is None
+
+
+def test_local_first_only_asks_for_missing_fields(monkeypatch):
+    completions = RecordingCompletions({"body_type": "sedan", "model": "Swift", "tires": None,
+                                        "windows": None, "notices": [], "price": None})
+    _use_client(monkeypatch, completions)
+
+    result = asyncio.run(text_extractor.extract_listing("Red Suzuki swift 2019 model, 1200 cc", local_first=True))
+
+    schema = completions.requests[0]["response_format"]["json_schema"]["schema"]
+    car_schema = schema["$defs"]["Car"]["properties"]
+    assert set(car_schema) == {"body_type", "model", "tires", "windows", "notices", "price"}
+    assert result["car"] == {"body_type": "sedan", "color": "Red", "brand": "Suzuki", "model": "Swift",
+                             "manufactured_year": 2019, "motor_size_cc": 1200, "tires": None,
+                             "windows": None, "notices": [], "price": None}
+
+
+def test_small_or_unanchored_amounts_are_not_taken_as_the_price():
+    result = pre_extract("Kia Rio 2015, sold for 5 le less than the dealer asks, price 400k le")
+    assert result.fields["price"] == {"amount": 400000, "currency": "L.E"} and result.confidence["price"] == 0.9
+
+    assert "price" in pre_extract("Toyota Yaris 2012 with 3 le of damages to the bumper").missing()
+    assert "price" in pre_extract("Hyundai Accent 2019 for rent, 20 USD per day").missing()
+    assert "price" not in pre_extract("Hyundai Accent 2019, 20 USD per day or buy it at 9000 USD").missing()
@@ -0,0 +1,124 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import text_extractor
+from extraction_cache import ExtractionCache
+from text_extractor import stream_listing
+
+LISTING = {"car": {"body_type": None, "color": "White", "brand": "Toyota", "model": "Corolla",
+                   "manufactured_year": 2018, "motor_size_cc": 1600, "tires": None,
+                   "windows": None, "notices": [], "price": {"amount": 650000, "currency": "EGP"}}}
+TEXT = "2018 Toyota Corolla, white, 1600cc, 650,000 EGP"
+
+
+class FakeStream:
+    """Mimics the SDK's AsyncStream: chunks with choices[0].delta.content, then a usage-only chunk."""
+
+    def __init__(self, deltas, on_chunk=None, finish_reason="stop"):
+        self.deltas = deltas
+        self.on_chunk = on_chunk
+        self.finish_reason = finish_reason
+        self.closed = False
+
+    async def __aiter__(self):
+        for i, delta in enumerate(self.deltas):
+            if self.on_chunk:
+                self.on_chunk(delta)
+            await asyncio.sleep(0)
+            finish_reason = self.finish_reason if i == len(self.deltas) - 1 else None
+            choice = SimpleNamespace(delta=SimpleNamespace(content=delta), finish_reason=finish_reason)
+            yield SimpleNamespace(choices=[choice], usage=None)
+        yield SimpleNamespace(choices=[], usage=SimpleNamespace(prompt_tokens=50, completion_tokens=40))
+
+    async def close(self):
+        self.closed = True
+
+
+def _fake_client(monkeypatch, deltas, on_chunk=None):
+    calls = []
+
+    class Completions:
+        async def create(self, **kwargs):
+            stream = FakeStream(deltas, on_chunk)
+            calls.append((kwargs, stream))
+            return stream
+
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=Completions())))
+    monkeypatch.setattr(text_extractor, "cache", ExtractionCache())
+    monkeypatch.setattr(text_extractor.settings, "LLM_COMPACT_OUTPUT", False)
+    return calls
+
+
+def _chunks(text, size=7):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+async def _collect(**kwargs):
+    return [event async for event in stream_listing(TEXT, **kwargs)]
+
+
+def test_fields_arrive_before_the_answer_is_complete(monkeypatch):
+    received = []
+    calls = _fake_client(monkeypatch, _chunks(json.dumps(LISTING)), on_chunk=received.append)
+    seen_at = {}
+
+    async def run():
+        events = []
+        async for event in stream_listing(TEXT):
+            seen_at[event.name] = len(received)
+            events.append(event)
+        return events
+
+    events = asyncio.run(run())
+
+    request, stream = calls[0]
+    assert request["stream"] is True
+    assert [e.name for e in events[:3]] == ["body_type", "color", "brand"]
+    assert events[2].value == "Toyota"
+    assert seen_at["brand"] < len(_chunks(json.dumps(LISTING))) / 2
+    assert events[-1].done and events[-1].value == LISTING
+    assert stream.closed
+
+
+def test_cache_hit_replays_fields(monkeypatch):
+    calls = _fake_client(monkeypatch, _chunks(json.dumps(LISTING)))
+    asyncio.run(_collect())
+
+    events = asyncio.run(_collect(output="model"))
+
+    assert len(calls) == 1  # the second run was served from the cache
+    assert {e.name: e.value for e in events[:-1]} == LISTING["car"]
+    assert events[-1].value.car.brand == "Toyota"
+
+
+def test_invalid_answer_raises_after_streaming(monkeypatch):
+    _fake_client(monkeypatch, _chunks('{"car": {"brand": "Toyota", "model": 42}}'))
+
+    with pytest.raises(text_extractor.PermanentExtractionError):
+        asyncio.run(_collect())
+
+
+def test_answer_cut_off_at_max_tokens_is_streamed_again(monkeypatch):
+    full = json.dumps(LISTING)
+    calls = []
+
+    class Completions:
+        async def create(self, **kwargs):
+            calls.append(kwargs["max_tokens"])
+            if len(calls) == 1:
+                return FakeStream(_chunks(full[:80]), finish_reason="length")
+            return FakeStream(_chunks(full))
+
+    monkeypatch.setattr(text_extractor, "client", SimpleNamespace(chat=SimpleNamespace(completions=Completions())))
+    monkeypatch.setattr(text_extractor, "cache", None)
+    monkeypatch.setattr(text_extractor.settings, "LLM_COMPACT_OUTPUT", False)
+
+    events = asyncio.run(_collect())
+
+    assert calls[1] == 2 * calls[0]
+    names = [event.name for event in events if not event.done]
+    assert len(names) == len(set(names)) == len(LISTING["car"])  # fields of the first try are not repeated
+    assert events[-1].done and events[-1].value == LISTING
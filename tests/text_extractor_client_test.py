@@ -0,0 +1,44 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import pytest
+
+import text_extractor
+from config import Settings
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+def test_import_does_not_load_openai_or_need_credentials():
+    env = {k: v for k, v in os.environ.items() if not k.startswith("AZURE_")}
+    code = "import sys, text_extractor; print('openai' in sys.modules, text_extractor.client)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=SRC, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.split() == ["False", "None"]
+
+
+def test_client_is_built_once_per_live_loop(monkeypatch):
+    built = []
+    monkeypatch.setattr(text_extractor, "client", None)
+    monkeypatch.setattr(text_extractor, "_client_loop", None)
+    monkeypatch.setattr(text_extractor, "_build_client", lambda: built.append(object()) or built[-1])
+
+    async def twice():
+        return text_extractor.get_client(), text_extractor.get_client()
+
+    first, again = asyncio.run(twice())
+    assert first is again and len(built) == 1
+    # the loop of the first run is closed now, so its pooled connections are unusable
+    second, _ = asyncio.run(twice())
+    assert second is not first and len(built) == 2
+
+
+def test_settings_validation(monkeypatch):
+    settings = Settings()
+    monkeypatch.setattr(settings, "AZURE_OPENAI_API_KEY", None)
+    with pytest.raises(ValueError, match="AZURE_OPENAI_API_KEY"):
+        settings.validate()
+    monkeypatch.setattr(settings, "AZURE_OPENAI_API_KEY", "key")
+    settings.validate()
+    assert settings._validated
@@ -0,0 +1,60 @@
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import metrics
+import pipeline
+from car_type_classifier_test import _tiny_model
+from config import settings
+from worker_runtime import ImageWorkerPool
+
+
+def _png(color) -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (64, 48), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_workers_classify_shared_memory_images(monkeypatch, tmp_path):
+    pytest.importorskip("onnxruntime")
+    # workers are forked, so they see the patched settings and load this model once each
+    monkeypatch.setattr(settings, "CAR_CLASSIFIER_MODEL", _tiny_model(tmp_path / "m.onnx"))
+    monkeypatch.setattr(settings, "CAR_CLASSIFIER_LABELS", ["red", "green", "blue"])
+    path = tmp_path / "blue.png"
+    path.write_bytes(_png((0, 0, 255)))
+    registry = metrics.MetricsRegistry(enabled=True)
+    monkeypatch.setattr(metrics, "registry", registry)
+
+    async def run(workers):
+        return await asyncio.gather(
+            workers.process(_png((255, 0, 0)), str(tmp_path)),
+            workers.process(io.BytesIO(_png((0, 255, 0))), str(tmp_path)),
+            workers.process(str(path), str(tmp_path)),
+        )
+
+    with ImageWorkerPool(max_workers=2) as workers:
+        results = asyncio.run(run(workers))
+        assert workers.stats() == {"workers": 2, "in_flight": 0, "queued": 0}
+
+    assert [prediction.label for _, prediction, _ in results] == ["red", "green", "blue"]
+    assert all(os.path.exists(preprocessed.email_path) for preprocessed, _, _ in results)
+    assert set(results[0][2]) == {"preprocess", "classify", "queue"}
+    assert registry.counter_value("worker_jobs_total") == 3
+    assert registry.gauge_value("worker_jobs_in_flight") == 0
+
+
+def test_pipeline_runs_image_stages_in_workers(monkeypatch, tmp_path):
+    async def extract(text, local_first=False):
+        return {"car": {"brand": "Ford", "body_type": "sedan"}}
+
+    monkeypatch.setattr(pipeline, "extract_listing", extract)
+    monkeypatch.setattr(settings, "CAR_CLASSIFIER_MODEL", None)
+    with ImageWorkerPool(max_workers=1) as workers:
+        result = asyncio.run(pipeline.process_listing(_png((1, 2, 3)), "Ford", cache_dir=str(tmp_path), workers=workers))
+
+    assert result.listing == {"car": {"brand": "Ford", "body_type": "sedan"}}
+    assert result.prediction.label == "To_be_determined"
+    assert result.image.email_path.startswith(str(tmp_path))